@@ -0,0 +1,128 @@
+"""
+PDF export benchmark: render time and peak memory against transcript length.
+
+Each render runs in a fresh interpreter so peak RSS is measured per size.
+Transcripts are synthetic lecture-like text at ~150 words per minute, so
+``--minutes 180`` is roughly a three-hour lecture.
+
+Usage:
+    python bench_export_pdf.py [--minutes 10 60 180] [--segments] [--baseline]
+
+--segments renders with timed segments (timestamp headings every
+EXPORT_SECTION_SECONDS). --baseline also renders the transcript the old way,
+as a single Paragraph, for comparison; it gets slow quickly.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+WORDS = (
+    "the model gradient descent we can see that this function converges when learning rate "
+    "is small enough so let us look at an example of a loss surface and its minimum value "
+    "notice how each step moves us closer to the optimum which is exactly what we wanted"
+).split()
+WORDS_PER_MINUTE = 150
+SEGMENT_SECONDS = 5
+
+
+def make_segments(minutes: int, seed: int = 0) -> list:
+    """
+    Timed caption-like segments covering ``minutes`` of speech.
+    """
+    rng = random.Random(seed)
+    words_per_segment = WORDS_PER_MINUTE * SEGMENT_SECONDS // 60
+    segments = []
+    for index in range(minutes * 60 // SEGMENT_SECONDS):
+        words = [rng.choice(WORDS) for _ in range(words_per_segment)]
+        text = " ".join(words).capitalize()
+        if rng.random() < 0.5:
+            text += "."
+        segments.append({"start": index * SEGMENT_SECONDS, "text": text})
+    return segments
+
+
+def render_once(minutes: int, with_segments: bool, baseline: bool) -> dict:
+    """
+    Render one PDF in this process and report time, pages and peak RSS.
+    """
+    sys.path.insert(0, BACKEND_DIR)
+    os.chdir(tempfile.mkdtemp())
+    from services.export_service import ExportService
+
+    segments = make_segments(minutes)
+    transcript = " ".join(segment["text"] for segment in segments)
+    notes = {"formatted": "## Introduction\nSynthetic lecture.\n## Key Points\n- Gradient descent"}
+    service = ExportService()
+    pdf_path = os.path.join(os.getcwd(), "bench.pdf")
+
+    started = time.perf_counter()
+    if baseline:
+        _render_single_paragraph(service, pdf_path, transcript)
+    else:
+        service._render_pdf(pdf_path, transcript, notes, segments=segments if with_segments else None)
+    seconds = time.perf_counter() - started
+
+    with open(pdf_path, "rb") as f:
+        pages = f.read().count(b"/Type /Page\n")
+    return {
+        "minutes": minutes,
+        "chars": len(transcript),
+        "seconds": round(seconds, 2),
+        "pages": pages,
+        "pdf_kb": os.path.getsize(pdf_path) // 1024,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def _render_single_paragraph(service, pdf_path: str, transcript: str) -> None:
+    """The pre-chunking layout: the whole transcript as one Paragraph."""
+    from xml.sax.saxutils import escape
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate, Paragraph
+
+    doc = SimpleDocTemplate(pdf_path, pagesize=letter)
+    doc.build([Paragraph(escape(transcript), service._get_styles()["normal"])])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF export benchmark")
+    parser.add_argument("--minutes", type=int, nargs="+", default=[10, 60, 180])
+    parser.add_argument("--segments", action="store_true", help="Render timestamped sections")
+    parser.add_argument("--baseline", action="store_true", help="Also render as one big Paragraph")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--child-baseline", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        print(json.dumps(render_once(args.child, args.segments, args.child_baseline)))
+        return
+
+    modes = [("chunked", False)] + ([("single", True)] if args.baseline else [])
+    print(f"{'mode':<8} {'minutes':>7} {'chars':>10} {'pages':>6} {'seconds':>8} {'peak MB':>8} {'pdf KB':>7}")
+    for minutes in args.minutes:
+        for mode, baseline in modes:
+            command = [sys.executable, __file__, "--child", str(minutes)]
+            if args.segments:
+                command.append("--segments")
+            if baseline:
+                command.append("--child-baseline")
+            completed = subprocess.run(command, capture_output=True, text=True)
+            if completed.returncode != 0:
+                print(f"{mode:<8} {minutes:>7} failed: {completed.stderr.strip()[-300:]}")
+                continue
+            row = json.loads(completed.stdout.strip().splitlines()[-1])
+            print(f"{mode:<8} {row['minutes']:>7} {row['chars']:>10} {row['pages']:>6} "
+                  f"{row['seconds']:>8.2f} {row['peak_rss_mb']:>8.1f} {row['pdf_kb']:>7}")
+
+
+if __name__ == "__main__":
+    main()
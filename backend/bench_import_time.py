@@ -0,0 +1,84 @@
+"""
+Import-time benchmark for the API module.
+
+Runs ``python -X importtime -c "import main"`` in a fresh interpreter, prints
+the total import time and the slowest top-level packages, and checks that the
+heavy optional dependencies are not imported at startup (they should only
+load on first use of the engine that needs them).
+
+Usage:
+    python bench_import_time.py [--top 15] [--budget-ms 1500]
+
+Exits with status 1 if a heavy dependency is imported eagerly or the total
+exceeds --budget-ms, so it can be used as a regression check.
+"""
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Dependencies that must stay out of the startup import graph
+HEAVY_MODULES = ("google.generativeai", "reportlab", "whisper", "torch", "yt_dlp")
+
+
+def measure(module: str = "main") -> list:
+    """
+    Return (module, self_us, cumulative_us) rows from -X importtime.
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{completed.stderr[-2000:]}")
+
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API import-time benchmark")
+    parser.add_argument("--top", type=int, default=15, help="Number of packages to list")
+    parser.add_argument("--budget-ms", type=float, default=None, help="Fail if the total exceeds this")
+    args = parser.parse_args()
+
+    rows = measure()
+    total_ms = sum(self_us for _, self_us, _ in rows) / 1000
+
+    # Attribute self time to top-level packages
+    per_package = defaultdict(int)
+    for name, self_us, _ in rows:
+        per_package[name.split(".")[0]] += self_us
+
+    print(f"Total import time for main: {total_ms:.0f} ms ({len(rows)} modules)")
+    print(f"\n{'package':<32} {'ms':>8}")
+    for package, self_us in sorted(per_package.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{package:<32} {self_us / 1000:>8.1f}")
+
+    imported = {name for name, _, _ in rows}
+    eager = [heavy for heavy in HEAVY_MODULES if heavy in imported]
+
+    failed = False
+    if eager:
+        print(f"\nFAIL: heavy dependencies imported at startup: {', '.join(eager)}")
+        failed = True
+    if args.budget_ms is not None and total_ms > args.budget_ms:
+        print(f"\nFAIL: import time {total_ms:.0f} ms exceeds budget of {args.budget_ms:.0f} ms")
+        failed = True
+    if not failed:
+        print("\nOK: no heavy dependencies imported at startup.")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Generate-response payload benchmark: size and serialization time.
+
+Builds results shaped like /api/generate-notes/* responses for synthetic
+lectures and reports, with and without the transcript:
+
+- raw JSON size, and size after gzip (and brotli, if installed) as applied by
+  CompressionMiddleware
+- serialization time with the stdlib encoder Starlette's JSONResponse uses,
+  and with orjson (ORJSONResponse) if installed
+- compression time
+
+Usage:
+    python bench_payload.py [--minutes 10 60 180] [--repeat 20]
+"""
+import argparse
+import gzip
+import importlib.util
+import json
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BACKEND_DIR)
+
+from bench_export_pdf import make_segments  # noqa: E402
+
+ORJSON_AVAILABLE = importlib.util.find_spec("orjson") is not None
+BROTLI_AVAILABLE = importlib.util.find_spec("brotli") is not None
+
+
+def make_result(minutes: int) -> dict:
+    """
+    A generate-notes result for a synthetic lecture of the given length.
+    """
+    transcript = " ".join(segment["text"] for segment in make_segments(minutes))
+    sections = {
+        "introduction": transcript[:500],
+        "key_points": [f"Key point {i}: {transcript[i * 200:i * 200 + 120]}" for i in range(12)],
+        "examples": [f"Example {i}: {transcript[i * 300:i * 300 + 150]}" for i in range(6)],
+        "conclusion": transcript[-400:],
+    }
+    formatted = "\n".join(
+        ["## Introduction", sections["introduction"], "## Key Points"]
+        + [f"- {point}" for point in sections["key_points"]]
+        + ["## Examples"] + [f"- {example}" for example in sections["examples"]]
+        + ["## Conclusion", sections["conclusion"]]
+    )
+    return {
+        "success": True,
+        "note_id": "0" * 32,
+        "transcript": transcript,
+        "notes": {"formatted": formatted, "structured": sections},
+    }
+
+
+def stdlib_dumps(content) -> bytes:
+    """Same settings as starlette.responses.JSONResponse.render."""
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def timed(func, arg, repeat: int):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        value = func(arg)
+    return value, (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate-response payload benchmark")
+    parser.add_argument("--minutes", type=int, nargs="+", default=[10, 60, 180])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    serializers = [("json", stdlib_dumps)]
+    if ORJSON_AVAILABLE:
+        import orjson
+        serializers.append(("orjson", orjson.dumps))
+    compressors = [("gzip", lambda body: gzip.compress(body, compresslevel=6, mtime=0))]
+    if BROTLI_AVAILABLE:
+        import brotli
+        compressors.append(("br", lambda body: brotli.compress(body, quality=5)))
+
+    print(f"{'minutes':>7} {'transcript':>10} {'serializer':>10} {'raw KB':>8} {'ser ms':>7}"
+          + "".join(f" {name + ' KB':>8} {name + ' ms':>8}" for name, _ in compressors))
+    for minutes in args.minutes:
+        full = make_result(minutes)
+        without = {key: value for key, value in full.items() if key != "transcript"}
+        without["transcript_chars"] = len(full["transcript"])
+        for label, content in (("included", full), ("omitted", without)):
+            for name, dumps in serializers:
+                body, serialize_ms = timed(dumps, content, args.repeat)
+                row = f"{minutes:>7} {label:>10} {name:>10} {len(body) / 1024:>8.1f} {serialize_ms:>7.2f}"
+                for _, compress in compressors:
+                    compressed, compress_ms = timed(compress, body, args.repeat)
+                    row += f" {len(compressed) / 1024:>8.1f} {compress_ms:>8.2f}"
+                print(row)
+
+    if not ORJSON_AVAILABLE:
+        print("\norjson not installed; only the stdlib serializer was measured.")
+    if not BROTLI_AVAILABLE:
+        print("brotli not installed; only gzip was measured.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Caption segment memory benchmark: list of dicts against TranscriptSegments.
+
+Builds caption items the way youtube_transcript_api returns them (one dict
+with "text", "start" and "duration" per ~3 second caption) and measures, with
+tracemalloc, how much each representation keeps alive per hour of captions.
+Also times building the columnar form and looking up a time range.
+
+Usage:
+    python bench_transcript_memory.py [--hours 1 3] [--words 10]
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BACKEND_DIR)
+
+from bench_export_pdf import WORDS  # noqa: E402
+from services.transcript_segments import TranscriptSegments  # noqa: E402
+
+SEGMENT_SECONDS = 3.0
+
+
+def make_items(hours: float, words_per_segment: int, seed: int = 0) -> list:
+    """
+    Caption items covering ``hours`` of speech.
+    """
+    rng = random.Random(seed)
+    return [
+        {
+            "text": " ".join(rng.choice(WORDS) for _ in range(words_per_segment)),
+            "start": round(index * SEGMENT_SECONDS + rng.random() * 0.2, 3),
+            "duration": round(SEGMENT_SECONDS - rng.random() * 0.5, 3),
+        }
+        for index in range(int(hours * 3600 / SEGMENT_SECONDS))
+    ]
+
+
+def retained_bytes(build) -> tuple:
+    """
+    Bytes still allocated after ``build()`` returns (its result kept alive).
+    """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    value = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, after - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Caption segment memory benchmark")
+    parser.add_argument("--hours", type=float, nargs="+", default=[1, 3])
+    parser.add_argument("--words", type=int, default=10, help="Words per caption segment")
+    args = parser.parse_args()
+
+    print(f"{'hours':>5} {'segments':>8} {'dicts KB':>9} {'columnar KB':>11} {'ratio':>6} "
+          f"{'build ms':>8} {'slice us':>8}")
+    for hours in args.hours:
+        seed_items = make_items(hours, args.words)
+        # Rebuild from scratch inside the measurement so every string is counted
+        items, dict_bytes = retained_bytes(lambda: [
+            {"text": "".join(item["text"]), "start": item["start"], "duration": item["duration"]}
+            for item in seed_items
+        ])
+        segments, columnar_bytes = retained_bytes(lambda: TranscriptSegments.from_items(items))
+
+        started = time.perf_counter()
+        TranscriptSegments.from_items(items)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        middle = segments.duration / 2
+        started = time.perf_counter()
+        for _ in range(1000):
+            segments.slice(middle, middle + 60)
+        slice_us = (time.perf_counter() - started) * 1000
+
+        print(f"{hours:>5g} {len(items):>8} {dict_bytes / 1024:>9.1f} {columnar_bytes / 1024:>11.1f} "
+              f"{dict_bytes / columnar_bytes:>6.1f} {build_ms:>8.1f} {slice_us:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
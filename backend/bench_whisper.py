@@ -0,0 +1,70 @@
+"""
+Throughput benchmark for the local Whisper engine.
+
+For each model size, starts a warm WhisperEngine pool, then transcribes the
+sample file once per worker in parallel and reports model load time, wall
+time and the real-time factor (seconds of audio transcribed per second).
+
+Usage:
+    python bench_whisper.py [--audio test_audio_download.webm] [--sizes tiny base small]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.audio_service import AudioService
+from services.transcription_engines import WHISPER_AVAILABLE, WhisperEngine
+
+
+async def bench(model_size: str, audio_path: str, duration: float, workers: int) -> dict:
+    engine = WhisperEngine(model_size=model_size, workers=workers)
+    try:
+        start = time.perf_counter()
+        await engine.warm_up()
+        load_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        await asyncio.gather(*(engine.transcribe(audio_path) for _ in range(workers)))
+        wall_time = time.perf_counter() - start
+    finally:
+        engine.shutdown()
+
+    return {
+        "model": model_size,
+        "load": load_time,
+        "wall": wall_time,
+        "rtf": duration * workers / wall_time,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Local Whisper throughput benchmark")
+    parser.add_argument("--audio", default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                        "test_audio_download.webm"))
+    parser.add_argument("--sizes", nargs="+", default=["tiny", "base", "small"])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    if not WHISPER_AVAILABLE:
+        print("Whisper is not installed. Install openai-whisper to run this benchmark.")
+        return
+
+    audio = AudioService()
+    if not audio.available:
+        print("ffmpeg/ffprobe not found on PATH; Whisper needs ffmpeg to decode audio.")
+        return
+    duration = await audio.probe_duration(args.audio)
+
+    print(f"Audio: {args.audio} ({duration:.1f}s), workers: {args.workers}")
+    print(f"{'model':>8} {'load (s)':>9} {'wall (s)':>9} {'audio s / s':>12}")
+    for size in args.sizes:
+        result = await bench(size, args.audio, duration, args.workers)
+        print(f"{result['model']:>8} {result['load']:>9.1f} {result['wall']:>9.1f} {result['rtf']:>12.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,18 @@
+"""
+Pytest setup: point every on-disk store at a throwaway directory, so importing
+main (which creates the stores) never writes into the source tree.
+"""
+import os
+import tempfile
+
+_DATA_DIR = tempfile.mkdtemp(prefix="autonotes-test-")
+
+for _variable, _name in (
+    ("CACHE_DIR", "cache"),
+    ("JOBS_DIR", "jobs"),
+    ("NOTES_DIR", "notes"),
+    ("EXPORT_DIR", "exports"),
+    ("UPLOADS_DIR", "uploads"),
+    ("PROFILE_DIR", "profiles"),
+):
+    os.environ.setdefault(_variable, os.path.join(_DATA_DIR, _name))
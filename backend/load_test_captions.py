@@ -0,0 +1,92 @@
+"""
+Load test for the caption path of YouTubeService.
+
+Fires N parallel get_transcript calls against a fake transcript API that
+blocks like a real network request, and reports per-request latency plus the
+longest event-loop stall. With the caption calls running on the executor,
+latency stays flat up to YOUTUBE_MAX_CONCURRENCY instead of growing linearly
+with N, and the loop keeps ticking while requests are in flight.
+
+Usage:
+    python load_test_captions.py [--latency 0.5] [--parallel 1 4 8 16]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.youtube_service import YouTubeService
+
+
+class FakeTranscriptApi:
+    """Stands in for YouTubeTranscriptApi with a fixed blocking delay."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def get_transcript(self, video_id, languages=None):
+        time.sleep(self.latency)
+        return [{"text": f"caption for {video_id}", "start": 0.0, "duration": 1.0}]
+
+
+async def _heartbeat(stop: asyncio.Event, interval: float = 0.01) -> float:
+    """Measure the longest gap between ticks, i.e. the worst event-loop stall."""
+    worst = 0.0
+    last = time.perf_counter()
+    while not stop.is_set():
+        await asyncio.sleep(interval)
+        now = time.perf_counter()
+        worst = max(worst, now - last - interval)
+        last = now
+    return worst
+
+
+async def _timed_request(service: YouTubeService, index: int) -> float:
+    start = time.perf_counter()
+    await service.get_transcript(f"https://youtu.be/load{index:07d}")
+    return time.perf_counter() - start
+
+
+async def run(parallel: int, latency: float, max_concurrency: int) -> dict:
+    # Use a throwaway cache so repeated runs measure the network path, not cache hits
+    os.environ["CACHE_DIR"] = tempfile.mkdtemp(prefix="load_test_cache_")
+    service = YouTubeService(max_concurrency=max_concurrency)
+    service.transcript_api = FakeTranscriptApi(latency)
+
+    stop = asyncio.Event()
+    heartbeat = asyncio.create_task(_heartbeat(stop))
+    latencies = await asyncio.gather(*(_timed_request(service, i) for i in range(parallel)))
+    stop.set()
+    worst_stall = await heartbeat
+
+    latencies.sort()
+    return {
+        "parallel": parallel,
+        "p50": latencies[len(latencies) // 2],
+        "max": latencies[-1],
+        "loop_stall": worst_stall,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Caption path load test")
+    parser.add_argument("--latency", type=float, default=0.5, help="Simulated upstream latency (s)")
+    parser.add_argument("--parallel", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--max-concurrency", type=int,
+                        default=int(os.getenv("YOUTUBE_MAX_CONCURRENCY", "8")))
+    args = parser.parse_args()
+
+    print(f"Simulated latency: {args.latency:.2f}s, concurrency cap: {args.max_concurrency}")
+    print(f"{'parallel':>8} {'p50 (s)':>8} {'max (s)':>8} {'loop stall (ms)':>16}")
+    for n in args.parallel:
+        result = asyncio.run(run(n, args.latency, args.max_concurrency))
+        print(f"{result['parallel']:>8} {result['p50']:>8.2f} {result['max']:>8.2f} "
+              f"{result['loop_stall'] * 1000:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
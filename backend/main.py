@@ -1,11 +1,16 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import FileResponse, JSONResponse as BaseJSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, HttpUrl
-from typing import Optional
+from typing import Any, List, Optional
 import os
-import tempfile
+import asyncio
+import importlib.util
+import hmac
+import json
+import logging
 import shutil
+import tempfile
 import time
 from pathlib import Path
 from dotenv import load_dotenv
@@ -13,12 +18,45 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
+from services.logging_config import configure_logging
+
+configure_logging()
+
 from services.youtube_service import YouTubeService
-from services.transcription_service import TranscriptionService
+from services.transcription_service import (
+    ENGINE_CHOICES, TranscriptionError, TranscriptionService, TranscriptionUnavailableError
+)
 from services.summarization_service import SummarizationService
 from services.export_service import ExportService
+from services.job_service import JobService
+from services.upload_service import UploadService, UploadTooLargeError
+from services.hedge_service import HedgeService, HedgeError
+from services.rate_limiter import limiter_stats
+from services import metrics
+from services.tracing import PROFILER, TRACES, TracingMiddleware
+from services.single_flight import SingleFlight
+from services.note_store import NoteStore
+from services.transcript_segments import TranscriptSegments
+from services.compression import CompressionMiddleware
+
+# orjson is optional; when installed it serializes large results several times faster.
+# (FastAPI's own ORJSONResponse is deprecated and warns on every response.)
+if importlib.util.find_spec("orjson") is not None:
+    import orjson
 
-app = FastAPI(title="AutoNotes Pro API", version="1.0.0")
+    class JSONResponse(BaseJSONResponse):
+        """
+        JSONResponse rendered with orjson.
+        """
+
+        def render(self, content: Any) -> bytes:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+else:
+    JSONResponse = BaseJSONResponse
+
+logger = logging.getLogger(__name__)
+
+app = FastAPI(title="AutoNotes Pro API", version="1.0.0", default_response_class=JSONResponse)
 
 # CORS middleware
 app.add_middleware(
@@ -40,24 +78,101 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress JSON responses above COMPRESSION_MIN_BYTES (brotli if installed, else gzip)
+app.add_middleware(CompressionMiddleware, minimum_size=int(os.getenv("COMPRESSION_MIN_BYTES", "1024")))
+
 # Initialize services
 youtube_service = YouTubeService()
 transcription_service = TranscriptionService()
 summarization_service = SummarizationService()
 export_service = ExportService()
+job_service = JobService()
+upload_service = UploadService()
+note_store = NoteStore()
+hedge_service = HedgeService(primary_name="captions", backup_name="audio")
+# Concurrent requests for the same video or upload share one pipeline run
+pipeline_flights = SingleFlight()
 
 # Ensure uploads directory exists
-UPLOADS_DIR = Path("uploads")
-UPLOADS_DIR.mkdir(exist_ok=True)
+UPLOADS_DIR = Path(os.getenv("UPLOADS_DIR", "uploads"))
+UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
+JOB_UPLOADS_DIR = UPLOADS_DIR / "jobs"
+JOB_UPLOADS_DIR.mkdir(exist_ok=True)
+
+# Batch requests: videos processed at once, and the most a single batch may hold
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "3"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "200"))
+
+# Allowance for multipart boundaries and headers around the file itself
+UPLOAD_FORM_OVERHEAD = 64 * 1024
 
 
 class YouTubeRequest(BaseModel):
     url: str
+    refresh: bool = False
+    engine: Optional[str] = None
+    # False leaves the transcript out of the response; fetch it later with
+    # GET /api/notes/{note_id}/transcript
+    include_transcript: bool = True
+
+
+class BatchRequest(BaseModel):
+    urls: List[str] = []
+    playlist_url: Optional[str] = None
+    refresh: bool = False
+    engine: Optional[str] = None
+    stream: bool = False
+    include_transcript: bool = True
 
 
 class ExportRequest(BaseModel):
     transcript: str
     notes: dict
+    # PDF only: False keeps the old 5000-character transcript excerpt
+    full_transcript: bool = True
+    # Optional timed transcript ([{"start": seconds, "text": ...}]) for timestamped sections
+    segments: Optional[List[dict]] = None
+
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    """
+    Refuse uploads whose declared size is over the limit before reading the body.
+    """
+    content_length = request.headers.get("content-length")
+    if (
+        request.url.path.endswith("/upload")
+        and content_length
+        and content_length.isdigit()
+        and int(content_length) > upload_service.max_bytes + UPLOAD_FORM_OVERHEAD
+    ):
+        return JSONResponse(
+            status_code=413,
+            content={"detail": upload_service.too_large_message()}
+        )
+    return await call_next(request)
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """
+    Time every request until its response starts, labelled by route template.
+    """
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    metrics.HTTP_REQUEST_SECONDS.observe(
+        time.perf_counter() - started,
+        method=request.method,
+        # Templates rather than raw paths, so note IDs don't each become a series
+        route=getattr(route, "path", "unmatched"),
+        status=str(response.status_code),
+    )
+    return response
+
+
+# Outermost, so every response (including rejected uploads) carries X-Trace-Id
+app.add_middleware(TracingMiddleware)
 
 
 @app.get("/")
@@ -65,89 +180,276 @@ async def root():
     return {"message": "AutoNotes Pro API is running"}
 
 
-@app.post("/api/generate-notes/youtube")
-async def generate_notes_from_youtube(request: YouTubeRequest):
+@app.get("/api/cache/stats")
+async def cache_stats():
     """
-    Extract transcript from YouTube video and generate notes.
+    Hit/miss counters for the transcript, notes and export caches, and Gemini file reuse.
     """
-    try:
-        # Extract transcript from YouTube
-        transcript = await youtube_service.get_transcript(request.url)
+    return await asyncio.to_thread(_cache_stats)
+
+
+def _cache_stats() -> dict:
+    return {
+        "transcripts": youtube_service.transcript_cache.stats(),
+        "transcript_metadata": youtube_service.metadata_cache.stats(),
+        "notes": summarization_service.notes_cache.stats(),
+        "audio_transcripts": transcription_service.transcript_cache.stats(),
+        "gemini_files": transcription_service.engines["gemini"].file_manager.stats(),
+        "exports": export_service.stats(),
+    }
+
+
+def _no_progress(stage: str, percent: int) -> None:
+    pass
+
+
+async def _fetch_captions(url: str, admitted: Optional[asyncio.Event] = None) -> str:
+    """
+    Caption path: fetch the transcript from YouTube captions.
+    """
+    transcript = await youtube_service.get_transcript(url, admitted=admitted)
+    
+    if not transcript:
+        raise ValueError("Empty transcript returned")
+    
+    return transcript
+
+
+async def _transcribe_youtube_audio(url: str, report=_no_progress, engine: Optional[str] = None) -> str:
+    """
+    Audio path: download the video's audio with yt-dlp and transcribe it.
+    """
+    # Each request gets its own workspace, removed afterwards even if this path is cancelled
+    with youtube_service.workspace() as workspace_dir:
+        report("downloading_audio", 20)
+        audio_path = None
+        pre_normalized = False
+        if youtube_service.stream_transcode:
+            audio_path = await youtube_service.stream_audio(url, workspace_dir)
+            pre_normalized = audio_path is not None
+        if audio_path is None:
+            audio_path = await youtube_service.download_audio(url, workspace_dir)
+        
+        if not audio_path:
+            raise ValueError("Audio download failed.")
+        
+        logger.info("Audio downloaded to: %s", audio_path)
+        
+        # Transcribe
+        report("transcribing", 40)
+        transcript = await transcription_service.transcribe_audio(
+            audio_path, engine=engine, normalize=False if pre_normalized else None
+        )
         
         if not transcript:
-            raise ValueError("Empty transcript returned")
-
-        # Generate structured notes
-        notes = await summarization_service.generate_notes(transcript)
+            raise ValueError("Could not transcribe downloaded audio.")
         
-        return JSONResponse(content={
-            "success": True,
-            "transcript": transcript,
-            "notes": notes
-        })
+        return transcript
+
+
+async def acquire_youtube_transcript(url: str, report=_no_progress, engine: Optional[str] = None) -> str:
+    """
+    Get a video's transcript from captions or from audio download + transcription.
+    
+    The audio path starts when captions fail, or in parallel once captions are
+    slower than HEDGE_DEADLINE_SECONDS; whichever finishes first is used.
+    
+    Args:
+        url: YouTube video URL
+        report: Progress callback taking (stage, percent)
+        engine: Transcription engine for the audio path
+    """
+    report("fetching_captions", 10)
+    # The hedge deadline starts once the caption request is past the rate limiter
+    captions_admitted = asyncio.Event()
+    try:
+        transcript, _ = await hedge_service.run(
+            lambda: _fetch_captions(url, captions_admitted),
+            lambda: _transcribe_youtube_audio(url, report, engine),
+            primary_admitted=captions_admitted,
+        )
+        return transcript
+    
+    except HedgeError as e:
+        # If both paths fail, return a composite error
+        error_message = (
+            f"Failed to retrieve captions: {e.errors.get('captions')}. "
+            f"Fallback failed: {e.errors.get('audio')}"
+        )
+        raise HTTPException(status_code=400, detail=error_message)
+
+
+async def run_youtube_pipeline(
+    url: str, refresh: bool = False, report=_no_progress, engine: Optional[str] = None
+) -> dict:
+    """
+    Fetch a video's transcript and summarize it.
     
+    Concurrent calls for the same video (and options) share one run.
+    
+    Args:
+        url: YouTube video URL
+        refresh: Bypass the notes cache
+        report: Progress callback taking (stage, percent)
+        engine: Transcription engine for the audio fallback
+    """
+    try:
+        video_id = youtube_service.extract_video_id(url)
+    except ValueError:
+        video_id = url
+    return await pipeline_flights.run(
+        f"youtube:{video_id}:{engine or ''}:{int(refresh)}",
+        lambda flight_report: _youtube_pipeline(url, refresh, flight_report, engine, video_id),
+        report,
+    )
+
+
+async def _youtube_pipeline(url: str, refresh: bool, report, engine: Optional[str], video_id: str) -> dict:
+    transcript = await acquire_youtube_transcript(url, report, engine=engine)
+    
+    # Generate structured notes
+    report("summarizing", 70)
+    notes = await summarization_service.generate_notes(transcript, refresh=refresh)
+    
+    result = {
+        "success": True,
+        "note_id": await _store_note(transcript, notes, "youtube", video_id, url),
+        "transcript": transcript,
+        "notes": notes
+    }
+    
+    # When the captions path won, its segment timings are cached: link the
+    # note sections back to where they occur in the video
+    section_times = await asyncio.to_thread(_section_times, video_id, transcript, notes)
+    if section_times is not None:
+        result["section_times"] = section_times
+    return result
+
+
+def _section_times(video_id: str, transcript: str, notes: dict) -> Optional[dict]:
+    """
+    Where each note section occurs in the video, if the captions are cached. Blocking.
+    """
+    segments = youtube_service.cached_segments(video_id)
+    if segments is None or segments.text != transcript:
+        return None
+    return segments.map_sections(notes.get("structured") or {})
+
+
+async def _store_note(
+    transcript: str, notes: dict, source: str, source_id: Optional[str], url: Optional[str] = None
+) -> Optional[str]:
+    """
+    Persist a result so it can be fetched and exported by note ID later.
+    
+    Fallback notes from a failed generation are not stored. A storage failure
+    is logged and doesn't fail the request; either way the result has no note ID.
+    """
+    if notes.get("fallback"):
+        return None
+    try:
+        return await asyncio.to_thread(note_store.save, transcript, notes, source, source_id, url)
     except Exception as e:
-        print(f"Caption retrieval failed: {str(e)}. Attempting audio download fallback...")
-        
-        # Fallback: Download audio and transcribe
-        temp_audio = None
+        logger.exception("Could not store note: %s", e)
+        return None
+
+
+async def run_upload_pipeline(
+    file_path: str,
+    refresh: bool = False,
+    report=_no_progress,
+    engine: Optional[str] = None,
+    content_hash: Optional[str] = None,
+) -> dict:
+    """
+    Transcribe a saved audio/video file and summarize it.
+    
+    Args:
+        file_path: Path to the uploaded file on disk
+        refresh: Bypass the notes cache
+        report: Progress callback taking (stage, percent)
+        engine: Transcription engine ("auto", "gemini" or "whisper")
+        content_hash: SHA-256 of the file, used to reuse earlier transcripts
+            and to share one run between concurrent uploads of the same file
+    """
+    if content_hash is None:
+        return await _upload_pipeline(file_path, refresh, report, engine, content_hash)
+    return await pipeline_flights.run(
+        f"upload:{content_hash}:{engine or ''}:{int(refresh)}",
+        lambda flight_report: _coalesced_upload_pipeline(file_path, refresh, flight_report, engine, content_hash),
+        report,
+    )
+
+
+async def _coalesced_upload_pipeline(
+    file_path: str, refresh: bool, report, engine: Optional[str], content_hash: str
+) -> dict:
+    """
+    Run the upload pipeline on a private link to the file.
+    
+    A shared run can outlive the request that started it (if that client goes
+    away while others wait), and that request deletes its upload when it ends.
+    """
+    workspace_dir = tempfile.mkdtemp(dir=os.path.dirname(file_path))
+    flight_path = os.path.join(workspace_dir, os.path.basename(file_path))
+    try:
         try:
-            timestamp = int(time.time())
-            temp_dir = os.path.join(UPLOADS_DIR, "temp_dl")
-            os.makedirs(temp_dir, exist_ok=True)
-            
-            # yt-dlp will append extension
-            output_template = os.path.join(temp_dir, f"audio_{timestamp}")
-            
-            downloaded_file = youtube_service.download_audio(request.url, output_template)
-            
-            if not downloaded_file:
-                 raise HTTPException(
-                    status_code=400,
-                    detail=f"Caption retrieval failed and audio download failed. Error: {str(e)}"
-                )
-            
-            temp_audio = downloaded_file
-            print(f"Audio downloaded to: {temp_audio}")
-            
-            # Transcribe
-            transcript = await transcription_service.transcribe_audio(temp_audio)
-            
-            if not transcript:
-                 raise HTTPException(
-                    status_code=400,
-                    detail="Could not transcribe downloaded audio."
-                )
-                
-            # Generate structured notes
-            notes = await summarization_service.generate_notes(transcript)
-            
-            return JSONResponse(content={
-                "success": True,
-                "transcript": transcript,
-                "notes": notes
-            })
-
-        except Exception as fallback_error:
-            # If fallback also fails, return original error or composite
-            error_message = f"Failed to retrieve captions: {str(e)}. Fallback failed: {str(fallback_error)}"
-            raise HTTPException(status_code=400, detail=error_message)
-        
-        finally:
-            # Cleanup
-            if temp_audio and os.path.exists(temp_audio):
-                try:
-                    os.unlink(temp_audio)
-                except:
-                    pass
+            os.link(file_path, flight_path)
+        except OSError:
+            await asyncio.to_thread(shutil.copyfile, file_path, flight_path)
+        return await _upload_pipeline(flight_path, refresh, report, engine, content_hash)
+    finally:
+        shutil.rmtree(workspace_dir, ignore_errors=True)
 
 
-@app.post("/api/generate-notes/upload")
-async def generate_notes_from_upload(file: UploadFile = File(...)):
+async def _upload_pipeline(
+    file_path: str, refresh: bool, report, engine: Optional[str], content_hash: Optional[str]
+) -> dict:
+    # Transcribe audio
+    report("transcribing", 10)
+    try:
+        transcript = await transcription_service.transcribe_audio(
+            file_path, engine=engine, content_hash=content_hash
+        )
+    except TranscriptionUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except TranscriptionError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    
+    if not transcript:
+        raise HTTPException(
+            status_code=400,
+            detail="Could not transcribe audio. Please ensure the file contains clear audio."
+        )
+    
+    # Generate structured notes
+    report("summarizing", 60)
+    notes = await summarization_service.generate_notes(transcript, refresh=refresh)
+    
+    return {
+        "success": True,
+        "note_id": await _store_note(transcript, notes, "upload", content_hash),
+        "transcript": transcript,
+        "notes": notes
+    }
+
+
+def _shape_result(result: dict, include_transcript: bool = True) -> dict:
     """
-    Transcribe uploaded audio/video file and generate notes.
+    Optionally replace a result's transcript with its length, which is most
+    of the payload for long lectures.
+    """
+    if include_transcript or "transcript" not in result:
+        return result
+    shaped = {key: value for key, value in result.items() if key != "transcript"}
+    shaped["transcript_chars"] = len(result["transcript"])
+    return shaped
+
+
+def _validate_upload(file: UploadFile) -> str:
+    """
+    Check the upload's extension and return it.
     """
-    # Validate file type
     allowed_extensions = {'.mp3', '.mp4', '.wav', '.m4a', '.webm'}
     file_ext = Path(file.filename).suffix.lower()
     
@@ -156,52 +458,486 @@ async def generate_notes_from_upload(file: UploadFile = File(...)):
             status_code=400,
             detail=f"File type not supported. Allowed types: {', '.join(allowed_extensions)}"
         )
+    return file_ext
+
+
+def _validate_engine(engine: Optional[str]) -> None:
+    """
+    Reject unknown transcription engine names before any work starts.
+    """
+    if engine is not None and engine not in ENGINE_CHOICES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown transcription engine. Choose from: {', '.join(ENGINE_CHOICES)}"
+        )
+
+
+@app.get("/api/youtube/transcript")
+async def get_youtube_transcript_segments(url: str, start: Optional[float] = None, end: Optional[float] = None):
+    """
+    Timed caption segments for a video, optionally only those overlapping [start, end) seconds.
+    """
+    try:
+        segments = await youtube_service.get_transcript_segments(url)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    # Save uploaded file temporarily
-    temp_file = None
+    if start is not None or end is not None:
+        segments = segments.slice(start or 0.0, end if end is not None else float("inf"))
+    return JSONResponse(content={
+        "video_id": youtube_service.extract_video_id(url),
+        "duration": round(segments.duration, 3),
+        "text": segments.text,
+        "segments": list(segments)
+    })
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """
+    Stage latencies, fallback and cache counters, and in-flight gauges in the Prometheus text format.
+    """
+    await asyncio.to_thread(_refresh_metric_gauges)
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+
+def _refresh_metric_gauges() -> None:
+    """
+    Copy in-flight counts owned by the services into their gauges. Blocking.
+    """
+    flights = pipeline_flights.stats()
+    metrics.IN_FLIGHT.set(flights["in_flight"], kind="pipelines")
+    metrics.IN_FLIGHT.set(flights["waiters"], kind="pipeline_waiters")
+    metrics.IN_FLIGHT.set(export_service.stats()["rendering"], kind="export_renders")
+    metrics.IN_FLIGHT.set(note_store.stats()["pending"], kind="unsaved_notes")
+    
+    job_counts = job_service.stats()
+    for status in ("queued", "running", "completed", "failed"):
+        metrics.JOBS.set(job_counts.get(status, 0), status=status)
+    
+    for name, stats in limiter_stats().items():
+        metrics.UPSTREAM_IN_FLIGHT.set(stats["in_flight"], upstream=name)
+        metrics.UPSTREAM_WAITING.set(stats["waiting"], upstream=name)
+
+
+class ProfilingSettings(BaseModel):
+    sample_rate: Optional[float] = None
+    allow_header: Optional[bool] = None
+
+
+def _require_debug_api(request: Request) -> None:
+    """
+    The debug API is off unless DEBUG_API_TOKEN is set, and then needs that
+    token in the X-Debug-Token header.
+    """
+    token = os.getenv("DEBUG_API_TOKEN")
+    if not token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(request.headers.get("x-debug-token", "").encode(), token.encode()):
+        raise HTTPException(status_code=401, detail="Missing or invalid X-Debug-Token")
+
+
+@app.get("/api/debug/traces")
+async def list_traces(request: Request, limit: int = 50, slowest: bool = False):
+    """
+    Recent finished traces (newest first, or slowest first) without their spans.
+    """
+    _require_debug_api(request)
+    return {"traces": TRACES.summaries(limit=min(max(limit, 1), 500), slowest=slowest)}
+
+
+@app.get("/api/debug/traces/{trace_id}")
+async def get_trace(request: Request, trace_id: str):
+    """
+    One request's (or job's) timed spans. Use the X-Trace-Id response header or a job ID.
+    """
+    _require_debug_api(request)
+    trace = TRACES.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found or no longer kept")
+    return trace.to_dict()
+
+
+@app.get("/api/debug/profiling")
+async def get_profiling(request: Request):
+    """
+    Profiling toggles, counters and the slowest saved profiles.
+    """
+    _require_debug_api(request)
+    return PROFILER.stats()
+
+
+@app.put("/api/debug/profiling")
+async def update_profiling(request: Request, settings: ProfilingSettings):
+    """
+    Turn request profiling on or off at runtime (sample rate and/or the X-Profile header).
+    """
+    _require_debug_api(request)
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as temp_file:
-            shutil.copyfileobj(file.file, temp_file)
-            temp_path = temp_file.name
-        
-        # Transcribe audio
-        transcript = await transcription_service.transcribe_audio(temp_path)
-        
-        if not transcript:
-            raise HTTPException(
-                status_code=400,
-                detail="Could not transcribe audio. Please ensure the file contains clear audio."
-            )
-        
-        # Generate structured notes
-        notes = await summarization_service.generate_notes(transcript)
+        PROFILER.configure(sample_rate=settings.sample_rate, allow_header=settings.allow_header)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return PROFILER.stats()
+
+
+@app.get("/api/debug/profiles/{trace_id}")
+async def get_profile(request: Request, trace_id: str, format: str = "text", limit: int = 40):
+    """
+    A saved profile: a top-functions report (format=text) or the raw pstats file (format=prof).
+    """
+    _require_debug_api(request)
+    if format == "prof":
+        path = PROFILER.find(trace_id)
+        if path is None or not path.exists():
+            raise HTTPException(status_code=404, detail="Profile not found")
+        return FileResponse(path, media_type="application/octet-stream", filename=path.name)
+    
+    report = await asyncio.to_thread(PROFILER.summary, trace_id, limit)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return Response(content=report, media_type="text/plain")
+
+
+@app.get("/api/stats/hedging")
+async def hedging_stats():
+    """
+    Win rate and latency of the caption and audio paths, for tuning HEDGE_DEADLINE_SECONDS.
+    """
+    return hedge_service.stats()
+
+
+@app.get("/api/stats/coalescing")
+async def coalescing_stats():
+    """
+    Pipelines currently in flight and how many requests are waiting on each.
+    """
+    return pipeline_flights.stats()
+
+
+@app.get("/api/stats/rate-limits")
+async def rate_limit_stats():
+    """
+    Token bucket, concurrency window and queueing for each upstream API.
+    """
+    return await asyncio.to_thread(limiter_stats)
+
+
+@app.post("/api/generate-notes/youtube")
+async def generate_notes_from_youtube(request: YouTubeRequest):
+    """
+    Extract transcript from YouTube video and generate notes.
+    """
+    _validate_engine(request.engine)
+    result = await run_youtube_pipeline(request.url, refresh=request.refresh, engine=request.engine)
+    return JSONResponse(content=_shape_result(result, request.include_transcript))
+
+
+def _sse(event: dict) -> str:
+    """
+    Format an event dictionary as a server-sent event.
+    """
+    return f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+
+@app.post("/api/generate-notes/youtube/stream")
+async def stream_notes_from_youtube(request: YouTubeRequest):
+    """
+    Same as /api/generate-notes/youtube, but streams the notes as server-sent events.
+    
+    Events: "status" while the transcript is fetched, "transcript" once it is
+    available, then "delta" (markdown text), "section" (each completed section)
+    and finally "done" with the full notes and their note ID.
+    """
+    _validate_engine(request.engine)
+
+    async def event_stream():
+        yield _sse({"event": "status", "stage": "fetching_transcript"})
+        try:
+            transcript = await acquire_youtube_transcript(request.url, engine=request.engine)
+        except HTTPException as e:
+            yield _sse({"event": "error", "message": e.detail})
+            return
         
+        if request.include_transcript:
+            yield _sse({"event": "transcript", "transcript": transcript})
+        else:
+            yield _sse({"event": "transcript", "transcript_chars": len(transcript)})
+        async for event in summarization_service.stream_notes(transcript, refresh=request.refresh):
+            if event["event"] == "done":
+                try:
+                    video_id = youtube_service.extract_video_id(request.url)
+                except ValueError:
+                    video_id = None
+                event["note_id"] = await _store_note(transcript, event["notes"], "youtube", video_id, request.url)
+            yield _sse(event)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/api/generate-notes/batch")
+async def generate_notes_batch(request: BatchRequest):
+    """
+    Generate notes for a list of YouTube URLs and/or every video in a playlist.
+    
+    Videos are processed with bounded concurrency (BATCH_CONCURRENCY), and a
+    failed video is reported in its item without failing the batch. With
+    "stream": true the response is NDJSON: a "started" event, "progress" and
+    "item" events as each video advances and completes, then "done".
+    """
+    _validate_engine(request.engine)
+    
+    urls = list(request.urls)
+    if request.playlist_url:
+        try:
+            urls.extend(await youtube_service.expand_playlist(request.playlist_url))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    # Drop duplicates, keeping the first occurrence
+    urls = list(dict.fromkeys(urls))
+    if not urls:
+        raise HTTPException(status_code=400, detail="Provide at least one URL or a playlist_url.")
+    if len(urls) > BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch too large: {len(urls)} videos (maximum {BATCH_MAX_ITEMS})."
+        )
+    
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    events: asyncio.Queue = asyncio.Queue()
+
+    async def process_item(index: int, url: str) -> dict:
+        def report(stage: str, percent: int) -> None:
+            events.put_nowait({"event": "progress", "index": index, "url": url, "stage": stage, "percent": percent})
+
+        async with semaphore:
+            try:
+                result = await run_youtube_pipeline(url, refresh=request.refresh, report=report, engine=request.engine)
+                item = {"index": index, "url": url, **_shape_result(result, request.include_transcript)}
+            except Exception as e:
+                item = {"index": index, "url": url, "success": False, "error": getattr(e, "detail", None) or str(e)}
+        events.put_nowait({"event": "item", **item})
+        return item
+
+    tasks = [asyncio.create_task(process_item(index, url)) for index, url in enumerate(urls)]
+
+    if not request.stream:
+        items = await asyncio.gather(*tasks)
+        succeeded = sum(1 for item in items if item["success"])
         return JSONResponse(content={
-            "success": True,
-            "transcript": transcript,
-            "notes": notes
+            "success": succeeded > 0,
+            "total": len(items),
+            "succeeded": succeeded,
+            "failed": len(items) - succeeded,
+            "items": items
         })
+
+    async def event_stream():
+        yield json.dumps({"event": "started", "total": len(urls), "urls": urls}) + "\n"
+        completed = succeeded = 0
+        try:
+            while completed < len(urls):
+                event = await events.get()
+                if event["event"] == "item":
+                    completed += 1
+                    succeeded += 1 if event["success"] else 0
+                    event["completed"] = completed
+                yield json.dumps(event) + "\n"
+        finally:
+            # Client went away: stop the remaining work
+            for task in tasks:
+                task.cancel()
+        yield json.dumps({
+            "event": "done",
+            "total": len(urls),
+            "succeeded": succeeded,
+            "failed": len(urls) - succeeded
+        }) + "\n"
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
+
+@app.post("/api/generate-notes/upload")
+async def generate_notes_from_upload(
+    file: UploadFile = File(...),
+    refresh: bool = False,
+    engine: Optional[str] = None,
+    include_transcript: bool = True,
+):
+    """
+    Transcribe uploaded audio/video file and generate notes.
+    
+    Pass ?refresh=true to bypass the notes cache, ?engine=gemini|whisper|auto
+    to choose the transcription engine, and ?include_transcript=false to leave
+    the transcript out of the response.
+    """
+    # Validate file type
+    file_ext = _validate_upload(file)
+    _validate_engine(engine)
+    
+    # Save uploaded file temporarily
+    temp_path = None
+    try:
+        saved = await upload_service.save(file, suffix=file_ext)
+        temp_path = saved["path"]
+        
+        result = await run_upload_pipeline(
+            temp_path, refresh=refresh, engine=engine, content_hash=saved["sha256"]
+        )
+        return JSONResponse(content=_shape_result(result, include_transcript))
+    
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    
+    except HTTPException:
+        raise
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
     
     finally:
         # Clean up temporary file
-        if temp_file and os.path.exists(temp_path):
+        if temp_path and os.path.exists(temp_path):
             os.unlink(temp_path)
 
 
+async def _youtube_job(payload: dict, report) -> dict:
+    return await run_youtube_pipeline(
+        payload["url"], refresh=payload.get("refresh", False), report=report, engine=payload.get("engine")
+    )
+
+
+async def _upload_job(payload: dict, report) -> dict:
+    if not os.path.exists(payload["path"]):
+        raise FileNotFoundError(
+            f"The uploaded file for this job is no longer available ({os.path.basename(payload['path'])})."
+        )
+    return await run_upload_pipeline(
+        payload["path"], refresh=payload.get("refresh", False), report=report,
+        engine=payload.get("engine"), content_hash=payload.get("sha256")
+    )
+
+
+def _remove_upload(payload: dict) -> None:
+    # The job is finished for good, so nothing will read the file again
+    if os.path.exists(payload["path"]):
+        os.unlink(payload["path"])
+
+
+job_service.register("youtube", _youtube_job)
+job_service.register("upload", _upload_job, cleanup=_remove_upload)
+
+
+@app.on_event("startup")
+async def start_job_workers():
+    await job_service.start()
+    if os.getenv("WHISPER_WARM_ON_STARTUP") == "1" and transcription_service.engines["whisper"].available:
+        await transcription_service.engines["whisper"].warm_up()
+
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    await job_service.stop()
+    transcription_service.engines["whisper"].shutdown()
+    # Commit notes still buffered for the library
+    await asyncio.to_thread(note_store.close)
+
+
+@app.post("/api/jobs/youtube", status_code=202)
+async def submit_youtube_job(request: YouTubeRequest):
+    """
+    Queue note generation for a YouTube video and return a job ID immediately.
+    """
+    _validate_engine(request.engine)
+    job_id = await asyncio.to_thread(
+        job_service.submit, "youtube", {"url": request.url, "refresh": request.refresh, "engine": request.engine}
+    )
+    return {"job_id": job_id, "status": "queued"}
+
+
+@app.post("/api/jobs/upload", status_code=202)
+async def submit_upload_job(
+    file: UploadFile = File(...), refresh: bool = False, engine: Optional[str] = None
+):
+    """
+    Save an uploaded file, queue it for transcription and note generation,
+    and return a job ID immediately.
+    """
+    file_ext = _validate_upload(file)
+    _validate_engine(engine)
+    
+    # The file must outlive this request (and a server restart) until a worker picks it up
+    try:
+        saved = await upload_service.save(file, suffix=file_ext, directory=str(JOB_UPLOADS_DIR))
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    
+    job_id = await asyncio.to_thread(job_service.submit, "upload", {
+        "path": saved["path"],
+        "sha256": saved["sha256"],
+        "refresh": refresh,
+        "engine": engine,
+    })
+    return {"job_id": job_id, "status": "queued"}
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Report a job's status and stage progress, plus its result once completed.
+    """
+    job = await asyncio.to_thread(job_service.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+def _export_options(request: ExportRequest, fmt: str) -> dict:
+    if fmt == "pdf":
+        return {"full_transcript": request.full_transcript, "segments": request.segments}
+    return {"segments": request.segments}
+
+
+def _export_etag(request: ExportRequest, fmt: str) -> str:
+    options = _export_options(request, fmt)
+    return f'"{export_service.export_key(request.transcript, request.notes, fmt, options)}"'
+
+
+def _etag_matches(http_request: Request, etag: str) -> bool:
+    """
+    Whether the client's If-None-Match already names this ETag.
+    """
+    header = http_request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    return "*" in candidates or any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+
 @app.post("/api/export/pdf")
 async def export_pdf(request: ExportRequest):
     """
     Export notes as PDF.
+    
+    The response carries an ETag derived from the notes and transcript. As a
+    POST, the request's precondition headers are ignored (304 is only defined
+    for GET/HEAD); conditional export is available for stored notes at
+    GET /api/notes/{note_id}/export/pdf.
     """
+    etag = _export_etag(request, "pdf")
     try:
-        pdf_path = await export_service.export_to_pdf(request.transcript, request.notes)
+        pdf_path = await export_service.export_to_pdf(
+            request.transcript, request.notes, **_export_options(request, "pdf")
+        )
         return FileResponse(
             pdf_path,
             media_type="application/pdf",
-            filename="notes.pdf"
+            filename="notes.pdf",
+            headers={"ETag": etag}
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating PDF: {str(e)}")
@@ -210,14 +946,163 @@ async def export_pdf(request: ExportRequest):
 @app.post("/api/export/txt")
 async def export_txt(request: ExportRequest):
     """
-    Export notes as TXT.
+    Export notes as TXT (carries an ETag like the PDF export).
+    """
+    etag = _export_etag(request, "txt")
+    try:
+        txt_path = await export_service.export_to_txt(
+            request.transcript, request.notes, **_export_options(request, "txt")
+        )
+        return FileResponse(
+            txt_path,
+            media_type="text/plain",
+            filename="notes.txt",
+            headers={"ETag": etag}
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generating TXT: {str(e)}")
+
+
+def _note_segments(note: dict) -> Optional[TranscriptSegments]:
+    """
+    Caption segments for a stored YouTube note, if they are still cached.
+    """
+    if note["source"] != "youtube" or not note["source_id"]:
+        return None
+    segments = youtube_service.cached_segments(note["source_id"])
+    if segments is None or segments.text != note["transcript"]:
+        return None
+    return segments
+
+
+def _get_note_or_404(note_id: str) -> dict:
+    note = note_store.get(note_id)
+    if note is None:
+        raise HTTPException(status_code=404, detail="Note not found")
+    return note
+
+
+def _require_note(note_id: str) -> None:
+    """
+    404 unless the note exists, without loading it.
+    """
+    if not note_store.exists(note_id):
+        raise HTTPException(status_code=404, detail="Note not found")
+
+
+@app.get("/api/library")
+async def list_library(limit: int = 20, offset: int = 0):
+    """
+    Stored results, newest first, with a preview of the notes.
+    """
+    if offset < 0 or not 0 < limit <= 100:
+        raise HTTPException(status_code=400, detail="offset must be >= 0 and limit between 1 and 100.")
+    items = await asyncio.to_thread(note_store.list_recent, limit, offset)
+    return JSONResponse(content={"items": items, "limit": limit, "offset": offset})
+
+
+@app.get("/api/library/search")
+async def search_library(q: str, limit: int = 20, offset: int = 0):
+    """
+    Full-text search across every stored result's notes and transcript.
+    
+    Results are ranked (matches in the notes first) and include highlighted
+    snippets; use the note_id to fetch or export a result.
+    """
+    if offset < 0 or not 0 < limit <= 100:
+        raise HTTPException(status_code=400, detail="offset must be >= 0 and limit between 1 and 100.")
+    results = await asyncio.to_thread(note_store.search, q, limit, offset)
+    return JSONResponse(content={"query": q, "results": results, "limit": limit, "offset": offset})
+
+
+@app.get("/api/notes/{note_id}")
+async def get_note(note_id: str, include_transcript: bool = True):
+    """
+    Return a stored result (transcript, notes and source) by note ID.
+    """
+    note = await asyncio.to_thread(_get_note_or_404, note_id)
+    return JSONResponse(content=_shape_result(note, include_transcript))
+
+
+@app.get("/api/notes/{note_id}/transcript")
+async def get_note_transcript(note_id: str, offset: int = 0, limit: int = 50000):
+    """
+    Page through a stored transcript by character offset.
+    
+    Keep requesting with offset=next_offset until next_offset is null.
     """
+    if offset < 0 or not 0 < limit <= 1000000:
+        raise HTTPException(status_code=400, detail="offset must be >= 0 and limit between 1 and 1000000.")
+    page = await asyncio.to_thread(note_store.get_transcript_page, note_id, offset, limit)
+    if page is None:
+        raise HTTPException(status_code=404, detail="Note not found")
+    return JSONResponse(content={"note_id": note_id, **page})
+
+
+@app.get("/api/notes/{note_id}/export/pdf")
+async def export_note_pdf(
+    note_id: str, http_request: Request, full_transcript: bool = True, timestamps: bool = False
+):
+    """
+    Export a stored note as PDF, without re-sending its transcript and notes.
+    
+    With ?timestamps=true, a YouTube note whose captions are still cached gets
+    timestamped transcript sections. The ETag comes from the note ID (plus the
+    segments' digest when they are rendered), so without timestamps a matching
+    If-None-Match is answered with 304 after only checking that the note exists.
+    """
+    options = {"full_transcript": full_transcript}
+    note = segments = None
+    if timestamps:
+        # Whether sections are rendered depends on the captions cached right
+        # now, so the key is built from the segments actually used
+        note = await asyncio.to_thread(_get_note_or_404, note_id)
+        segments = await asyncio.to_thread(_note_segments, note)
+        if segments is not None:
+            options["segments"] = segments.digest()
+    etag = f'"{export_service.note_export_key(note_id, "pdf", options)}"'
+    if _etag_matches(http_request, etag):
+        if note is None:
+            await asyncio.to_thread(_require_note, note_id)
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    if note is None:
+        note = await asyncio.to_thread(_get_note_or_404, note_id)
+    try:
+        pdf_path = await export_service.export_to_pdf(
+            note["transcript"], note["notes"], cache_key=etag.strip('"'),
+            full_transcript=full_transcript, segments=list(segments) if segments is not None else None
+        )
+        return FileResponse(
+            pdf_path,
+            media_type="application/pdf",
+            filename="notes.pdf",
+            headers={"ETag": etag}
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generating PDF: {str(e)}")
+
+
+@app.get("/api/notes/{note_id}/export/txt")
+async def export_note_txt(note_id: str, http_request: Request):
+    """
+    Export a stored note as TXT (supports If-None-Match like the PDF export).
+    """
+    etag = f'"{export_service.note_export_key(note_id, "txt")}"'
+    if _etag_matches(http_request, etag):
+        await asyncio.to_thread(_require_note, note_id)
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    note = await asyncio.to_thread(_get_note_or_404, note_id)
     try:
-        txt_path = await export_service.export_to_txt(request.transcript, request.notes)
+        txt_path = await export_service.export_to_txt(
+            note["transcript"], note["notes"], cache_key=etag.strip('"')
+        )
         return FileResponse(
             txt_path,
             media_type="text/plain",
-            filename="notes.txt"
+            filename="notes.txt",
+            headers={"ETag": etag}
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating TXT: {str(e)}")
@@ -233,10 +1118,10 @@ if __name__ == "__main__":
         # Test if port is available
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
             s.bind(('0.0.0.0', port))
-        print(f"Starting server on port {port}...")
+        logger.info("Starting server on port %d...", port)
     except OSError:
         port = 8001
-        print(f"Port 8000 busy, using port {port} instead...")
+        logger.warning("Port 8000 busy, using port %d instead...", port)
     
     uvicorn.run(app, host="0.0.0.0", port=port)
 
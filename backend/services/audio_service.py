@@ -0,0 +1,214 @@
+"""
+Service for inspecting, transcoding and cutting audio files with ffmpeg.
+"""
+import asyncio
+import os
+import re
+import shutil
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+# Compact speech encoding used for everything we send to a transcription engine:
+# mono, 16 kHz, low-bitrate Opus tuned for voice.
+SPEECH_CODEC_ARGS = ("-vn", "-ac", "1", "-ar", "16000", "-c:a", "libopus", "-b:a", "24k", "-application", "voip")
+SPEECH_EXTENSION = ".ogg"
+
+# Drops leading silence, and shortens internal/trailing silences longer than
+# one second down to half a second.
+TRIM_SILENCE_FILTER = (
+    "silenceremove=start_periods=1:start_duration=0.3:start_threshold=-45dB:"
+    "stop_periods=-1:stop_duration=1:stop_threshold=-45dB:stop_silence=0.5"
+)
+
+
+class AudioService:
+    """
+    Thin async wrapper around the ffmpeg/ffprobe command line tools.
+    """
+
+    def __init__(self):
+        self.ffmpeg = shutil.which("ffmpeg")
+        self.ffprobe = shutil.which("ffprobe")
+        # ffprobe only reads the container header; a probe that hangs is killed
+        self.probe_timeout = float(os.getenv("FFPROBE_TIMEOUT_SECONDS", "60"))
+
+    @property
+    def available(self) -> bool:
+        return bool(self.ffmpeg and self.ffprobe)
+
+    async def _run(self, *args: str, timeout: Optional[float] = None) -> Tuple[int, str, str]:
+        """
+        Run a command and return its exit code, stdout and stderr.
+
+        The process is killed (and reaped) if the caller is cancelled or it
+        runs longer than ``timeout`` seconds, so no ffmpeg is left behind.
+
+        Raises:
+            ValueError: If the command timed out
+        """
+        process = await asyncio.create_subprocess_exec(
+            *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            await self._kill(process)
+            raise ValueError(f"{os.path.basename(args[0])} timed out after {timeout:g}s")
+        except asyncio.CancelledError:
+            await self._kill(process)
+            raise
+        return process.returncode, stdout.decode(errors="replace"), stderr.decode(errors="replace")
+
+    @staticmethod
+    async def _kill(process: asyncio.subprocess.Process) -> None:
+        if process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+        await process.wait()
+
+    async def probe_duration(self, file_path: str) -> float:
+        """
+        Return the duration of a media file in seconds.
+        """
+        code, stdout, stderr = await self._run(
+            self.ffprobe, "-v", "error",
+            "-show_entries", "format=duration",
+            "-of", "default=noprint_wrappers=1:nokey=1",
+            file_path,
+            timeout=self.probe_timeout,
+        )
+        if code != 0:
+            raise ValueError(f"ffprobe failed: {stderr.strip()[:200]}")
+        return float(stdout.strip())
+
+    async def detect_silences(
+        self, file_path: str, noise_db: int = -35, min_silence: float = 0.5
+    ) -> List[Tuple[float, float]]:
+        """
+        Find silent stretches in a file.
+
+        Returns:
+            List of (start, end) times in seconds
+        """
+        code, _, stderr = await self._run(
+            self.ffmpeg, "-hide_banner", "-nostats", "-i", file_path,
+            "-af", f"silencedetect=noise={noise_db}dB:d={min_silence}",
+            "-f", "null", "-",
+        )
+        if code != 0:
+            raise ValueError(f"ffmpeg silencedetect failed: {stderr.strip()[-200:]}")
+
+        starts = [float(m) for m in re.findall(r"silence_start: (-?[\d.]+)", stderr)]
+        ends = [float(m) for m in re.findall(r"silence_end: ([\d.]+)", stderr)]
+        return list(zip(starts, ends))
+
+    async def plan_segments(
+        self,
+        file_path: str,
+        segment_seconds: float,
+        overlap_seconds: float = 0.0,
+        align_to_silence: bool = False,
+    ) -> List[Dict[str, float]]:
+        """
+        Work out segment boundaries for a file without cutting it.
+
+        Cut points fall every ``segment_seconds``; with ``align_to_silence`` each
+        cut moves to the middle of the nearest silence within a quarter segment,
+        so words are not split. Every segment except the last is extended by
+        ``overlap_seconds`` so the transcripts can be stitched back together.
+
+        Returns:
+            List of {"index", "start", "end"} dictionaries in order
+        """
+        duration = await self.probe_duration(file_path)
+
+        cuts = []
+        position = segment_seconds
+        while position < duration:
+            cuts.append(position)
+            position += segment_seconds
+
+        if align_to_silence and cuts:
+            silences = await self.detect_silences(file_path)
+            window = segment_seconds / 4
+            aligned = []
+            for cut in cuts:
+                nearby = [
+                    (start + end) / 2 for start, end in silences
+                    if abs((start + end) / 2 - cut) <= window
+                ]
+                aligned.append(min(nearby, key=lambda mid: abs(mid - cut)) if nearby else cut)
+            cuts = aligned
+
+        boundaries = [0.0] + cuts + [duration]
+        segments = []
+        for index in range(len(boundaries) - 1):
+            start = boundaries[index]
+            end = boundaries[index + 1]
+            if index < len(boundaries) - 2:
+                end = min(end + overlap_seconds, duration)
+            segments.append({"index": index, "start": start, "end": end})
+        return segments
+
+    async def extract_segment(
+        self, file_path: str, start: float, end: float, output_path: str
+    ) -> str:
+        """
+        Cut [start, end) out of a file in the compact speech format, dropping any video.
+        """
+        code, _, stderr = await self._run(
+            self.ffmpeg, "-hide_banner", "-loglevel", "error", "-y",
+            "-ss", f"{start:.3f}", "-t", f"{end - start:.3f}",
+            "-i", file_path,
+            *SPEECH_CODEC_ARGS,
+            output_path,
+        )
+        if code != 0 or not os.path.exists(output_path):
+            raise ValueError(f"ffmpeg segment extraction failed: {stderr.strip()[-200:]}")
+        return output_path
+
+    async def normalize(
+        self,
+        source: str,
+        output_path: str,
+        trim_silence: bool = False,
+        input_args: Tuple[str, ...] = (),
+    ) -> Dict[str, float]:
+        """
+        Transcode any audio/video source to the compact speech format.
+
+        Args:
+            source: Input file path (or any URL ffmpeg can read)
+            output_path: Where to write the result (should end in SPEECH_EXTENSION)
+            trim_silence: Also drop leading silence and shorten long pauses
+            input_args: Extra ffmpeg options for the input (e.g. HTTP headers)
+
+        Returns:
+            Dictionary with "input_bytes", "output_bytes", "bytes_saved" and "seconds"
+        """
+        started = time.perf_counter()
+        filter_args = ("-af", TRIM_SILENCE_FILTER) if trim_silence else ()
+        code, _, stderr = await self._run(
+            self.ffmpeg, "-hide_banner", "-loglevel", "error", "-y",
+            *input_args,
+            "-i", source,
+            *filter_args,
+            *SPEECH_CODEC_ARGS,
+            output_path,
+        )
+        if code != 0 or not os.path.exists(output_path):
+            raise ValueError(f"ffmpeg normalization failed: {stderr.strip()[-200:]}")
+
+        input_bytes = os.path.getsize(source) if os.path.exists(source) else 0
+        output_bytes = os.path.getsize(output_path)
+        return {
+            "input_bytes": input_bytes,
+            "output_bytes": output_bytes,
+            "bytes_saved": max(input_bytes - output_bytes, 0),
+            "seconds": time.perf_counter() - started,
+        }
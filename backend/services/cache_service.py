@@ -0,0 +1,293 @@
+"""
+Two-tier cache (in-memory LRU + on-disk SQLite) shared by the services.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .metrics import CACHE_LOOKUPS
+
+# Marks a memory-tier miss (None is a valid cached value)
+_MISSING = object()
+
+
+class CacheService:
+    """
+    Key/value cache with an in-memory LRU tier backed by a SQLite file.
+
+    Every namespace shares the same database file but is evicted independently.
+    Values must be JSON-serializable. Entries expire after ``ttl_seconds`` and
+    the disk tier is trimmed (least recently used first) to ``max_disk_bytes``.
+
+    Async code should use the ``*_async`` methods, which keep SQLite off the
+    event loop.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        max_items: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        max_disk_bytes: Optional[int] = None,
+        db_path: Optional[str] = None,
+    ):
+        self.namespace = namespace
+        # Explicit zeros are honoured (e.g. ttl_seconds=0 expires entries at once)
+        if max_items is None:
+            max_items = int(os.getenv("CACHE_MEMORY_ITEMS", "256"))
+        if ttl_seconds is None:
+            ttl_seconds = float(os.getenv("CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+        if max_disk_bytes is None:
+            max_disk_bytes = int(os.getenv("CACHE_DISK_MAX_MB", "512")) * 1024 * 1024
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_bytes = max_disk_bytes
+
+        if db_path is None:
+            cache_dir = Path(os.getenv("CACHE_DIR", "cache"))
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            db_path = str(cache_dir / "cache.db")
+        self.db_path = db_path
+
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        # _lock guards the memory tier and counters and is never held across
+        # SQLite calls, which take _db_lock and may wait on other processes
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "sets": 0, "evictions": 0}
+
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_cache_lru ON cache_entries (namespace, accessed_at)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Look up a key, checking memory first and then disk.
+
+        Returns:
+            The cached value, or None on a miss or expired entry
+        """
+        value = self._get_memory(key)
+        if value is not _MISSING:
+            return value
+        return self._get_disk(key)
+
+    async def get_async(self, key: str) -> Optional[Any]:
+        """
+        get() for async code: memory hits are answered directly, and only a
+        disk lookup goes to a worker thread, off the event loop.
+        """
+        value = self._get_memory(key)
+        if value is not _MISSING:
+            return value
+        return await asyncio.to_thread(self._get_disk, key)
+
+    def set(self, key: str, value: Any) -> None:
+        """
+        Store a value in both tiers, evicting old entries if over budget.
+        """
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+        self._set_disk(key, value, now)
+
+    async def set_async(self, key: str, value: Any) -> None:
+        """
+        set() for async code: the memory tier is updated immediately and the
+        disk write runs on a worker thread.
+        """
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+        await asyncio.to_thread(self._set_disk, key, value, now)
+
+    def delete(self, key: str) -> None:
+        """
+        Remove a key from both tiers.
+        """
+        with self._lock:
+            self._memory.pop(key, None)
+        with self._db_lock:
+            self._conn.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            )
+            self._conn.commit()
+
+    async def delete_async(self, key: str) -> None:
+        """
+        delete() for async code.
+        """
+        await asyncio.to_thread(self.delete, key)
+
+    def clear(self) -> None:
+        """
+        Drop every entry in this namespace.
+        """
+        with self._lock:
+            self._memory.clear()
+        with self._db_lock:
+            self._conn.execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,))
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Hit/miss counters and current tier sizes for this namespace.
+        """
+        with self._db_lock:
+            count, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries WHERE namespace = ?",
+                (self.namespace,),
+            ).fetchone()
+        with self._lock:
+            lookups = self._counters["memory_hits"] + self._counters["disk_hits"] + self._counters["misses"]
+            hits = self._counters["memory_hits"] + self._counters["disk_hits"]
+            return {
+                **self._counters,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_items": len(self._memory),
+                "disk_items": count,
+                "disk_bytes": size,
+            }
+
+    def _get_memory(self, key: str) -> Any:
+        """Memory-tier lookup; returns _MISSING when the disk has to be checked."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return _MISSING
+            value, created_at = entry
+            if now - created_at >= self.ttl_seconds:
+                del self._memory[key]
+                return _MISSING
+            self._memory.move_to_end(key)
+            self._counters["memory_hits"] += 1
+        CACHE_LOOKUPS.inc(cache=self.namespace, result="memory_hit")
+        return value
+
+    def _get_disk(self, key: str) -> Optional[Any]:
+        """Disk-tier lookup, promoting a hit to memory. Blocking."""
+        now = time.time()
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM cache_entries WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+            expired = row is not None and now - row[1] >= self.ttl_seconds
+            if expired:
+                self._conn.execute(
+                    "DELETE FROM cache_entries WHERE namespace = ? AND key = ?",
+                    (self.namespace, key),
+                )
+                self._conn.commit()
+            elif row is not None:
+                self._conn.execute(
+                    "UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                    (now, self.namespace, key),
+                )
+                self._conn.commit()
+
+        if row is None or expired:
+            with self._lock:
+                self._counters["misses"] += 1
+            CACHE_LOOKUPS.inc(cache=self.namespace, result="miss")
+            return None
+
+        raw_value, created_at = row
+        value = json.loads(raw_value)
+        with self._lock:
+            self._remember(key, value, created_at)
+            self._counters["disk_hits"] += 1
+        CACHE_LOOKUPS.inc(cache=self.namespace, result="disk_hit")
+        return value
+
+    def _set_disk(self, key: str, value: Any, now: float) -> None:
+        """Write a value to the disk tier and evict over budget. Blocking."""
+        raw_value = json.dumps(value)
+        with self._db_lock:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO cache_entries (namespace, key, value, size, created_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (self.namespace, key, raw_value, len(raw_value), now, now),
+            )
+            evicted = self._evict_disk(now)
+            self._conn.commit()
+        with self._lock:
+            for evicted_key in evicted:
+                self._memory.pop(evicted_key, None)
+            self._counters["sets"] += 1
+
+    def _remember(self, key: str, value: Any, created_at: float) -> None:
+        """Insert into the memory tier, dropping least recently used items. Caller holds the lock."""
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self, now: float) -> List[str]:
+        """
+        Purge expired rows and trim the namespace to its byte budget. Caller
+        holds the DB lock.
+
+        Returns:
+            Keys evicted for size, to drop from the memory tier as well
+        """
+        expired = self._conn.execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND created_at <= ?",
+            (self.namespace, now - self.ttl_seconds),
+        ).rowcount
+        evictions = max(expired, 0)
+
+        (total,) = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM cache_entries WHERE namespace = ?",
+            (self.namespace,),
+        ).fetchone()
+        if total <= self.max_disk_bytes:
+            self._count_evictions(evictions)
+            return []
+
+        rows = self._conn.execute(
+            "SELECT key, size FROM cache_entries WHERE namespace = ? ORDER BY accessed_at ASC",
+            (self.namespace,),
+        )
+        victims = []
+        for key, size in rows:
+            if total <= self.max_disk_bytes:
+                break
+            victims.append(key)
+            total -= size
+        self._conn.executemany(
+            "DELETE FROM cache_entries WHERE namespace = ? AND key = ?",
+            [(self.namespace, key) for key in victims],
+        )
+        self._count_evictions(evictions + len(victims))
+        return victims
+
+    def _count_evictions(self, count: int) -> None:
+        with self._lock:
+            self._counters["evictions"] += count
@@ -0,0 +1,112 @@
+"""
+ASGI middleware that compresses JSON/text responses with brotli or gzip.
+"""
+import gzip
+import importlib.util
+from typing import List, Optional, Tuple
+
+# brotli is optional: without it, clients that accept "br" get gzip instead
+BROTLI_AVAILABLE = importlib.util.find_spec("brotli") is not None
+
+# Streamed responses are never compressed, so each event reaches the client
+# as soon as it is sent
+STREAMING_CONTENT_TYPES = (b"text/event-stream", b"application/x-ndjson")
+
+
+class CompressionMiddleware:
+    """
+    Compresses single-message responses of at least ``minimum_size`` bytes.
+
+    Brotli is used when the client accepts it and the ``brotli`` package is
+    installed, otherwise gzip. Responses that are streamed in several
+    messages (server-sent events, NDJSON, files), that are already encoded,
+    or that are smaller than the threshold are passed through unchanged.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 5):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = self._choose_encoding(scope)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def compressing_send(message):
+            nonlocal start_message, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            if start_message is not None:
+                headers = start_message["headers"]
+                body = message.get("body", b"")
+                if (
+                    message.get("more_body", False)
+                    or _has_header(headers, b"content-encoding")
+                    or _header(headers, b"content-type").startswith(STREAMING_CONTENT_TYPES)
+                    or len(body) < self.minimum_size
+                ):
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+
+                compressed = self._compress(body, encoding)
+                headers = [
+                    (name, value) for name, value in headers
+                    if name.lower() not in (b"content-length", b"vary")
+                ]
+                vary = _header(start_message["headers"], b"vary")
+                headers += [
+                    (b"content-encoding", encoding.encode()),
+                    (b"content-length", str(len(compressed)).encode()),
+                    (b"vary", vary + b", Accept-Encoding" if vary else b"Accept-Encoding"),
+                ]
+                await send({**start_message, "headers": headers})
+                await send({**message, "body": compressed})
+
+        await self.app(scope, receive, compressing_send)
+
+    def _choose_encoding(self, scope) -> Optional[str]:
+        accepted = set()
+        for part in _header(scope.get("headers", []), b"accept-encoding").decode("latin-1").split(","):
+            token, _, params = part.strip().partition(";")
+            if params.replace(" ", "") in ("q=0", "q=0.0"):
+                continue
+            accepted.add(token.strip().lower())
+        if BROTLI_AVAILABLE and "br" in accepted:
+            return "br"
+        if "gzip" in accepted:
+            return "gzip"
+        return None
+
+    def _compress(self, body: bytes, encoding: str) -> bytes:
+        if encoding == "br":
+            import brotli
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+
+def _header(headers: List[Tuple[bytes, bytes]], name: bytes) -> bytes:
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return b""
+
+
+def _has_header(headers: List[Tuple[bytes, bytes]], name: bytes) -> bool:
+    return any(key.lower() == name for key, _ in headers)
@@ -1,78 +1,253 @@
 """
 Service for exporting notes to PDF and TXT formats.
 """
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
-from reportlab.lib.enums import TA_LEFT, TA_CENTER
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import hashlib
+import json
 import os
 import tempfile
+import threading
 from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .metrics import CACHE_LOOKUPS, timed_stage
+from .tracing import bind
+
+# Bump whenever the rendered layout changes so cached exports are re-rendered.
+EXPORT_VERSION = "3"
+
+# Length of the transcript excerpt when the full transcript is not requested
+TRANSCRIPT_PREVIEW_CHARS = 5000
 
 
 class ExportService:
     """
     Handles export of notes to various formats.
+    
+    Rendering runs on a small thread pool so a large PDF doesn't block the
+    event loop. Exports are content-addressed: a repeat export of the same
+    notes and transcript is served from the file rendered the first time, so
+    a rendered file carries nothing that isn't in its key (no generation time).
     """
     
-    def __init__(self):
-        self.export_dir = Path("exports")
-        self.export_dir.mkdir(exist_ok=True)
+    def __init__(self, max_workers: Optional[int] = None, max_files: Optional[int] = None):
+        self.export_dir = Path(os.getenv("EXPORT_DIR", "exports"))
+        self.export_dir.mkdir(parents=True, exist_ok=True)
+        self.max_files = max_files or int(os.getenv("EXPORT_CACHE_MAX_FILES", "200"))
+        # Long transcripts are laid out as paragraphs of about this size, and
+        # timestamped transcripts get a heading every section_seconds
+        self.paragraph_chars = int(os.getenv("EXPORT_PARAGRAPH_CHARS", "1500"))
+        self.section_seconds = float(os.getenv("EXPORT_SECTION_SECONDS", "300"))
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or int(os.getenv("EXPORT_WORKERS", "2")),
+            thread_name_prefix="export"
+        )
+        self._styles = None
+        self._styles_lock = threading.Lock()
+        self._counters = {"renders": 0, "hits": 0}
+        # Renders in progress, so simultaneous requests for one export share a render
+        self._rendering: Dict[Path, asyncio.Future] = {}
+
+    def export_key(self, transcript: str, notes: dict, fmt: str, options: Optional[dict] = None) -> str:
+        """
+        Content hash identifying an export; also used as its ETag.
+        """
+        payload = json.dumps([EXPORT_VERSION, fmt, notes, transcript, options or {}], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def note_export_key(self, note_id: str, fmt: str, options: Optional[dict] = None) -> str:
+        """
+        Export key for a stored note; cheap, since the note's ID already identifies its content.
+        """
+        payload = json.dumps([EXPORT_VERSION, fmt, "note", note_id, options or {}], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Render/hit counters, renders in progress and the number of cached export files.
+        """
+        return {
+            **self._counters,
+            "rendering": len(self._rendering),
+            "files": sum(1 for _ in self.export_dir.glob("notes_*.*")),
+        }
+
+    async def _export(
+        self,
+        fmt: str,
+        render: Callable[..., None],
+        transcript: str,
+        notes: dict,
+        cache_key: Optional[str] = None,
+        **options: Any,
+    ) -> str:
+        """
+        Return the cached export for this content, rendering it off the event loop if needed.
+        """
+        cache_key = cache_key or self.export_key(transcript, notes, fmt, options)
+        path = self.export_dir / f"notes_{cache_key}.{fmt}"
+        try:
+            # Refresh mtime so pruning drops the least recently used files
+            os.utime(path)
+            self._counters["hits"] += 1
+            CACHE_LOOKUPS.inc(cache="exports", result="hit")
+            return str(path)
+        except FileNotFoundError:
+            CACHE_LOOKUPS.inc(cache="exports", result="miss")
+
+        pending = self._rendering.get(path)
+        if pending is None:
+            loop = asyncio.get_running_loop()
+            pending = loop.run_in_executor(
+                self._executor, bind(self._render_to, render, path, transcript, notes, **options)
+            )
+            self._rendering[path] = pending
+            pending.add_done_callback(lambda _: self._rendering.pop(path, None))
+            self._counters["renders"] += 1
+        await asyncio.shield(pending)
+        return str(path)
+
+    def _render_to(
+        self, render: Callable[..., None], path: Path, transcript: str, notes: dict, **options: Any
+    ) -> None:
+        """
+        Render into a temporary file and move it into place, so concurrent
+        requests never see a partial export, then prune the cache. Blocking.
+        """
+        fd, tmp_path = tempfile.mkstemp(suffix=path.suffix, dir=self.export_dir, prefix=".render_")
+        os.close(fd)
+        try:
+            with timed_stage(f"export_{path.suffix.lstrip('.')}"):
+                render(tmp_path, transcript, notes, **options)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        self._prune()
+
+    def _prune(self) -> None:
+        """
+        Delete the least recently used exports beyond max_files.
+        """
+        files = []
+        for export in self.export_dir.glob("notes_*.*"):
+            try:
+                files.append((export.stat().st_mtime, export))
+            except OSError:
+                pass  # pruned by a render on another thread
+        files.sort(reverse=True)
+        for _, stale in files[self.max_files:]:
+            try:
+                stale.unlink()
+            except OSError:
+                pass
+
+    def _get_styles(self) -> Dict[str, Any]:
+        """
+        Build the PDF paragraph styles once and share them between renders.
+        """
+        if self._styles is None:
+            with self._styles_lock:
+                if self._styles is None:
+                    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+                    from reportlab.lib.enums import TA_CENTER
+
+                    styles = getSampleStyleSheet()
+                    self._styles = {
+                        "title": ParagraphStyle(
+                            'CustomTitle',
+                            parent=styles['Heading1'],
+                            fontSize=24,
+                            textColor='#1a1a1a',
+                            spaceAfter=30,
+                            alignment=TA_CENTER
+                        ),
+                        "heading": ParagraphStyle(
+                            'CustomHeading',
+                            parent=styles['Heading2'],
+                            fontSize=16,
+                            textColor='#2c3e50',
+                            spaceAfter=12,
+                            spaceBefore=20
+                        ),
+                        "normal": ParagraphStyle(
+                            'CustomNormal',
+                            parent=styles['Normal'],
+                            fontSize=11,
+                            textColor='#333333',
+                            spaceAfter=12,
+                            leading=14
+                        ),
+                        "timestamp": ParagraphStyle(
+                            'CustomTimestamp',
+                            parent=styles['Heading4'],
+                            fontSize=11,
+                            textColor='#7f8c8d',
+                            spaceAfter=4,
+                            spaceBefore=10
+                        ),
+                    }
+        return self._styles
     
-    async def export_to_pdf(self, transcript: str, notes: dict) -> str:
+    async def export_to_pdf(
+        self,
+        transcript: str,
+        notes: dict,
+        full_transcript: bool = True,
+        segments: Optional[List[dict]] = None,
+        cache_key: Optional[str] = None,
+    ) -> str:
         """
         Export notes to PDF format.
         
         Args:
             transcript: Original transcript text
             notes: Notes dictionary (from summarization service)
+            full_transcript: Include the whole transcript rather than the first 5000 characters
+            segments: Optional timed transcript ({"start", "text"} items); when
+                given, the transcript is split into sections with timestamp headings
+            cache_key: Key to cache the export under instead of hashing the
+                content (see note_export_key)
             
         Returns:
             Path to generated PDF file
         """
+        return await self._export(
+            "pdf", self._render_pdf, transcript, notes, cache_key=cache_key,
+            full_transcript=full_transcript, segments=segments
+        )
+
+    def _render_pdf(
+        self,
+        pdf_path: str,
+        transcript: str,
+        notes: dict,
+        full_transcript: bool = True,
+        segments: Optional[List[dict]] = None,
+    ) -> None:
+        """
+        Render the notes PDF. Blocking; runs on the export pool.
+        """
+        # reportlab is only needed for PDF export, so it is imported on first use
+        from reportlab.lib.pagesizes import letter
+        from reportlab.lib.units import inch
+        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
+        from .pdf_flowables import transcript_flowables
+
         try:
-            # Create temporary PDF file
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            pdf_path = self.export_dir / f"notes_{timestamp}.pdf"
-            
             # Create PDF document
-            doc = SimpleDocTemplate(str(pdf_path), pagesize=letter)
+            doc = SimpleDocTemplate(pdf_path, pagesize=letter)
             story = []
             
-            # Define styles
-            styles = getSampleStyleSheet()
-            title_style = ParagraphStyle(
-                'CustomTitle',
-                parent=styles['Heading1'],
-                fontSize=24,
-                textColor='#1a1a1a',
-                spaceAfter=30,
-                alignment=TA_CENTER
-            )
-            heading_style = ParagraphStyle(
-                'CustomHeading',
-                parent=styles['Heading2'],
-                fontSize=16,
-                textColor='#2c3e50',
-                spaceAfter=12,
-                spaceBefore=20
-            )
-            normal_style = ParagraphStyle(
-                'CustomNormal',
-                parent=styles['Normal'],
-                fontSize=11,
-                textColor='#333333',
-                spaceAfter=12,
-                leading=14
-            )
+            styles = self._get_styles()
+            title_style = styles["title"]
+            heading_style = styles["heading"]
+            normal_style = styles["normal"]
             
             # Title
             story.append(Paragraph("AutoNotes Pro - Generated Notes", title_style))
-            story.append(Spacer(1, 0.2*inch))
-            story.append(Paragraph(f"Generated on: {datetime.now().strftime('%B %d, %Y at %I:%M %p')}", normal_style))
-            story.append(Spacer(1, 0.3*inch))
+            story.append(Spacer(1, 0.5*inch))
             
             # Notes content
             notes_text = notes.get("formatted", "")
@@ -100,40 +275,52 @@ class ExportService:
             story.append(Paragraph("Full Transcript", heading_style))
             story.append(Spacer(1, 0.2*inch))
             
-            # Truncate transcript if too long for PDF
-            transcript_preview = transcript[:5000] + "..." if len(transcript) > 5000 else transcript
-            story.append(Paragraph(transcript_preview.replace('\n', '<br/>'), normal_style))
+            if full_transcript:
+                sections = self._transcript_sections(transcript, segments)
+            else:
+                preview = transcript[:TRANSCRIPT_PREVIEW_CHARS]
+                sections = [(None, preview + "..." if len(transcript) > TRANSCRIPT_PREVIEW_CHARS else preview)]
+            story.extend(transcript_flowables(sections, normal_style, styles["timestamp"], self.paragraph_chars))
             
             # Build PDF
             doc.build(story)
-            
-            return str(pdf_path)
         
         except Exception as e:
             raise ValueError(f"Error generating PDF: {str(e)}")
     
-    async def export_to_txt(self, transcript: str, notes: dict) -> str:
+    async def export_to_txt(
+        self,
+        transcript: str,
+        notes: dict,
+        segments: Optional[List[dict]] = None,
+        cache_key: Optional[str] = None,
+    ) -> str:
         """
         Export notes to TXT format.
         
         Args:
             transcript: Original transcript text
             notes: Notes dictionary (from summarization service)
+            segments: Optional timed transcript, as for export_to_pdf
+            cache_key: As for export_to_pdf
             
         Returns:
             Path to generated TXT file
         """
+        return await self._export(
+            "txt", self._render_txt, transcript, notes, cache_key=cache_key, segments=segments
+        )
+
+    def _render_txt(self, txt_path: str, transcript: str, notes: dict, segments: Optional[List[dict]] = None) -> None:
+        """
+        Write the notes TXT file. Blocking; runs on the export pool.
+        """
         try:
-            # Create temporary TXT file
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            txt_path = self.export_dir / f"notes_{timestamp}.txt"
-            
             # Write content to file
             with open(txt_path, 'w', encoding='utf-8') as f:
                 f.write("=" * 60 + "\n")
                 f.write("AutoNotes Pro - Generated Notes\n")
                 f.write("=" * 60 + "\n\n")
-                f.write(f"Generated on: {datetime.now().strftime('%B %d, %Y at %I:%M %p')}\n\n")
                 f.write("-" * 60 + "\n\n")
                 
                 # Write notes
@@ -145,10 +332,43 @@ class ExportService:
                 f.write("-" * 60 + "\n\n")
                 f.write("Full Transcript\n")
                 f.write("-" * 60 + "\n\n")
-                f.write(transcript)
-            
-            return str(txt_path)
+                for heading, text in self._transcript_sections(transcript, segments):
+                    if heading:
+                        f.write(f"\n{heading}\n")
+                    f.write(text)
+                    f.write("\n")
         
         except Exception as e:
             raise ValueError(f"Error generating TXT: {str(e)}")
 
+    def _transcript_sections(
+        self, transcript: str, segments: Optional[List[dict]]
+    ) -> List[Tuple[Optional[str], str]]:
+        """
+        Group a timed transcript into (timestamp heading, text) sections of
+        section_seconds each; an untimed transcript is one section without a heading.
+        """
+        if not segments:
+            return [(None, transcript)]
+
+        sections = []
+        current_index = None
+        texts: List[str] = []
+        for segment in segments:
+            index = int(float(segment.get("start", 0)) // self.section_seconds)
+            if index != current_index and texts:
+                sections.append((_format_timestamp(current_index * self.section_seconds), " ".join(texts)))
+                texts = []
+            current_index = index
+            texts.append(str(segment.get("text", "")).strip())
+        if texts:
+            sections.append((_format_timestamp(current_index * self.section_seconds), " ".join(texts)))
+        return sections
+
+
+def _format_timestamp(seconds: float) -> str:
+    """
+    Format seconds as [h:mm:ss].
+    """
+    seconds = int(seconds)
+    return f"[{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}]"
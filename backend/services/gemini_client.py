@@ -0,0 +1,242 @@
+"""
+Lazy, configure-once access to the Google Gemini SDK, shared model objects,
+and lifecycle management for uploaded files.
+
+google.generativeai pulls in grpc and protobuf, so it is imported on first
+use rather than when the services are imported.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, Iterator, List, Optional
+
+from .metrics import CACHE_LOOKUPS, timed_stage
+
+logger = logging.getLogger(__name__)
+
+_genai = None
+_lock = threading.Lock()
+
+
+def get_genai():
+    """
+    Import google.generativeai and configure it with GOOGLE_API_KEY on first call.
+    """
+    global _genai
+    if _genai is None:
+        with _lock:
+            if _genai is None:
+                import google.generativeai as genai
+
+                api_key = os.getenv("GOOGLE_API_KEY")
+                if api_key:
+                    genai.configure(api_key=api_key)
+                _genai = genai
+    return _genai
+
+
+_models = {}
+
+
+def get_model(model_name: str):
+    """
+    Return a shared GenerativeModel for the given name, creating it on first use.
+    """
+    model = _models.get(model_name)
+    if model is None:
+        genai = get_genai()
+        with _lock:
+            model = _models.get(model_name)
+            if model is None:
+                model = genai.GenerativeModel(model_name)
+                _models[model_name] = model
+    return model
+
+
+def hash_file(file_path: str) -> str:
+    """
+    SHA-256 of a file's contents.
+    """
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class GeminiFileManager:
+    """
+    Tracks files uploaded to the Gemini File API.
+
+    Uploads are keyed by content hash, so retries and repeat requests for the
+    same audio reuse the remote file while it is still alive (the API keeps
+    files for 48 hours). Files are deleted once the caller is done with them,
+    and the total size of live remote files is kept under a quota by deleting
+    the oldest unused uploads first.
+
+    ``api`` is anything with ``upload_file(path=...)``, ``get_file(name)`` and
+    ``delete_file(name)``; it defaults to the google.generativeai module and can
+    be replaced with a local fake in tests. Uploads go through ``limiter``
+    (a RateLimiter) when one is given.
+    """
+
+    def __init__(
+        self,
+        api: Any = None,
+        ttl_seconds: Optional[float] = None,
+        quota_bytes: Optional[int] = None,
+        processing_timeout: float = 300.0,
+        poll_interval: float = 2.0,
+        limiter: Any = None,
+    ):
+        self._api = api
+        self.limiter = limiter
+        # Stay safely inside the remote 48 hour lifetime
+        self.ttl_seconds = ttl_seconds or float(os.getenv("GEMINI_FILE_TTL_SECONDS", str(47 * 3600)))
+        self.quota_bytes = quota_bytes or int(os.getenv("GEMINI_FILE_QUOTA_MB", str(20 * 1024))) * 1024 * 1024
+        self.processing_timeout = processing_timeout
+        self.poll_interval = poll_interval
+
+        self._files: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        # One upload lock per content hash, with the number of acquires using it;
+        # dropped when the last one leaves so the dict doesn't grow per file
+        self._hash_locks: Dict[str, List[Any]] = {}
+        self._counters = {"uploads": 0, "reuses": 0, "deletes": 0, "bytes_uploaded": 0}
+
+    @property
+    def api(self):
+        if self._api is None:
+            self._api = get_genai()
+        return self._api
+
+    def acquire(self, file_path: str, content_hash: Optional[str] = None) -> Any:
+        """
+        Return a remote file handle for a local file, uploading it only if needed.
+
+        Every acquire must be paired with release(). Blocking.
+        """
+        content_hash = content_hash or hash_file(file_path)
+
+        # Concurrent acquires of the same content wait for a single upload
+        with self._upload_lock(content_hash):
+            with self._lock:
+                self._drop_expired(time.time())
+                entry = self._files.get(content_hash)
+                if entry is not None:
+                    entry["refs"] += 1
+                    self._counters["reuses"] += 1
+                    CACHE_LOOKUPS.inc(cache="gemini_files", result="hit")
+                    return entry["file"]
+            CACHE_LOOKUPS.inc(cache="gemini_files", result="miss")
+
+            size = os.path.getsize(file_path)
+            self._make_room(size)
+
+            logger.info("Uploading audio to Gemini...")
+            with timed_stage("gemini_upload"):
+                with self.limiter.limit_sync() if self.limiter else nullcontext():
+                    remote_file = self.api.upload_file(path=file_path)
+                remote_file = self._wait_until_active(remote_file)
+            logger.info("Uploaded file: %s", remote_file.uri)
+
+            with self._lock:
+                self._files[content_hash] = {
+                    "file": remote_file,
+                    "size": size,
+                    "uploaded_at": time.time(),
+                    "refs": 1,
+                }
+                self._counters["uploads"] += 1
+                self._counters["bytes_uploaded"] += size
+            return remote_file
+
+    @contextmanager
+    def _upload_lock(self, content_hash: str) -> Iterator[None]:
+        with self._lock:
+            entry = self._hash_locks.setdefault(content_hash, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._hash_locks[content_hash]
+
+    def release(self, content_hash: str, delete: bool = True) -> None:
+        """
+        Drop a reference taken by acquire().
+
+        With ``delete`` the remote file is removed once nobody is using it;
+        pass ``delete=False`` to keep it around for a retry.
+        """
+        with self._lock:
+            entry = self._files.get(content_hash)
+            if entry is None:
+                return
+            entry["refs"] = max(entry["refs"] - 1, 0)
+            if not delete or entry["refs"] > 0:
+                return
+            del self._files[content_hash]
+        self._delete_remote(entry["file"])
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Upload/reuse counters and current remote usage.
+        """
+        with self._lock:
+            return {
+                **self._counters,
+                "live_files": len(self._files),
+                "live_bytes": sum(entry["size"] for entry in self._files.values()),
+                "quota_bytes": self.quota_bytes,
+            }
+
+    def _wait_until_active(self, remote_file: Any) -> Any:
+        """Poll until the API has finished processing the upload."""
+        deadline = time.time() + self.processing_timeout
+        while getattr(getattr(remote_file, "state", None), "name", "ACTIVE") == "PROCESSING":
+            if time.time() > deadline:
+                raise TimeoutError("Gemini is still processing the uploaded file.")
+            time.sleep(self.poll_interval)
+            remote_file = self.api.get_file(remote_file.name)
+        if getattr(getattr(remote_file, "state", None), "name", "ACTIVE") == "FAILED":
+            raise ValueError("Gemini could not process the uploaded file.")
+        return remote_file
+
+    def _make_room(self, size: int) -> None:
+        """Delete the oldest unused uploads until ``size`` more bytes fit in the quota."""
+        victims = []
+        with self._lock:
+            used = sum(entry["size"] for entry in self._files.values())
+            for content_hash, entry in sorted(self._files.items(), key=lambda item: item[1]["uploaded_at"]):
+                if used + size <= self.quota_bytes:
+                    break
+                if entry["refs"] == 0:
+                    victims.append(entry["file"])
+                    used -= entry["size"]
+                    del self._files[content_hash]
+        for remote_file in victims:
+            self._delete_remote(remote_file)
+
+    def _drop_expired(self, now: float) -> None:
+        """Forget uploads the API has already expired. Caller holds the lock."""
+        for content_hash in [
+            content_hash for content_hash, entry in self._files.items()
+            if now - entry["uploaded_at"] > self.ttl_seconds
+        ]:
+            del self._files[content_hash]
+
+    def _delete_remote(self, remote_file: Any) -> None:
+        try:
+            self.api.delete_file(remote_file.name)
+            with self._lock:
+                self._counters["deletes"] += 1
+        except Exception as e:
+            # The file expires on its own anyway
+            logger.warning("Could not delete Gemini file %s: %s", remote_file.name, e)
@@ -0,0 +1,178 @@
+"""
+Hedged execution of a fast primary path with a slower backup path.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from .metrics import FALLBACKS
+
+logger = logging.getLogger(__name__)
+
+
+class HedgeError(Exception):
+    """
+    Raised when both the primary and the backup path failed.
+    """
+
+    def __init__(self, errors: Dict[str, Exception]):
+        self.errors = errors
+        super().__init__("; ".join(f"{name}: {error}" for name, error in errors.items()))
+
+
+class HedgeService:
+    """
+    Runs a primary coroutine and, if it has not succeeded within a deadline,
+    starts a backup in parallel. Whichever succeeds first wins and the other
+    is cancelled. If the primary fails before the deadline, the backup starts
+    immediately. A deadline of 0 disables hedging: the backup only runs after
+    the primary has failed.
+
+    Per-path win counts and latencies are recorded so the deadline can be tuned.
+    """
+
+    def __init__(
+        self,
+        deadline_seconds: Optional[float] = None,
+        primary_name: str = "primary",
+        backup_name: str = "backup",
+        sample_size: int = 500,
+    ):
+        self.deadline_seconds = (
+            deadline_seconds if deadline_seconds is not None
+            else float(os.getenv("HEDGE_DEADLINE_SECONDS", "4"))
+        )
+        self.primary_name = primary_name
+        self.backup_name = backup_name
+        self._paths = {
+            name: {"started": 0, "wins": 0, "failures": 0, "cancelled": 0, "latencies": deque(maxlen=sample_size)}
+            for name in (primary_name, backup_name)
+        }
+        self._hedges = 0
+        self._requests = 0
+
+    async def run(
+        self,
+        primary: Callable[[], Awaitable[Any]],
+        backup: Callable[[], Awaitable[Any]],
+        primary_admitted: Optional[asyncio.Event] = None,
+    ) -> Tuple[Any, str]:
+        """
+        Run the hedged pair.
+
+        Args:
+            primary: Factory for the preferred path
+            backup: Factory for the path started on a slow or failed primary
+            primary_admitted: Set by the primary once its request is actually
+                under way (e.g. let through a rate limiter). When given, the
+                deadline counts from then, so time spent queued doesn't start
+                the backup.
+
+        Returns:
+            Tuple of (result, name of the winning path)
+
+        Raises:
+            HedgeError: If both paths fail
+        """
+        self._requests += 1
+        primary_task = asyncio.create_task(self._timed(self.primary_name, primary))
+        tasks = {primary_task: self.primary_name}
+        errors: Dict[str, Exception] = {}
+
+        timeout = self.deadline_seconds if self.deadline_seconds > 0 else None
+        backup_started = False
+        try:
+            if timeout is not None and primary_admitted is not None:
+                admitted = asyncio.create_task(primary_admitted.wait())
+                try:
+                    await asyncio.wait({primary_task, admitted}, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    admitted.cancel()
+            done, _ = await asyncio.wait(tasks, timeout=timeout)
+
+            while True:
+                for task in done:
+                    name = tasks.pop(task)
+                    if task.cancelled():
+                        # Cancelled from outside (e.g. a shared fetch it joined
+                        # was torn down); counts as this path failing
+                        self._paths[name]["cancelled"] += 1
+                        errors[name] = RuntimeError(f"{name} was cancelled")
+                        continue
+                    if task.exception() is None:
+                        self._paths[name]["wins"] += 1
+                        return task.result(), name
+                    errors[name] = task.exception()
+
+                if not backup_started:
+                    backup_started = True
+                    if errors:
+                        FALLBACKS.inc(fallback=self.backup_name, reason=f"{self.primary_name}_failed")
+                        logger.warning(
+                            "%s failed (%s). Starting %s...", self.primary_name, errors[self.primary_name], self.backup_name
+                        )
+                    else:
+                        self._hedges += 1
+                        FALLBACKS.inc(fallback=self.backup_name, reason=f"{self.primary_name}_slow")
+                        logger.info(
+                            "%s slower than %.1fs. Starting %s in parallel...",
+                            self.primary_name, self.deadline_seconds, self.backup_name
+                        )
+                    tasks[asyncio.create_task(self._timed(self.backup_name, backup))] = self.backup_name
+
+                if not tasks:
+                    raise HedgeError(errors)
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            # Cancel the loser (or everything, if we were cancelled ourselves)
+            for task, name in tasks.items():
+                if not task.done():
+                    task.cancel()
+                    self._paths[name]["cancelled"] += 1
+
+    async def _timed(self, name: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        stats = self._paths[name]
+        stats["started"] += 1
+        started = time.perf_counter()
+        try:
+            result = await factory()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            stats["failures"] += 1
+            raise
+        stats["latencies"].append(time.perf_counter() - started)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Win rate and successful-latency percentiles per path.
+        """
+        paths = {}
+        for name, stats in self._paths.items():
+            latencies = sorted(stats["latencies"])
+            paths[name] = {
+                "started": stats["started"],
+                "wins": stats["wins"],
+                "failures": stats["failures"],
+                "cancelled": stats["cancelled"],
+                "win_rate": round(stats["wins"] / self._requests, 4) if self._requests else 0.0,
+                "latency_p50": self._percentile(latencies, 0.5),
+                "latency_p90": self._percentile(latencies, 0.9),
+                "latency_p99": self._percentile(latencies, 0.99),
+            }
+        return {
+            "deadline_seconds": self.deadline_seconds,
+            "requests": self._requests,
+            "hedges_started": self._hedges,
+            "paths": paths,
+        }
+
+    @staticmethod
+    def _percentile(values: list, fraction: float) -> Optional[float]:
+        if not values:
+            return None
+        return round(values[min(int(len(values) * fraction), len(values) - 1)], 3)
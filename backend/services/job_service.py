@@ -0,0 +1,388 @@
+"""
+Persistent background job queue for long-running note generation.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .tracing import start_trace
+
+logger = logging.getLogger(__name__)
+
+# A job handler receives the submitted payload and a progress callback
+# ``report(stage, percent)`` and returns a JSON-serializable result.
+ProgressCallback = Callable[[str, int], None]
+JobHandler = Callable[[Dict[str, Any], ProgressCallback], Awaitable[Dict[str, Any]]]
+# Optional per-kind cleanup, called with the payload once a job is finished for good
+JobCleanup = Callable[[Dict[str, Any]], None]
+
+
+class JobService:
+    """
+    SQLite-backed job queue with an asyncio worker pool.
+
+    The workers' queue writes (claims, progress, leases and results) run in
+    order on a single writer thread, so SQLite never blocks the event loop.
+
+    Running jobs hold a lease that their worker renews while the handler runs.
+    If a worker dies or the server restarts mid-job, the lease expires and the
+    job is picked up again (up to ``max_attempts`` times), so submitted work
+    survives restarts and can be shared by several uvicorn worker processes.
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        concurrency: Optional[int] = None,
+        lease_seconds: Optional[float] = None,
+        max_attempts: Optional[int] = None,
+        poll_interval: float = 1.0,
+    ):
+        if db_path is None:
+            jobs_dir = Path(os.getenv("JOBS_DIR", "jobs"))
+            jobs_dir.mkdir(parents=True, exist_ok=True)
+            db_path = str(jobs_dir / "jobs.db")
+        self.db_path = db_path
+        self.concurrency = concurrency or int(os.getenv("JOB_WORKERS", "2"))
+        self.lease_seconds = lease_seconds or float(os.getenv("JOB_LEASE_SECONDS", "60"))
+        self.max_attempts = max_attempts or int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+        self.poll_interval = poll_interval
+
+        self._handlers: Dict[str, JobHandler] = {}
+        self._cleanups: Dict[str, JobCleanup] = {}
+        self._workers = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._lock = threading.Lock()
+        # Queue writes (claims, progress, results) run here, in order, off the event loop
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-writer")
+
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                stage TEXT,
+                progress INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_expires REAL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+        self._conn.commit()
+
+    def register(self, kind: str, handler: JobHandler, cleanup: Optional[JobCleanup] = None) -> None:
+        """
+        Register the coroutine that runs jobs of the given kind.
+
+        Args:
+            kind: Job kind passed to ``submit``
+            handler: Coroutine that runs the job
+            cleanup: Called with the payload once the job has completed or
+                failed for good (including running out of attempts), to
+                release what the payload refers to. Not called when a job is
+                interrupted, since it will be retried.
+        """
+        self._handlers[kind] = handler
+        if cleanup is not None:
+            self._cleanups[kind] = cleanup
+
+    def submit(self, kind: str, payload: Dict[str, Any]) -> str:
+        """
+        Queue a job and return its ID immediately. Blocking; async code should
+        call it through asyncio.to_thread.
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO jobs (id, kind, payload, status, stage, created_at, updated_at)
+                VALUES (?, ?, ?, 'queued', 'queued', ?, ?)
+                """,
+                (job_id, kind, json.dumps(payload), now, now),
+            )
+            self._conn.commit()
+        if self._wakeup is not None:
+            # submit() may be called from a worker thread
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Return the status, stage progress and (once finished) result of a job.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                """
+                SELECT id, kind, status, stage, progress, result, error, attempts, created_at, updated_at
+                FROM jobs WHERE id = ?
+                """,
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+
+        job_id, kind, status, stage, progress, result, error, attempts, created_at, updated_at = row
+        return {
+            "job_id": job_id,
+            "kind": kind,
+            "status": status,
+            "stage": stage,
+            "progress": progress,
+            "result": json.loads(result) if result else None,
+            "error": error,
+            "attempts": attempts,
+            "created_at": created_at,
+            "updated_at": updated_at,
+        }
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Number of jobs in each status.
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+    async def start(self) -> None:
+        """
+        Start the worker pool. Call from the application's startup hook.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._workers = [
+            asyncio.create_task(self._worker_loop(index)) for index in range(self.concurrency)
+        ]
+        logger.info("Job workers started: %d", self.concurrency)
+
+    async def stop(self) -> None:
+        """
+        Stop the worker pool. Interrupted jobs are retried after their lease expires.
+        """
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._wakeup = None
+
+    async def _write(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Run a blocking queue operation on the writer thread, off the event loop.
+        """
+        return await asyncio.get_running_loop().run_in_executor(self._writer, partial(func, *args, **kwargs))
+
+    def _claim(self) -> Optional[tuple]:
+        """
+        Claim the next job and release the payloads of jobs that ran out of attempts. Blocking.
+        """
+        claimed, exhausted = self._claim_next()
+        for kind, payload in exhausted:
+            self._cleanup(kind, json.loads(payload))
+        return claimed
+
+    def _claim_next(self) -> Tuple[Optional[tuple], List[tuple]]:
+        """
+        Atomically claim the oldest queued job, or a running job whose lease expired.
+
+        Returns:
+            The claimed ``(id, kind, payload, attempt)`` or None, and the
+            ``(kind, payload)`` of jobs just failed for exhausting their attempts.
+            ``attempt`` identifies this claim: a later reclaim of the job
+            increments it, which revokes this claim's right to update the job.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Jobs that exhausted their attempts after repeated crashes are failed for good
+                exhausted = self._conn.execute(
+                    """
+                    SELECT kind, payload FROM jobs
+                    WHERE status = 'running' AND lease_expires < ? AND attempts >= ?
+                    """,
+                    (now, self.max_attempts),
+                ).fetchall()
+                self._conn.execute(
+                    """
+                    UPDATE jobs SET status = 'failed', error = 'Job was interrupted too many times.',
+                        updated_at = ?
+                    WHERE status = 'running' AND lease_expires < ? AND attempts >= ?
+                    """,
+                    (now, now, self.max_attempts),
+                )
+                row = self._conn.execute(
+                    """
+                    SELECT id, kind, payload, attempts FROM jobs
+                    WHERE status = 'queued' OR (status = 'running' AND lease_expires < ?)
+                    ORDER BY created_at ASC LIMIT 1
+                    """,
+                    (now,),
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        """
+                        UPDATE jobs SET status = 'running', attempts = attempts + 1,
+                            lease_expires = ?, updated_at = ?
+                        WHERE id = ?
+                        """,
+                        (now + self.lease_seconds, now, row[0]),
+                    )
+                    row = (row[0], row[1], row[2], row[3] + 1)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return row, exhausted
+
+    def _update(self, job_id: str, attempt: Optional[int] = None, **fields: Any) -> bool:
+        """
+        Update a job's columns. With ``attempt``, only while that claim still
+        owns the job (it is running and has not been reclaimed since).
+
+        Returns:
+            Whether the job was updated
+        """
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        condition, params = "id = ?", [job_id]
+        if attempt is not None:
+            condition += " AND status = 'running' AND attempts = ?"
+            params.append(attempt)
+        with self._lock:
+            updated = self._conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE {condition}",
+                (*fields.values(), *params),
+            ).rowcount
+            self._conn.commit()
+        return updated > 0
+
+    def _report_progress(self, job_id: str, attempt: int, stage: str, percent: int) -> None:
+        try:
+            self._update(job_id, attempt, stage=stage, progress=percent)
+        except sqlite3.Error as e:
+            # Progress is advisory; the job itself carries on
+            logger.warning("Could not record progress for job %s: %s", job_id, e)
+
+    def _finish(self, job_id: str, kind: str, payload: Dict[str, Any], attempt: int, **fields: Any) -> None:
+        """
+        Record a job's final state, then release its payload. Blocking.
+
+        A run whose job was reclaimed after its lease expired leaves both to
+        the worker that now owns the job.
+        """
+        if not self._update(job_id, attempt, lease_expires=None, **fields):
+            logger.warning("Job %s was reclaimed by another worker; discarding this run's outcome", job_id)
+            return
+        self._cleanup(kind, payload)
+
+    def _cleanup(self, kind: str, payload: Dict[str, Any]) -> None:
+        cleanup = self._cleanups.get(kind)
+        if cleanup is None:
+            return
+        try:
+            cleanup(payload)
+        except Exception:
+            logger.exception("Cleanup of a finished %s job failed", kind)
+
+    async def _renew_lease(self, job_id: str, attempt: int) -> None:
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                renewed = await self._write(
+                    self._update, job_id, attempt, lease_expires=time.time() + self.lease_seconds
+                )
+            except sqlite3.Error as e:
+                # Try again next interval; the lease outlasts a few missed renewals
+                logger.warning("Could not renew the lease of job %s: %s", job_id, e)
+                continue
+            if not renewed:
+                logger.warning("Job %s was reclaimed by another worker; no longer renewing its lease", job_id)
+                return
+
+    async def _worker_loop(self, index: int) -> None:
+        while True:
+            try:
+                claimed = await self._write(self._claim)
+            except sqlite3.OperationalError as e:
+                logger.warning("Job worker %d: queue busy (%s), retrying", index, e)
+                claimed = None
+
+            if claimed is None:
+                # Sleep until a local submit wakes us, or poll for jobs queued by other processes
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            job_id, kind, payload, attempt = claimed
+            await self._run_job(job_id, kind, json.loads(payload), attempt)
+
+    async def _run_job(self, job_id: str, kind: str, payload: Dict[str, Any], attempt: int) -> None:
+        handler = self._handlers.get(kind)
+        if handler is None:
+            await self._write(
+                self._finish, job_id, kind, payload, attempt,
+                status="failed", error=f"No handler registered for job kind '{kind}'"
+            )
+            return
+
+        def report(stage: str, percent: int) -> None:
+            # Queued behind earlier writes on the writer thread, so the handler never waits on SQLite
+            self._writer.submit(self._report_progress, job_id, attempt, stage, percent)
+
+        # Each run is traced under the job ID, so its logs and spans can be found from it
+        with start_trace("job", trace_id=job_id, kind=kind):
+            await self._run_traced_job(job_id, kind, handler, payload, attempt, report)
+
+    async def _run_traced_job(
+        self,
+        job_id: str,
+        kind: str,
+        handler: JobHandler,
+        payload: Dict[str, Any],
+        attempt: int,
+        report: ProgressCallback,
+    ) -> None:
+        lease = asyncio.create_task(self._renew_lease(job_id, attempt))
+        try:
+            result = await handler(payload, report)
+            outcome = {
+                "status": "completed", "stage": "completed", "progress": 100, "result": json.dumps(result)
+            }
+        except asyncio.CancelledError:
+            # Server shutting down; leave the job 'running' (and its payload in
+            # place) so its lease expires and it is retried
+            raise
+        except Exception as e:
+            error_message = getattr(e, "detail", None) or str(e)
+            logger.warning("Job %s failed: %s", job_id, error_message)
+            outcome = {"status": "failed", "error": str(error_message)}
+        finally:
+            lease.cancel()
+        # Shielded: once the job has an outcome, a shutdown must not separate
+        # recording it from releasing the payload
+        await asyncio.shield(self._write(self._finish, job_id, kind, payload, attempt, **outcome))
@@ -0,0 +1,67 @@
+"""
+Structured logging for the backend: every record carries the current trace ID.
+"""
+import json
+import logging
+import os
+import time
+from typing import Optional
+
+from .tracing import current_trace_id
+
+# Attributes every LogRecord has; anything else was passed with ``extra=``
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "trace_id"}
+
+
+class TraceIdFilter(logging.Filter):
+    """
+    Adds ``trace_id`` (or "-" outside a trace) to each record.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = current_trace_id() or "-"
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line, including any ``extra=`` fields.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "trace_id": getattr(record, "trace_id", "-"),
+        }
+        for name, value in vars(record).items():
+            if name not in _RECORD_ATTRIBUTES and not name.startswith("_"):
+                entry[name] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level: Optional[str] = None, fmt: Optional[str] = None) -> None:
+    """
+    Send the services' logs to stderr, as JSON lines (LOG_FORMAT=json, the
+    default) or readable text (LOG_FORMAT=text), at LOG_LEVEL.
+    """
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    fmt = fmt or os.getenv("LOG_FORMAT", "json")
+
+    handler = logging.StreamHandler()
+    handler.addFilter(TraceIdFilter())
+    if fmt == "text":
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(trace_id)s] %(message)s"))
+    else:
+        handler.setFormatter(JsonFormatter())
+
+    # The services log under "services.*" and the app under "main"
+    for name in ("services", "main", "__main__"):
+        logger = logging.getLogger(name)
+        logger.handlers = [handler]
+        logger.setLevel(level)
+        logger.propagate = False
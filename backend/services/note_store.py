@@ -0,0 +1,354 @@
+"""
+Persistent storage and full-text search for generated transcripts and notes.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class NoteStore:
+    """
+    SQLite library of generated results, addressed by note ID.
+
+    Note IDs are derived from the transcript and notes, so storing the same
+    result twice yields the same ID and a stored note never changes. That
+    makes the ID usable as a cache key for anything rendered from the note.
+
+    Notes and transcripts are indexed with FTS5 for ranked search. Writes are
+    buffered in memory and committed in batches by a background thread, so
+    saving a result costs the request almost nothing. Buffered notes are
+    already visible to get(), and are committed before a listing or search.
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        batch_size: Optional[int] = None,
+        flush_seconds: Optional[float] = None,
+    ):
+        if db_path is None:
+            notes_dir = Path(os.getenv("NOTES_DIR", "notes"))
+            notes_dir.mkdir(parents=True, exist_ok=True)
+            db_path = str(notes_dir / "notes.db")
+        self.db_path = db_path
+        self.batch_size = batch_size or int(os.getenv("NOTE_STORE_BATCH_SIZE", "50"))
+        self.flush_seconds = flush_seconds or float(os.getenv("NOTE_STORE_FLUSH_SECONDS", "1.0"))
+        self._lock = threading.Lock()
+
+        # Notes saved but not yet committed, by note ID
+        self._pending: Dict[str, Tuple[Any, ...]] = {}
+        self._pending_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS notes (
+                id TEXT PRIMARY KEY,
+                source TEXT,
+                source_id TEXT,
+                url TEXT,
+                transcript TEXT NOT NULL,
+                notes TEXT NOT NULL,
+                notes_text TEXT NOT NULL DEFAULT '',
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(notes)")}
+        if "notes_text" not in columns:
+            self._conn.execute("ALTER TABLE notes ADD COLUMN notes_text TEXT NOT NULL DEFAULT ''")
+            self._conn.execute("UPDATE notes SET notes_text = COALESCE(json_extract(notes, '$.formatted'), '')")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_notes_source ON notes (source, source_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_notes_created ON notes (created_at)")
+
+        # External-content index: the text lives only in the notes table
+        index_exists = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'notes_fts'"
+        ).fetchone()
+        if not index_exists:
+            self._conn.execute(
+                """
+                CREATE VIRTUAL TABLE notes_fts USING fts5(
+                    notes_text, transcript,
+                    content='notes', content_rowid='rowid',
+                    tokenize='porter unicode61'
+                )
+                """
+            )
+            self._conn.execute("INSERT INTO notes_fts (notes_fts) VALUES ('rebuild')")
+        self._conn.commit()
+
+        self._writer = threading.Thread(target=self._write_loop, name="note-store-writer", daemon=True)
+        self._writer.start()
+
+    @staticmethod
+    def note_id(transcript: str, notes: Dict[str, Any]) -> str:
+        """
+        Content-derived ID for a result.
+        """
+        payload = json.dumps([transcript, notes], sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+    def save(
+        self,
+        transcript: str,
+        notes: Dict[str, Any],
+        source: Optional[str] = None,
+        source_id: Optional[str] = None,
+        url: Optional[str] = None,
+    ) -> str:
+        """
+        Queue a result for storage and return its note ID.
+
+        Args:
+            transcript: Transcript text
+            notes: Notes dictionary (from summarization service)
+            source: Where the transcript came from ("youtube" or "upload")
+            source_id: Video ID or upload content hash
+            url: Source URL, for YouTube results
+        """
+        note_id = self.note_id(transcript, notes)
+        row = (
+            note_id, source, source_id, url, transcript, json.dumps(notes),
+            notes.get("formatted") or "", time.time(),
+        )
+        with self._pending_lock:
+            self._pending.setdefault(note_id, row)
+            if len(self._pending) >= self.batch_size:
+                self._wakeup.set()
+        return note_id
+
+    def get(self, note_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Return a stored result, or None if the ID is unknown. Blocking.
+        """
+        with self._pending_lock:
+            row = self._pending.get(note_id)
+        if row is None:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT id, source, source_id, url, transcript, notes, notes_text, created_at "
+                    "FROM notes WHERE id = ?",
+                    (note_id,),
+                ).fetchone()
+        if row is None:
+            return None
+
+        note_id, source, source_id, url, transcript, notes, _, created_at = row
+        return {
+            "note_id": note_id,
+            "source": source,
+            "source_id": source_id,
+            "url": url,
+            "transcript": transcript,
+            "notes": json.loads(notes),
+            "created_at": created_at,
+        }
+
+    def exists(self, note_id: str) -> bool:
+        """
+        Whether a result is stored (or buffered) under this ID. Blocking.
+        """
+        with self._pending_lock:
+            if note_id in self._pending:
+                return True
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM notes WHERE id = ?", (note_id,)).fetchone()
+        return row is not None
+
+    def get_transcript_page(self, note_id: str, offset: int, limit: int) -> Optional[Dict[str, Any]]:
+        """
+        Return ``limit`` characters of a stored transcript starting at ``offset``,
+        without loading the rest of it. Blocking.
+
+        Returns:
+            Dictionary with "text", "offset", "total_chars" and "next_offset"
+            (None on the last page), or None if the ID is unknown
+        """
+        with self._pending_lock:
+            pending = self._pending.get(note_id)
+        if pending is not None:
+            transcript = pending[4]
+            row = (len(transcript), transcript[offset:offset + limit])
+        else:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT length(transcript), substr(transcript, ?, ?) FROM notes WHERE id = ?",
+                    (offset + 1, limit, note_id),
+                ).fetchone()
+        if row is None:
+            return None
+
+        total_chars, text = row
+        next_offset = offset + len(text)
+        return {
+            "text": text,
+            "offset": offset,
+            "total_chars": total_chars,
+            "next_offset": next_offset if next_offset < total_chars else None,
+        }
+
+    def search(self, query: str, limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
+        """
+        Full-text search over notes and transcripts, best matches first. Blocking.
+
+        Every word in the query must match (the last one as a prefix, for
+        search-as-you-type). Matches in the notes rank above matches that
+        are only in the transcript.
+
+        Returns:
+            List of results with "note_id", source fields, "score" and
+            highlighted "notes_snippet"/"transcript_snippet"
+        """
+        match = self._match_expression(query)
+        if match is None:
+            return []
+
+        self.flush()
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT n.id, n.source, n.source_id, n.url, n.created_at,
+                       snippet(notes_fts, 0, '<mark>', '</mark>', '…', 16),
+                       snippet(notes_fts, 1, '<mark>', '</mark>', '…', 16),
+                       bm25(notes_fts, 3.0, 1.0) AS score
+                FROM notes_fts JOIN notes n ON n.rowid = notes_fts.rowid
+                WHERE notes_fts MATCH ?
+                ORDER BY score
+                LIMIT ? OFFSET ?
+                """,
+                (match, limit, offset),
+            ).fetchall()
+
+        return [
+            {
+                "note_id": note_id,
+                "source": source,
+                "source_id": source_id,
+                "url": url,
+                "created_at": created_at,
+                "notes_snippet": notes_snippet,
+                "transcript_snippet": transcript_snippet,
+                # bm25() is lower-is-better; flip it so higher means more relevant
+                "score": round(-score, 4),
+            }
+            for note_id, source, source_id, url, created_at, notes_snippet, transcript_snippet, score in rows
+        ]
+
+    def list_recent(self, limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
+        """
+        Stored results, newest first, without their transcripts. Blocking.
+        """
+        self.flush()
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT id, source, source_id, url, created_at, length(transcript), substr(notes_text, 1, 300)
+                FROM notes ORDER BY created_at DESC LIMIT ? OFFSET ?
+                """,
+                (limit, offset),
+            ).fetchall()
+        return [
+            {
+                "note_id": note_id,
+                "source": source,
+                "source_id": source_id,
+                "url": url,
+                "created_at": created_at,
+                "transcript_chars": transcript_chars,
+                "notes_preview": notes_preview,
+            }
+            for note_id, source, source_id, url, created_at, transcript_chars, notes_preview in rows
+        ]
+
+    def flush(self) -> int:
+        """
+        Commit every buffered note and index it. Returns the number written. Blocking.
+        """
+        with self._pending_lock:
+            rows = list(self._pending.values())
+        if not rows:
+            return 0
+
+        with self._lock:
+            try:
+                # Only rows that are actually new get indexed
+                self._conn.execute("BEGIN")
+                for row in rows:
+                    cursor = self._conn.execute(
+                        """
+                        INSERT OR IGNORE INTO notes
+                            (id, source, source_id, url, transcript, notes, notes_text, created_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                        """,
+                        row,
+                    )
+                    if cursor.rowcount:
+                        self._conn.execute(
+                            "INSERT INTO notes_fts (rowid, notes_text, transcript) VALUES (?, ?, ?)",
+                            (cursor.lastrowid, row[6], row[4]),
+                        )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        with self._pending_lock:
+            for row in rows:
+                if self._pending.get(row[0]) is row:
+                    del self._pending[row[0]]
+        return len(rows)
+
+    def close(self) -> None:
+        """
+        Stop the background writer after committing everything buffered.
+        """
+        self._stopping = True
+        self._wakeup.set()
+        self._writer.join(timeout=30)
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Stored and buffered note counts.
+        """
+        with self._lock:
+            (stored,) = self._conn.execute("SELECT COUNT(*) FROM notes").fetchone()
+        with self._pending_lock:
+            pending = len(self._pending)
+        return {"stored": stored, "pending": pending}
+
+    def _write_loop(self) -> None:
+        while not self._stopping:
+            self._wakeup.wait(self.flush_seconds)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                # Rows stay buffered and are retried on the next flush
+                logger.exception("Note store flush failed: %s", e)
+
+    @staticmethod
+    def _match_expression(query: str) -> Optional[str]:
+        """
+        Turn free text into a safe FTS5 query: every word quoted (so user input
+        can't be parsed as FTS syntax), and the last one matched as a prefix.
+        """
+        words = re.findall(r"\w+", query)
+        if not words:
+            return None
+        terms = [f'"{word}"' for word in words]
+        terms[-1] += "*"
+        return " ".join(terms)
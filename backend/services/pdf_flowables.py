@@ -0,0 +1,101 @@
+"""
+Reportlab building blocks for long PDF exports.
+
+Imported only when a PDF is rendered, so reportlab stays out of startup.
+"""
+import re
+from typing import Iterator, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from reportlab.platypus import Flowable, Paragraph
+
+
+class LazyParagraph(Flowable):
+    """
+    A paragraph that is parsed only when reportlab lays it out and released
+    once drawn.
+
+    Building a Paragraph parses its text into fragments up front, which for a
+    multi-hour transcript means tens of megabytes held for the whole render.
+    Deferring that keeps memory to the raw text plus the current page.
+    """
+
+    def __init__(self, text: str, style):
+        super().__init__()
+        self.text = text
+        self.style = style
+        self._paragraph: Optional[Paragraph] = None
+
+    def _get_paragraph(self) -> Paragraph:
+        if self._paragraph is None:
+            self._paragraph = Paragraph(escape(self.text), self.style)
+        return self._paragraph
+
+    def wrap(self, available_width, available_height):
+        self.width, self.height = self._get_paragraph().wrap(available_width, available_height)
+        return self.width, self.height
+
+    def split(self, available_width, available_height):
+        return self._get_paragraph().split(available_width, available_height)
+
+    def draw(self):
+        self._get_paragraph().drawOn(self.canv, 0, 0)
+        self._paragraph = None
+
+    def getSpaceBefore(self):
+        return self.style.spaceBefore
+
+    def getSpaceAfter(self):
+        return self.style.spaceAfter
+
+
+def chunk_text(text: str, max_chars: int) -> Iterator[str]:
+    """
+    Split text into pieces of at most ~max_chars, preferring sentence ends,
+    then whitespace.
+    """
+    position = 0
+    length = len(text)
+    while position < length:
+        end = position + max_chars
+        if end >= length:
+            piece = text[position:]
+            position = length
+        else:
+            window = text[position:end]
+            # Last sentence end in the back half of the window, else last space
+            sentence_ends = [m.end() for m in re.finditer(r'[.!?]\s', window)]
+            cut = next((e for e in reversed(sentence_ends) if e > max_chars // 2), None)
+            if cut is None:
+                space = window.rfind(' ', max_chars // 2)
+                cut = space + 1 if space != -1 else max_chars
+            piece = window[:cut]
+            position += cut
+        piece = piece.strip()
+        if piece:
+            yield piece
+
+
+def transcript_flowables(
+    sections: List[Tuple[Optional[str], str]],
+    body_style,
+    timestamp_style,
+    paragraph_chars: int,
+) -> List[Flowable]:
+    """
+    Lay out transcript sections as lightweight, evenly sized paragraphs.
+
+    Args:
+        sections: (heading or None, text) pairs in order
+        body_style: Style for transcript text
+        timestamp_style: Style for section headings
+        paragraph_chars: Target paragraph size; small enough that no paragraph
+            spans more than a page, so reportlab never re-splits a huge one
+    """
+    flowables: List[Flowable] = []
+    for heading, text in sections:
+        if heading:
+            flowables.append(Paragraph(escape(heading), timestamp_style))
+        for piece in chunk_text(text, paragraph_chars):
+            flowables.append(LazyParagraph(piece, body_style))
+    return flowables
@@ -0,0 +1,465 @@
+"""
+Adaptive rate limiting for calls to upstream APIs (YouTube captions, Gemini).
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# Upstreams with their default limits. Each can be overridden with
+# RATE_LIMIT_<NAME>_RPS, RATE_LIMIT_<NAME>_BURST and RATE_LIMIT_<NAME>_CONCURRENCY.
+YOUTUBE_CAPTIONS = "youtube_captions"
+GEMINI_GENERATE = "gemini_generate"
+GEMINI_UPLOAD = "gemini_upload"
+
+DEFAULT_LIMITS = {
+    YOUTUBE_CAPTIONS: {"rate": 10.0, "burst": 20, "concurrency": 8},
+    GEMINI_GENERATE: {"rate": 1.0, "burst": 5, "concurrency": 4},
+    GEMINI_UPLOAD: {"rate": 0.5, "burst": 2, "concurrency": 2},
+}
+
+
+class RateLimitTimeout(ValueError):
+    """
+    Raised when a call would have to queue longer than the limiter's max wait.
+    """
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """
+    Whether an upstream error means "slow down" (HTTP 429 / quota exhausted).
+    """
+    message = str(error)
+    return (
+        "429" in message
+        or "Too Many Requests" in message
+        or "RESOURCE_EXHAUSTED" in message
+        or type(error).__name__ in ("ResourceExhausted", "TooManyRequests")
+    )
+
+
+class RateLimiter:
+    """
+    Token bucket plus AIMD concurrency window for one upstream.
+
+    Every call takes a token from the bucket (``rate`` per second, up to
+    ``burst`` saved up) and a slot in the concurrency window. Callers queue
+    for both (up to ``max_wait_seconds``) instead of failing; tokens are reserved in arrival order, so a
+    burst is spread out at the configured rate. A rate-limit error halves the
+    window and pauses the upstream for ``cooldown_seconds``; each success
+    grows the window again by about one slot per window's worth of calls.
+
+    The bucket, window size and cooldown live in SQLite, so every uvicorn
+    worker sharing ``db_path`` draws from the same quota and backs off
+    together. In-flight counts are per process. Async callers never touch
+    SQLite on the event loop, and callers queued for a slot sleep until one
+    is released here, re-reading the shared window every ``sync_interval``
+    seconds in case another process grew it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: int,
+        max_concurrency: int,
+        min_concurrency: int = 1,
+        cooldown_seconds: Optional[float] = None,
+        max_wait_seconds: Optional[float] = None,
+        db_path: Optional[str] = None,
+        sync_interval: float = 1.0,
+    ):
+        if db_path is None:
+            limits_dir = Path(os.getenv("CACHE_DIR", "cache"))
+            limits_dir.mkdir(parents=True, exist_ok=True)
+            db_path = str(limits_dir / "rate_limits.db")
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min(min_concurrency, max_concurrency)
+        self.cooldown_seconds = (
+            cooldown_seconds if cooldown_seconds is not None
+            else float(os.getenv("RATE_LIMIT_COOLDOWN_SECONDS", "5"))
+        )
+        self.max_wait_seconds = (
+            max_wait_seconds if max_wait_seconds is not None
+            else float(os.getenv("RATE_LIMIT_MAX_WAIT_SECONDS", "120"))
+        )
+        self.sync_interval = sync_interval
+
+        # _lock guards the in-process state and is never held across SQLite
+        # calls, which take _db_lock and may wait on other processes
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._in_flight = 0
+        self._waiting = 0
+        # Last known size of the shared window, and callbacks that wake callers queued for a slot
+        self._window = float(max_concurrency)
+        self._slot_waiters: Deque[Callable[[], bool]] = deque()
+        self._counters = {"calls": 0, "queued": 0, "throttled": 0, "timeouts": 0, "wait_seconds": 0.0}
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS rate_limits (
+                name TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                concurrency REAL NOT NULL,
+                cooldown_until REAL NOT NULL DEFAULT 0,
+                last_decrease REAL NOT NULL DEFAULT 0
+            )
+            """
+        )
+        self._conn.execute(
+            "INSERT OR IGNORE INTO rate_limits (name, tokens, updated_at, concurrency) VALUES (?, ?, ?, ?)",
+            (name, float(burst), time.time(), float(max_concurrency)),
+        )
+        self._conn.commit()
+        self._sync_window()
+
+    @asynccontextmanager
+    async def limit(self) -> AsyncIterator[None]:
+        """
+        Wait for a concurrency slot and a token, then run the body.
+
+        Usage:
+            async with limiter.limit():
+                response = await call_upstream()
+
+        Raises:
+            RateLimitTimeout: If the wait for a slot or a token would exceed max_wait_seconds
+        """
+        await self._acquire_slot()
+        try:
+            await asyncio.sleep(await asyncio.to_thread(self._reserve_token))
+        except BaseException:
+            self._release_slot()
+            raise
+        # The slot is freed before the outcome is recorded, so callers queued
+        # for it never wait behind the SQLite write (or a busy thread pool)
+        try:
+            yield
+        except BaseException as e:
+            self._release_slot()
+            if self._should_record(e):
+                await asyncio.to_thread(self._record, e)
+            raise
+        self._release_slot()
+        if self._should_record(None):
+            await asyncio.to_thread(self._record, None)
+
+    @contextmanager
+    def limit_sync(self) -> Iterator[None]:
+        """
+        Blocking version of limit() for code running on worker threads.
+
+        The thread is blocked for the whole wait, so run such code on a
+        dedicated executor rather than the event loop's default one.
+        """
+        self._acquire_slot_sync()
+        try:
+            time.sleep(self._reserve_token())
+        except BaseException:
+            self._release_slot()
+            raise
+        try:
+            yield
+        except BaseException as e:
+            self._release_slot()
+            if self._should_record(e):
+                self._record(e)
+            raise
+        self._release_slot()
+        if self._should_record(None):
+            self._record(None)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Configured limits, shared bucket/window state and local queue counters.
+        """
+        now = time.time()
+        with self._db_lock:
+            tokens, updated_at, concurrency, cooldown_until = self._conn.execute(
+                "SELECT tokens, updated_at, concurrency, cooldown_until FROM rate_limits WHERE name = ?",
+                (self.name,),
+            ).fetchone()
+        with self._lock:
+            counters = dict(self._counters)
+            in_flight, waiting = self._in_flight, self._waiting
+        return {
+            "rate_per_second": self.rate,
+            "burst": self.burst,
+            "tokens": round(min(self.burst, tokens + (now - updated_at) * self.rate), 3),
+            "concurrency_limit": int(concurrency),
+            "max_concurrency": self.max_concurrency,
+            "in_flight": in_flight,
+            "waiting": waiting,
+            "cooldown_remaining": round(max(cooldown_until - now, 0.0), 3),
+            **counters,
+            "wait_seconds": round(counters["wait_seconds"], 3),
+        }
+
+    async def _acquire_slot(self) -> None:
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + self.max_wait_seconds
+        with self._lock:
+            self._waiting += 1
+        try:
+            while True:
+                woken = loop.create_future()
+
+                def wake(woken: asyncio.Future = woken) -> bool:
+                    try:
+                        loop.call_soon_threadsafe(_resolve, woken)
+                    except RuntimeError:
+                        # The waiter's event loop has closed
+                        return False
+                    return True
+
+                if self._take_slot_or_wait(wake):
+                    return
+                # asyncio.wait rather than wait_for, which on some Pythons
+                # swallows a cancellation that races the wake-up
+                try:
+                    done, _ = await asyncio.wait({woken}, timeout=self._poll_timeout(deadline))
+                except asyncio.CancelledError:
+                    self._forget_waiter(wake, pass_on=True)
+                    raise
+                if not done:
+                    if time.monotonic() >= deadline:
+                        self._forget_waiter(wake, pass_on=True)
+                        raise self._slot_timeout()
+                    self._forget_waiter(wake)
+                    await asyncio.to_thread(self._sync_window)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+    def _acquire_slot_sync(self) -> None:
+        deadline = time.monotonic() + self.max_wait_seconds
+        with self._lock:
+            self._waiting += 1
+        try:
+            while True:
+                woken = threading.Event()
+
+                def wake(woken: threading.Event = woken) -> bool:
+                    woken.set()
+                    return True
+
+                if self._take_slot_or_wait(wake):
+                    return
+                if not woken.wait(self._poll_timeout(deadline)):
+                    if time.monotonic() >= deadline:
+                        self._forget_waiter(wake, pass_on=True)
+                        raise self._slot_timeout()
+                    self._forget_waiter(wake)
+                    self._sync_window()
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+    def _poll_timeout(self, deadline: float) -> float:
+        """How long a queued caller sleeps before re-reading the shared window."""
+        return max(min(self.sync_interval, deadline - time.monotonic()), 0.0)
+
+    def _slot_timeout(self) -> RateLimitTimeout:
+        with self._lock:
+            self._counters["timeouts"] += 1
+        return RateLimitTimeout(
+            f"{self.name} is at its concurrency limit and the queue is longer than "
+            f"{self.max_wait_seconds:g}s. Please try again shortly."
+        )
+
+    def _take_slot_or_wait(self, wake: Callable[[], bool]) -> bool:
+        """
+        Take a concurrency slot if the window has room for one more call here,
+        otherwise queue ``wake`` to be called when one may have freed up.
+        """
+        with self._lock:
+            if self._in_flight < self._slot_limit():
+                self._in_flight += 1
+                self._counters["calls"] += 1
+                return True
+            self._slot_waiters.append(wake)
+            return False
+
+    def _forget_waiter(self, wake: Callable[[], bool], pass_on: bool = False) -> None:
+        """
+        Drop a waiter that stopped waiting. With ``pass_on``, a wake-up it
+        already received goes to the next waiter instead of being lost.
+        """
+        with self._lock:
+            try:
+                self._slot_waiters.remove(wake)
+            except ValueError:
+                if pass_on:
+                    self._wake_waiters()
+
+    def _release_slot(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            self._wake_waiters()
+
+    def _slot_limit(self) -> int:
+        return max(int(self._window), self.min_concurrency)
+
+    def _wake_waiters(self) -> None:
+        """Wake as many queued callers as there are free slots. Call with _lock held."""
+        free = self._slot_limit() - self._in_flight
+        while free > 0 and self._slot_waiters:
+            if self._slot_waiters.popleft()():
+                free -= 1
+
+    def _set_window(self, concurrency: float) -> None:
+        with self._lock:
+            self._window = concurrency
+            self._wake_waiters()
+
+    def _sync_window(self) -> None:
+        """Re-read the shared window, which other processes may have changed."""
+        with self._db_lock:
+            (concurrency,) = self._conn.execute(
+                "SELECT concurrency FROM rate_limits WHERE name = ?", (self.name,)
+            ).fetchone()
+        self._set_window(concurrency)
+
+    def _reserve_token(self) -> float:
+        """
+        Take the next token from the shared bucket, going into debt if it is empty.
+
+        Returns:
+            Seconds to sleep before the reserved token becomes valid
+        """
+        with self._db_lock:
+            now = time.time()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                tokens, updated_at, cooldown_until, concurrency = self._conn.execute(
+                    "SELECT tokens, updated_at, cooldown_until, concurrency FROM rate_limits WHERE name = ?",
+                    (self.name,),
+                ).fetchone()
+                tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+                # Callers queued behind a debt wait for it to be repaid, and
+                # everyone waits out a cooldown after a rate-limit error.
+                wait = max(cooldown_until - now, 0.0) + max(1 - tokens, 0.0) / self.rate
+                if wait > self.max_wait_seconds:
+                    with self._lock:
+                        self._counters["timeouts"] += 1
+                    raise RateLimitTimeout(
+                        f"{self.name} is rate limited and the queue is longer than "
+                        f"{self.max_wait_seconds:g}s. Please try again shortly."
+                    )
+                self._conn.execute(
+                    "UPDATE rate_limits SET tokens = ?, updated_at = ? WHERE name = ?",
+                    (tokens - 1, now, self.name),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        self._set_window(concurrency)
+        if wait > 0:
+            with self._lock:
+                self._counters["queued"] += 1
+                self._counters["wait_seconds"] += wait
+        return wait
+
+    def _should_record(self, error: Optional[BaseException]) -> bool:
+        """
+        Whether a call's outcome changes the window: a rate-limit error, or a
+        success while the window is below its maximum.
+        """
+        if error is None:
+            return self._window < self.max_concurrency
+        return is_rate_limit_error(error)
+
+    def _record(self, error: Optional[BaseException]) -> None:
+        """
+        Adjust the shared window: grow it after a success, halve it after a rate-limit error.
+        """
+        with self._db_lock:
+            now = time.time()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                concurrency, last_decrease = self._conn.execute(
+                    "SELECT concurrency, last_decrease FROM rate_limits WHERE name = ?",
+                    (self.name,),
+                ).fetchone()
+                if error is None:
+                    if concurrency < self.max_concurrency:
+                        concurrency = min(self.max_concurrency, concurrency + 1 / max(concurrency, 1.0))
+                        self._conn.execute(
+                            "UPDATE rate_limits SET concurrency = ? WHERE name = ?",
+                            (concurrency, self.name),
+                        )
+                elif now - last_decrease >= self.cooldown_seconds:
+                    # Calls already in flight when the first 429 arrived will
+                    # likely fail too; only back off once per cooldown.
+                    with self._lock:
+                        self._counters["throttled"] += 1
+                    concurrency = max(self.min_concurrency, concurrency / 2)
+                    logger.warning(
+                        "Rate limited by %s. Concurrency limit now %d, pausing %gs.",
+                        self.name, int(concurrency), self.cooldown_seconds
+                    )
+                    self._conn.execute(
+                        """
+                        UPDATE rate_limits SET concurrency = ?, cooldown_until = ?, last_decrease = ?
+                        WHERE name = ?
+                        """,
+                        (concurrency, now + self.cooldown_seconds, now, self.name),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        self._set_window(concurrency)
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(name: str) -> RateLimiter:
+    """
+    Return the shared limiter for one of the known upstreams, creating it on first use.
+    """
+    limiter = _limiters.get(name)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(name)
+            if limiter is None:
+                defaults = DEFAULT_LIMITS[name]
+                prefix = f"RATE_LIMIT_{name.upper()}"
+                limiter = RateLimiter(
+                    name,
+                    rate=float(os.getenv(f"{prefix}_RPS", str(defaults["rate"]))),
+                    burst=int(os.getenv(f"{prefix}_BURST", str(defaults["burst"]))),
+                    max_concurrency=int(os.getenv(f"{prefix}_CONCURRENCY", str(defaults["concurrency"]))),
+                )
+                _limiters[name] = limiter
+    return limiter
+
+
+def limiter_stats() -> Dict[str, Any]:
+    """
+    Stats for every limiter created so far in this process.
+    """
+    return {name: limiter.stats() for name, limiter in _limiters.items()}
@@ -0,0 +1,124 @@
+"""
+Coalescing of concurrent identical requests onto one in-flight pipeline.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[[str, int], None]
+
+
+class _Flight:
+    """
+    One running pipeline and the callers waiting on it.
+    """
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+        self.reporters: List[ProgressCallback] = []
+        self.last_progress: Optional[Tuple[str, int]] = None
+        self.started_at = time.time()
+
+    def report(self, stage: str, percent: int) -> None:
+        """Pass progress on to every waiter that asked for it."""
+        self.last_progress = (stage, percent)
+        for reporter in list(self.reporters):
+            reporter(stage, percent)
+
+
+class SingleFlight:
+    """
+    Runs at most one pipeline per key at a time.
+
+    The first caller for a key starts the pipeline; callers that arrive with
+    the same key while it is running wait for it instead of starting their
+    own, and all of them receive the same result (or exception). Progress is
+    passed to every waiter, and a late joiner immediately gets the latest stage.
+
+    A waiter that is cancelled (e.g. its client disconnected) leaves without
+    affecting the others; the pipeline is only cancelled when its last waiter
+    goes away.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._counters = {"started": 0, "coalesced": 0}
+
+    async def run(
+        self,
+        key: str,
+        factory: Callable[[ProgressCallback], Awaitable[Any]],
+        report: Optional[ProgressCallback] = None,
+    ) -> Any:
+        """
+        Run ``factory(report)`` for the key, or join the run already in flight.
+
+        Args:
+            key: Identity of the work (e.g. video ID or upload content hash)
+            factory: Starts the pipeline, given a progress callback
+            report: This caller's progress callback
+
+        Returns:
+            The pipeline's result
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight()
+            flight.task = asyncio.create_task(factory(flight.report))
+            flight.task.add_done_callback(lambda task: self._finish(key, flight, task))
+            self._flights[key] = flight
+            self._counters["started"] += 1
+        else:
+            self._counters["coalesced"] += 1
+            logger.info("Joining in-flight pipeline for %s (%d already waiting)", key, flight.waiters)
+            if report is not None and flight.last_progress is not None:
+                report(*flight.last_progress)
+
+        flight.waiters += 1
+        if report is not None:
+            flight.reporters.append(report)
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                # Forget the flight now rather than when the task finishes, so a
+                # caller arriving while it unwinds starts afresh instead of joining it
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+            if report is not None:
+                flight.reporters.remove(report)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Pipelines in flight with their waiter counts, and lifetime totals.
+        """
+        now = time.time()
+        return {
+            **self._counters,
+            "in_flight": len(self._flights),
+            "waiters": sum(flight.waiters for flight in self._flights.values()),
+            "flights": [
+                {
+                    "key": key,
+                    "waiters": flight.waiters,
+                    "stage": flight.last_progress[0] if flight.last_progress else None,
+                    "age_seconds": round(now - flight.started_at, 3),
+                }
+                for key, flight in self._flights.items()
+            ],
+        }
+
+    def _finish(self, key: str, flight: _Flight, task: asyncio.Task) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # Mark the outcome as retrieved even if every waiter has gone
+        if not task.cancelled():
+            task.exception()
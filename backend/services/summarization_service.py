@@ -1,6 +1,62 @@
 import os
-import google.generativeai as genai
-from typing import Dict, Any
+import asyncio
+import hashlib
+import json
+import logging
+import re
+from typing import AsyncIterator, Dict, Any, List
+
+from .cache_service import CacheService
+from .gemini_client import get_model
+from .metrics import FALLBACKS, timed_stage
+from .rate_limiter import GEMINI_GENERATE, get_limiter
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = "gemini-1.5-flash"
+
+# Bump whenever NOTES_PROMPT_TEMPLATE changes so notes cached under the old
+# prompt are no longer served.
+PROMPT_VERSION = "2"
+
+NOTES_PROMPT_TEMPLATE = """Analyze the following transcript and create well-structured notes. 
+Organize the content into clear sections with headings, bullet points, and summaries.
+
+Transcript:
+{transcript}
+
+Please create structured notes with the following format:
+1. Introduction - A brief overview of the topic
+2. Key Points - Main concepts and important information (use bullet points)
+3. Examples - Specific examples or case studies mentioned (use bullet points)
+4. Conclusion - Summary of main takeaways
+
+Format the response as clear, readable notes that would be useful for studying or reference.
+Use markdown formatting with headings (##), bullet points (-), and emphasis where appropriate."""
+
+# Map step for long transcripts: condense one chunk into intermediate notes.
+CHUNK_PROMPT_TEMPLATE = """The following is part {index} of {total} of a lecture transcript.
+Summarize this part as concise bullet points. Keep every main concept, definition,
+and specific example or case study mentioned. Do not add an introduction or conclusion.
+
+Transcript part:
+{chunk}"""
+
+# Reduce step: merge the per-chunk notes into the standard notes structure.
+REDUCE_PROMPT_TEMPLATE = """The following are partial notes taken from consecutive parts of one lecture, in order.
+Neighbouring parts overlap slightly, so merge any duplicated points.
+
+Partial notes:
+{partial_notes}
+
+Please create structured notes for the whole lecture with the following format:
+1. Introduction - A brief overview of the topic
+2. Key Points - Main concepts and important information (use bullet points)
+3. Examples - Specific examples or case studies mentioned (use bullet points)
+4. Conclusion - Summary of main takeaways
+
+Format the response as clear, readable notes that would be useful for studying or reference.
+Use markdown formatting with headings (##), bullet points (-), and emphasis where appropriate."""
 
 
 class SummarizationService:
@@ -14,68 +70,251 @@ class SummarizationService:
         """
         self.api_key = os.getenv("GOOGLE_API_KEY")
         self.mock_mode = False
+        self.model_name = MODEL_NAME
+        self.model = None
+        self.notes_cache = CacheService("notes")
+        self.limiter = get_limiter(GEMINI_GENERATE)
+        
+        # Transcripts longer than this are summarized with a chunked map-reduce
+        # pipeline instead of one huge prompt.
+        self.long_transcript_chars = int(os.getenv("SUMMARY_LONG_TRANSCRIPT_CHARS", "120000"))
+        self.chunk_chars = int(os.getenv("SUMMARY_CHUNK_CHARS", "30000"))
+        self.chunk_overlap_chars = int(os.getenv("SUMMARY_CHUNK_OVERLAP_CHARS", "1000"))
+        if not 0 <= self.chunk_overlap_chars < self.chunk_chars:
+            # An overlap as large as a chunk carries whole chunks forward, so
+            # each new chunk would advance by a single sentence
+            raise ValueError(
+                f"SUMMARY_CHUNK_OVERLAP_CHARS ({self.chunk_overlap_chars}) must be at least 0 "
+                f"and smaller than SUMMARY_CHUNK_CHARS ({self.chunk_chars})"
+            )
+        self.map_concurrency = int(os.getenv("SUMMARY_MAP_CONCURRENCY", "4"))
         
         if not self.api_key:
-            print("WARNING: GOOGLE_API_KEY not found. Summarization will be in SIMULATION MODE.")
+            logger.warning("GOOGLE_API_KEY not found. Summarization will be in SIMULATION MODE.")
             self.mock_mode = True
-        else:
-            genai.configure(api_key=self.api_key)
-            self.model = genai.GenerativeModel('gemini-1.5-flash')
             
+    def _get_model(self):
+        """
+        Get the shared Gemini model on first use (imports the SDK lazily).
+        """
+        if self.model is None:
+            self.model = get_model(self.model_name)
+        return self.model
 
-    async def generate_notes(self, transcript: str) -> Dict[str, Any]:
+    def _cache_key(self, transcript: str) -> str:
+        """
+        Content address for a transcript under the current prompt and model.
+        """
+        payload = json.dumps([PROMPT_VERSION, self.model_name, transcript])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def generate_notes(self, transcript: str, refresh: bool = False) -> Dict[str, Any]:
         """
         Generate structured notes from transcript.
+        
+        Args:
+            transcript: Transcript text
+            refresh: Skip the notes cache and regenerate (the new result is cached)
         """
         # Return mock data if in simulation mode
         if self.mock_mode:
             return self._get_mock_notes(transcript)
 
-        try:
-            # Gemini has a large context window, so we are less worried about truncation, 
-            # but still good practice to check if extremely large. 
-            # 1.5 Flash has 1M context, so effectively no limit for this use case.
-            
-            prompt = f"""Analyze the following transcript and create well-structured notes. 
-Organize the content into clear sections with headings, bullet points, and summaries.
-
-Transcript:
-{transcript}
+        cache_key = self._cache_key(transcript)
+        if not refresh:
+            cached_notes = await self.notes_cache.get_async(cache_key)
+            if cached_notes is not None:
+                return cached_notes
 
-Please create structured notes with the following format:
-1. Introduction - A brief overview of the topic
-2. Key Points - Main concepts and important information (use bullet points)
-3. Examples - Specific examples or case studies mentioned (use bullet points)
-4. Conclusion - Summary of main takeaways
-
-Format the response as clear, readable notes that would be useful for studying or reference.
-Use markdown formatting with headings (##), bullet points (-), and emphasis where appropriate."""
+        try:
+            with timed_stage("summarization"):
+                prompt = await self._build_prompt(transcript)
 
-            response = self.model.generate_content(prompt)
-            notes_text = response.text
+                async with self.limiter.limit():
+                    response = await self._get_model().generate_content_async(prompt)
+                notes_text = response.text
             
             # Parse the notes into structured format
             structured_notes = self._parse_notes(notes_text)
             
-            return {
+            notes = {
                 "formatted": notes_text,
                 "structured": structured_notes
             }
+            # Only successful generations are cached; the fallbacks below are not
+            await self.notes_cache.set_async(cache_key, notes)
+            return notes
         
         except Exception as e:
-            error_msg = str(e)
-            print(f"Error generating notes: {error_msg}")
-            
-            # Fallback to mock mode on critical errors
-            if "key" in error_msg.lower() or "permission" in error_msg.lower():
-                print("Authentication error detected. Falling back to SIMULATION MODE.")
-                return self._get_mock_notes(transcript)
-            
-            # Return partial error info if just generation failed
-            return {
-                "formatted": f"Error generating notes with AI: {error_msg}",
-                "structured": self._get_mock_notes(transcript)["structured"]
-            }
+            return self._fallback_notes(transcript, e)
+
+    async def stream_notes(self, transcript: str, refresh: bool = False) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Generate notes, yielding events as Gemini produces output.
+        
+        Yields dictionaries with an "event" key:
+            delta   - raw markdown text as it arrives ("text")
+            section - a completed section ("section", "content")
+            error   - generation failed ("message"); a fallback "done" follows
+            done    - the final notes, same shape as generate_notes ("notes")
+        """
+        if self.mock_mode:
+            for event in self._replay_notes(self._get_mock_notes(transcript)):
+                yield event
+            return
+
+        cache_key = self._cache_key(transcript)
+        if not refresh:
+            cached_notes = await self.notes_cache.get_async(cache_key)
+            if cached_notes is not None:
+                for event in self._replay_notes(cached_notes):
+                    yield event
+                return
+
+        parser = NotesStreamParser()
+        chunks = []
+        try:
+            prompt = await self._build_prompt(transcript)
+            # The slot is held for the whole stream, since that is how long
+            # the request is open upstream
+            async with self.limiter.limit():
+                with timed_stage("summarization_stream"):
+                    response = await self._get_model().generate_content_async(prompt, stream=True)
+                    async for chunk in response:
+                        text = chunk.text
+                        if not text:
+                            continue
+                        chunks.append(text)
+                        yield {"event": "delta", "text": text}
+                        for event in parser.feed(text):
+                            yield event
+            for event in parser.close():
+                yield event
+        except Exception as e:
+            yield {"event": "error", "message": str(e)}
+            yield {"event": "done", "notes": self._fallback_notes(transcript, e)}
+            return
+
+        notes = {
+            "formatted": "".join(chunks),
+            "structured": parser.structured
+        }
+        await self.notes_cache.set_async(cache_key, notes)
+        yield {"event": "done", "notes": notes}
+
+    async def _build_prompt(self, transcript: str) -> str:
+        """
+        Build the final notes prompt for a transcript.
+        
+        Short transcripts go to Gemini in one prompt. Long ones are split into
+        overlapping chunks that are summarized concurrently (map), and the
+        returned prompt merges those partial notes (reduce).
+        """
+        if len(transcript) <= self.long_transcript_chars:
+            return NOTES_PROMPT_TEMPLATE.format(transcript=transcript)
+
+        chunks = self._split_transcript(transcript)
+        logger.info(
+            "Long transcript (%d chars): summarizing %d chunks with concurrency %d",
+            len(transcript), len(chunks), self.map_concurrency
+        )
+        
+        semaphore = asyncio.Semaphore(self.map_concurrency)
+
+        async def summarize_chunk(index: int, chunk: str) -> str:
+            async with semaphore:
+                prompt = CHUNK_PROMPT_TEMPLATE.format(index=index + 1, total=len(chunks), chunk=chunk)
+                async with self.limiter.limit():
+                    with timed_stage("summarization_chunk"):
+                        response = await self._get_model().generate_content_async(prompt)
+                return response.text
+
+        partial_notes = await asyncio.gather(
+            *(summarize_chunk(index, chunk) for index, chunk in enumerate(chunks))
+        )
+        joined = "\n\n".join(
+            f"### Part {index + 1}\n{notes_text.strip()}" for index, notes_text in enumerate(partial_notes)
+        )
+        return REDUCE_PROMPT_TEMPLATE.format(partial_notes=joined)
+
+    def _split_transcript(self, transcript: str) -> List[str]:
+        """
+        Split a transcript into chunks of at most ~chunk_chars at sentence boundaries.
+        
+        Consecutive chunks share up to chunk_overlap_chars of trailing sentences so
+        context that spans a boundary is not lost. Auto-generated captions often
+        have no punctuation, so overly long "sentences" are split at word boundaries
+        into pieces small enough to make up the overlap.
+        """
+        piece_chars = min(self.chunk_chars, max(self.chunk_overlap_chars // 2, 200))
+        units = []
+        for sentence in re.split(r'(?<=[.!?])\s+', transcript.strip()):
+            if len(sentence) <= piece_chars:
+                units.append(sentence)
+                continue
+            piece = []
+            piece_len = 0
+            for word in sentence.split():
+                if piece and piece_len + len(word) + 1 > piece_chars:
+                    units.append(" ".join(piece))
+                    piece, piece_len = [], 0
+                piece.append(word)
+                piece_len += len(word) + 1
+            if piece:
+                units.append(" ".join(piece))
+
+        chunks = []
+        current = []
+        current_len = 0
+        for unit in units:
+            if current and current_len + len(unit) + 1 > self.chunk_chars:
+                chunks.append(" ".join(current))
+                # Carry trailing units into the next chunk as overlap
+                overlap = []
+                overlap_len = 0
+                for previous in reversed(current):
+                    if overlap_len + len(previous) + 1 > self.chunk_overlap_chars:
+                        break
+                    overlap.insert(0, previous)
+                    overlap_len += len(previous) + 1
+                current, current_len = overlap, overlap_len
+            current.append(unit)
+            current_len += len(unit) + 1
+        if current:
+            chunks.append(" ".join(current))
+        return chunks
+
+    def _replay_notes(self, notes: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Stream events for notes that are already complete (cache hit or offline mode).
+        """
+        events = [{"event": "delta", "text": notes["formatted"]}]
+        for section in ("introduction", "key_points", "examples", "conclusion"):
+            events.append({"event": "section", "section": section, "content": notes["structured"][section]})
+        events.append({"event": "done", "notes": notes})
+        return events
+
+    def _fallback_notes(self, transcript: str, error: Exception) -> Dict[str, Any]:
+        """
+        Notes returned when generation fails, marked ``"fallback": True``.
+        Never cached or stored.
+        """
+        error_msg = str(error)
+        FALLBACKS.inc(fallback="offline_notes", reason="generation_failed")
+        logger.error("Error generating notes: %s", error_msg)
+        
+        # Fallback to mock mode on critical errors
+        if "key" in error_msg.lower() or "permission" in error_msg.lower():
+            logger.warning("Authentication error detected. Falling back to SIMULATION MODE.")
+            return {**self._get_mock_notes(transcript), "fallback": True}
+        
+        # Return partial error info if just generation failed
+        return {
+            "formatted": f"Error generating notes with AI: {error_msg}",
+            "structured": self._get_mock_notes(transcript)["structured"],
+            "fallback": True,
+        }
+
     def _get_mock_notes(self, transcript_text: str = ""):
         """Returns structured data using the actual transcript (Offline Mode)."""
         
@@ -112,72 +351,104 @@ Use markdown formatting with headings (##), bullet points (-), and emphasis wher
         Returns:
             Structured dictionary with sections
         """
-        lines = notes_text.split('\n')
-        
-        structured = {
+        with timed_stage("parse_notes"):
+            parser = NotesStreamParser()
+            parser.feed(notes_text)
+            parser.close()
+            return parser.structured
+
+
+class NotesStreamParser:
+    """
+    Incremental version of SummarizationService._parse_notes.
+
+    Feed markdown as it arrives; each call returns the sections that were
+    completed by the new text (a section completes when the next ``##``
+    heading starts, or at close()).
+    """
+
+    def __init__(self):
+        self.structured = {
             "introduction": "",
             "key_points": [],
             "examples": [],
             "conclusion": "",
             "summary": ""
         }
+        self._buffer = ""
+        self._current_section = None
+        self._current_content = []
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """
+        Consume a chunk of markdown and return completed section events.
+        """
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split('\n')
+        events = []
+        for line in lines:
+            events.extend(self._process_line(line))
+        return events
+
+    def close(self) -> List[Dict[str, Any]]:
+        """
+        Flush any trailing text and complete the last section.
+        """
+        events = self._process_line(self._buffer)
+        self._buffer = ""
+        events.extend(self._finish_section())
+        self._current_section = None
         
-        current_section = None
-        current_content = []
+        # Create summary from introduction and conclusion
+        if self.structured["introduction"] or self.structured["conclusion"]:
+            self.structured["summary"] = f"{self.structured['introduction']}\n\n{self.structured['conclusion']}".strip()
         
-        for line in lines:
-            line = line.strip()
+        return events
+
+    def _process_line(self, line: str) -> List[Dict[str, Any]]:
+        line = line.strip()
+        events = []
+        
+        # Detect section headers
+        if line.startswith('##'):
+            # Save previous section
+            events.extend(self._finish_section())
             
-            # Detect section headers
-            if line.startswith('##'):
-                # Save previous section
-                if current_section and current_content:
-                    content = '\n'.join(current_content).strip()
-                    if current_section == "introduction":
-                        structured["introduction"] = content
-                    elif current_section == "conclusion":
-                        structured["conclusion"] = content
-                
-                # Start new section
-                header_lower = line.lower()
-                if "introduction" in header_lower or "overview" in header_lower:
-                    current_section = "introduction"
-                elif "key point" in header_lower or "main" in header_lower:
-                    current_section = "key_points"
-                elif "example" in header_lower:
-                    current_section = "examples"
-                elif "conclusion" in header_lower or "summary" in header_lower:
-                    current_section = "conclusion"
-                else:
-                    current_section = None
-                
-                current_content = []
+            # Start new section
+            header_lower = line.lower()
+            if "introduction" in header_lower or "overview" in header_lower:
+                self._current_section = "introduction"
+            elif "key point" in header_lower or "main" in header_lower:
+                self._current_section = "key_points"
+            elif "example" in header_lower:
+                self._current_section = "examples"
+            elif "conclusion" in header_lower or "summary" in header_lower:
+                self._current_section = "conclusion"
+            else:
+                self._current_section = None
             
-            # Collect content
-            elif line and current_section:
-                if line.startswith('-') or line.startswith('*'):
-                    # Bullet point
-                    point = line.lstrip('-* ').strip()
-                    if current_section == "key_points":
-                        structured["key_points"].append(point)
-                    elif current_section == "examples":
-                        structured["examples"].append(point)
-                else:
-                    current_content.append(line)
-        
-        # Save last section
-        if current_section and current_content:
-            content = '\n'.join(current_content).strip()
-            if current_section == "introduction":
-                structured["introduction"] = content
-            elif current_section == "conclusion":
-                structured["conclusion"] = content
+            self._current_content = []
         
-        # Create summary from introduction and conclusion
-        if structured["introduction"] or structured["conclusion"]:
-            structured["summary"] = f"{structured['introduction']}\n\n{structured['conclusion']}".strip()
+        # Collect content
+        elif line and self._current_section:
+            if line.startswith('-') or line.startswith('*'):
+                # Bullet point
+                point = line.lstrip('-* ').strip()
+                if self._current_section == "key_points":
+                    self.structured["key_points"].append(point)
+                elif self._current_section == "examples":
+                    self.structured["examples"].append(point)
+            else:
+                self._current_content.append(line)
         
-        return structured
-
-
+        return events
 
+    def _finish_section(self) -> List[Dict[str, Any]]:
+        section = self._current_section
+        if not section:
+            return []
+        
+        if section in ("introduction", "conclusion") and self._current_content:
+            self.structured[section] = '\n'.join(self._current_content).strip()
+        
+        return [{"event": "section", "section": section, "content": self.structured[section]}]
@@ -0,0 +1,432 @@
+"""
+Per-request traces of timed spans, and opt-in cProfile profiling of requests.
+
+The current trace lives in a context variable, so spans opened anywhere in a
+request (including tasks it starts and work bound with ``bind()`` for an
+executor) land in the same trace without passing it around.
+"""
+import asyncio
+import contextvars
+import cProfile
+import heapq
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import partial
+from io import StringIO
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+# Spans kept per trace; a segmented transcription can open hundreds
+MAX_SPANS_PER_TRACE = 500
+
+# Paths that are not traced or profiled (scrapes and the debug API itself)
+UNTRACED_PATH_PREFIXES = ("/metrics", "/api/debug/")
+
+# Accepted incoming X-Request-ID values, recorded on the trace as request_id
+_REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+_current_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("trace", default=None)
+_current_span: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("span", default=None)
+
+
+class Trace:
+    """
+    Timed spans recorded for one request or background job.
+    """
+
+    def __init__(self, name: str, trace_id: Optional[str] = None, **attributes: Any):
+        self.trace_id = trace_id or uuid.uuid4().hex[:16]
+        self.name = name
+        self.attributes = attributes
+        self.started_at = time.time()
+        self.duration_ms: Optional[float] = None
+        self.profile: Optional[str] = None
+        self._started = time.perf_counter()
+        self._spans: List[Dict[str, Any]] = []
+        self._dropped = 0
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._started) * 1000
+
+    def start_span(self, name: str, parent: Optional[int], attributes: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Open a span, or return None once the trace is full. Thread-safe.
+        """
+        with self._lock:
+            if len(self._spans) >= MAX_SPANS_PER_TRACE:
+                self._dropped += 1
+                return None
+            self._next_id += 1
+            span = {
+                "id": self._next_id,
+                "parent": parent,
+                "name": name,
+                "start_ms": round(self.elapsed_ms(), 3),
+                "duration_ms": None,
+                "thread": threading.current_thread().name,
+                **attributes,
+            }
+            self._spans.append(span)
+            return span
+
+    def finish(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+        self.duration_ms = round(self.elapsed_ms(), 3)
+
+    def server_timing(self) -> str:
+        """
+        Server-Timing header value: total time per span name among finished spans.
+        """
+        totals: Dict[str, float] = {}
+        with self._lock:
+            for span in self._spans:
+                if span["duration_ms"] is not None and span["parent"] is None:
+                    totals[span["name"]] = totals.get(span["name"], 0.0) + span["duration_ms"]
+        entries = [f"{_token(name)};dur={duration:.1f}" for name, duration in totals.items()]
+        entries.append(f"total;dur={self.elapsed_ms():.1f}")
+        return ", ".join(entries)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = [dict(span) for span in self._spans]
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            **self.attributes,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "profile": self.profile,
+            "dropped_spans": self._dropped,
+            "spans": spans,
+        }
+
+
+class TraceStore:
+    """
+    The most recent finished traces, in memory.
+    """
+
+    def __init__(self, max_traces: Optional[int] = None):
+        self.max_traces = max_traces or int(os.getenv("TRACE_BUFFER_SIZE", "200"))
+        self._traces: "OrderedDict[str, Trace]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, trace: Trace) -> None:
+        with self._lock:
+            self._traces[trace.trace_id] = trace
+            self._traces.move_to_end(trace.trace_id)
+            while len(self._traces) > self.max_traces:
+                self._traces.popitem(last=False)
+
+    def get(self, trace_id: str) -> Optional[Trace]:
+        with self._lock:
+            return self._traces.get(trace_id)
+
+    def summaries(self, limit: int = 50, slowest: bool = False) -> List[Dict[str, Any]]:
+        """
+        Newest (or slowest) traces without their spans.
+        """
+        with self._lock:
+            traces = list(self._traces.values())
+        if slowest:
+            traces.sort(key=lambda trace: trace.duration_ms or 0.0, reverse=True)
+        else:
+            traces.reverse()
+        return [
+            {
+                "trace_id": trace.trace_id,
+                "name": trace.name,
+                **trace.attributes,
+                "started_at": trace.started_at,
+                "duration_ms": trace.duration_ms,
+                "profile": trace.profile,
+            }
+            for trace in traces[:limit]
+        ]
+
+
+class RequestProfiler:
+    """
+    Opt-in cProfile profiling of requests, keeping the slowest profiles on disk.
+
+    A request is profiled when it is sampled (``sample_rate``) or, if
+    ``allow_header`` is set, when it sends ``X-Profile: 1``. Only one request
+    is profiled at a time. cProfile follows the event loop thread, so a
+    profile also contains whatever other requests ran on the loop meanwhile,
+    but not work done on executor threads. Profiles are saved as
+    ``<duration_ms>_<trace_id>.prof`` (pstats format); only the ``keep``
+    slowest are retained.
+    """
+
+    def __init__(
+        self,
+        sample_rate: Optional[float] = None,
+        allow_header: Optional[bool] = None,
+        profile_dir: Optional[str] = None,
+        keep: Optional[int] = None,
+    ):
+        self.sample_rate = sample_rate if sample_rate is not None else float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+        self.allow_header = allow_header if allow_header is not None else os.getenv("PROFILE_ALLOW_HEADER", "0") == "1"
+        self.profile_dir = Path(profile_dir or os.getenv("PROFILE_DIR", "profiles"))
+        self.keep = keep or int(os.getenv("PROFILE_KEEP", "20"))
+        self._active = False
+        self._lock = threading.Lock()
+        # Min-heap of (duration_ms, trace_id) for the profiles on disk
+        self._saved: List[tuple] = []
+        self._counters = {"profiled": 0, "saved": 0, "skipped_busy": 0}
+        if self.profile_dir.exists():
+            for path in self.profile_dir.glob("*.prof"):
+                duration, _, trace_id = path.stem.partition("_")
+                if duration.isdigit() and trace_id:
+                    heapq.heappush(self._saved, (int(duration), trace_id))
+
+    def configure(self, sample_rate: Optional[float] = None, allow_header: Optional[bool] = None) -> None:
+        """
+        Change the toggles at runtime, without a restart.
+        """
+        if sample_rate is not None:
+            if not 0.0 <= sample_rate <= 1.0:
+                raise ValueError("sample_rate must be between 0 and 1.")
+            self.sample_rate = sample_rate
+        if allow_header is not None:
+            self.allow_header = allow_header
+
+    def start(self, requested: bool) -> Optional[cProfile.Profile]:
+        """
+        Start profiling this request if it is selected and no other request is
+        being profiled. Returns the running profiler, or None.
+        """
+        selected = (requested and self.allow_header) or (self.sample_rate > 0 and random.random() < self.sample_rate)
+        if not selected:
+            return None
+        with self._lock:
+            if self._active:
+                self._counters["skipped_busy"] += 1
+                return None
+            self._active = True
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler (e.g. a debugger) already owns the thread
+            with self._lock:
+                self._active = False
+            return None
+        return profile
+
+    def stop(self, profile: cProfile.Profile) -> None:
+        profile.disable()
+        with self._lock:
+            self._active = False
+            self._counters["profiled"] += 1
+
+    def save(self, profile: cProfile.Profile, trace: Trace) -> Optional[str]:
+        """
+        Write the profile if it is among the ``keep`` slowest, dropping the
+        fastest saved one to make room. Blocking.
+
+        Returns:
+            The profile's file name, or None if it was not kept
+        """
+        duration = int(trace.duration_ms or 0)
+        with self._lock:
+            if len(self._saved) >= self.keep:
+                if duration <= self._saved[0][0]:
+                    return None
+                evicted = heapq.heapreplace(self._saved, (duration, trace.trace_id))
+            else:
+                evicted = None
+                heapq.heappush(self._saved, (duration, trace.trace_id))
+            self._counters["saved"] += 1
+
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        if evicted is not None:
+            try:
+                self._path(*evicted).unlink()
+            except OSError:
+                pass
+        path = self._path(duration, trace.trace_id)
+        profile.dump_stats(str(path))
+        return path.name
+
+    def find(self, trace_id: str) -> Optional[Path]:
+        with self._lock:
+            for duration, saved_id in self._saved:
+                if saved_id == trace_id:
+                    return self._path(duration, saved_id)
+        return None
+
+    def summary(self, trace_id: str, limit: int = 40, sort: str = "cumulative") -> Optional[str]:
+        """
+        Text report of a saved profile's top functions. Blocking.
+        """
+        path = self.find(trace_id)
+        if path is None or not path.exists():
+            return None
+        output = StringIO()
+        pstats.Stats(str(path), stream=output).sort_stats(sort).print_stats(limit)
+        return output.getvalue()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            saved = sorted(self._saved, reverse=True)
+            return {
+                "sample_rate": self.sample_rate,
+                "allow_header": self.allow_header,
+                "keep": self.keep,
+                **self._counters,
+                "profiles": [{"trace_id": trace_id, "duration_ms": duration} for duration, trace_id in saved],
+            }
+
+    def _path(self, duration: int, trace_id: str) -> Path:
+        return self.profile_dir / f"{duration:08d}_{trace_id}.prof"
+
+
+TRACES = TraceStore()
+PROFILER = RequestProfiler()
+
+
+def current_trace_id() -> Optional[str]:
+    trace = _current_trace.get()
+    return trace.trace_id if trace is not None else None
+
+
+@contextmanager
+def start_trace(name: str, trace_id: Optional[str] = None, **attributes: Any) -> Iterator[Trace]:
+    """
+    Make a new trace current for the ``with`` block and store it when the block ends.
+
+    For work outside HTTP requests, such as background jobs.
+    """
+    trace = Trace(name, trace_id, **attributes)
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span.set(None)
+    try:
+        yield trace
+    finally:
+        _reset(_current_span, span_token)
+        _reset(_current_trace, trace_token)
+        trace.finish()
+        TRACES.add(trace)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[None]:
+    """
+    Record a timed span in the current trace; does nothing outside a trace.
+
+    Works in blocking and async code. Spans opened inside the block become
+    its children.
+    """
+    trace = _current_trace.get()
+    record = trace.start_span(name, _current_span.get(), attributes) if trace is not None else None
+    if record is None:
+        yield
+        return
+
+    token = _current_span.set(record["id"])
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        record["error"] = type(e).__name__
+        raise
+    finally:
+        record["duration_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        _reset(_current_span, token)
+
+
+def bind(func: Callable, *args: Any, **kwargs: Any) -> Callable[[], Any]:
+    """
+    Wrap a call so it runs in the current context (and so the current trace)
+    on an executor thread. loop.run_in_executor does not copy context itself.
+    """
+    return partial(contextvars.copy_context().run, func, *args, **kwargs)
+
+
+class TracingMiddleware:
+    """
+    Traces every HTTP request and optionally profiles it.
+
+    Trace IDs are always generated here (job traces reuse the job ID, so a
+    client-chosen ID could collide with one) and returned in ``X-Trace-Id``.
+    A usable ``X-Request-ID`` from the client is kept on the trace as
+    ``request_id``. Requests sending
+    ``X-Debug-Trace: 1`` also get a ``Server-Timing`` header summarizing the
+    spans finished before the response started; the full trace is available
+    from the debug API once the response has completed.
+    """
+
+    def __init__(self, app, store: TraceStore = TRACES, profiler: RequestProfiler = PROFILER):
+        self.app = app
+        self.store = store
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(UNTRACED_PATH_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        headers = {key.lower(): value for key, value in scope.get("headers", [])}
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1")
+        attributes = {"method": scope["method"], "path": scope["path"]}
+        if _REQUEST_ID_PATTERN.match(request_id):
+            attributes["request_id"] = request_id
+        trace = Trace("http", **attributes)
+        debug = headers.get(b"x-debug-trace") == b"1"
+        profile = self.profiler.start(headers.get(b"x-profile") == b"1")
+        status = 500
+        finished = False
+
+        async def finish():
+            nonlocal finished
+            if finished:
+                return
+            finished = True
+            route = scope.get("route")
+            trace.finish(status=status, route=getattr(route, "path", None))
+            if profile is not None:
+                self.profiler.stop(profile)
+                trace.profile = await asyncio.to_thread(self.profiler.save, profile, trace)
+            self.store.add(trace)
+
+        async def traced_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                extra = [(b"x-trace-id", trace.trace_id.encode())]
+                if debug:
+                    extra.append((b"server-timing", trace.server_timing().encode()))
+                message = {**message, "headers": list(message.get("headers", [])) + extra}
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                await finish()
+
+        trace_token = _current_trace.set(trace)
+        try:
+            await self.app(scope, receive, traced_send)
+        finally:
+            _reset(_current_trace, trace_token)
+            await finish()
+
+
+def _reset(variable: contextvars.ContextVar, token: contextvars.Token) -> None:
+    try:
+        variable.reset(token)
+    except ValueError:
+        # An async generator closed from another context; nothing to restore there
+        pass
+
+
+def _token(name: str) -> str:
+    """Server-Timing metric names must be HTTP tokens."""
+    return re.sub(r"[^A-Za-z0-9!#$%&'*+.^_`|~-]", "_", name)
@@ -0,0 +1,219 @@
+"""
+Compact, time-indexed storage for caption segments.
+"""
+import base64
+import hashlib
+import re
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+# Words too common to say anything about where a note came from
+_STOPWORDS = frozenset(
+    "about after again also because been before being between both could does doing during each "
+    "from have having here into just like more most much only other over same should some such "
+    "than that their them then there these they this those through under until very what when "
+    "where which while will with would your".split()
+)
+
+
+def _content_words(text: str) -> set:
+    return {word for word in re.findall(r"[a-z0-9]{4,}", text.lower()) if word not in _STOPWORDS}
+
+
+def _field(item: Any, name: str) -> Any:
+    """Read a segment field from a dict or from an object with attributes."""
+    return item[name] if isinstance(item, dict) else getattr(item, name)
+
+
+class TranscriptSegments:
+    """
+    Caption segments stored column-wise instead of as a list of dicts.
+
+    Start times and durations are parallel float32 arrays, and the text of
+    every segment lives in one string (segments joined by single spaces, so
+    ``text`` is the plain transcript) with an array of start offsets. That
+    is a few dozen bytes per segment instead of a dict, three boxed values
+    and a separate string for each.
+    """
+
+    def __init__(self, starts: array, durations: array, text: str, offsets: array):
+        self.starts = starts
+        self.durations = durations
+        self.text = text
+        self.offsets = offsets
+        self._windows: Dict[float, List[Any]] = {}
+
+    @classmethod
+    def from_items(cls, items: Iterable[Any]) -> "TranscriptSegments":
+        """
+        Build from caption items with "text", "start" and "duration"
+        (dicts or objects, as returned by youtube_transcript_api).
+        """
+        starts, durations, offsets = array("f"), array("f"), array("I")
+        texts: List[str] = []
+        position = 0
+        for item in items:
+            text = _field(item, "text")
+            starts.append(float(_field(item, "start")))
+            durations.append(float(_field(item, "duration")))
+            offsets.append(position)
+            texts.append(text)
+            position += len(text) + 1
+        return cls(starts, durations, " ".join(texts), offsets)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        JSON-serializable form (arrays as base64) for caches and responses.
+        """
+        return {
+            "text": self.text,
+            "starts": base64.b64encode(self.starts.tobytes()).decode("ascii"),
+            "durations": base64.b64encode(self.durations.tobytes()).decode("ascii"),
+            "offsets": base64.b64encode(self.offsets.tobytes()).decode("ascii"),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "TranscriptSegments":
+        columns = {}
+        for name, typecode in (("starts", "f"), ("durations", "f"), ("offsets", "I")):
+            column = array(typecode)
+            column.frombytes(base64.b64decode(data[name]))
+            columns[name] = column
+        return cls(columns["starts"], columns["durations"], data["text"], columns["offsets"])
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __getitem__(self, index: int) -> Dict[str, Any]:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("segment index out of range")
+        return {
+            "start": round(self.starts[index], 3),
+            "duration": round(self.durations[index], 3),
+            "text": self.segment_text(index),
+        }
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for index in range(len(self)):
+            yield self[index]
+
+    @property
+    def duration(self) -> float:
+        """End time of the last segment, in seconds."""
+        if not len(self):
+            return 0.0
+        return self.starts[-1] + self.durations[-1]
+
+    def segment_text(self, index: int) -> str:
+        end = self.offsets[index + 1] - 1 if index + 1 < len(self) else len(self.text)
+        return self.text[self.offsets[index]:end]
+
+    def index_at(self, seconds: float) -> int:
+        """
+        Index of the segment playing at ``seconds`` (or the last one before it).
+        """
+        return max(bisect_right(self.starts, seconds) - 1, 0)
+
+    def time_at_offset(self, char_offset: int) -> float:
+        """
+        Start time of the segment containing a character offset into ``text``.
+        """
+        return self.starts[max(bisect_right(self.offsets, char_offset) - 1, 0)]
+
+    def slice(self, start: float, end: float) -> "TranscriptSegments":
+        """
+        Segments that overlap [start, end), as a new TranscriptSegments.
+        """
+        first = self.index_at(start)
+        if first < len(self) and self.starts[first] + self.durations[first] <= start:
+            first += 1
+        last = bisect_left(self.starts, end)
+        if first >= last:
+            return TranscriptSegments(array("f"), array("f"), "", array("I"))
+
+        text_start = self.offsets[first]
+        text_end = self.offsets[last] - 1 if last < len(self) else len(self.text)
+        offsets = array("I", (offset - text_start for offset in self.offsets[first:last]))
+        return TranscriptSegments(
+            self.starts[first:last], self.durations[first:last], self.text[text_start:text_end], offsets
+        )
+
+    def find_time(self, passage: str, window_seconds: float = 30.0) -> Optional[float]:
+        """
+        Estimate where in the recording a passage (e.g. a note bullet) was said.
+
+        Notes paraphrase rather than quote, so the transcript is scanned in
+        windows of ``window_seconds`` and the window sharing the most content
+        words with the passage wins.
+
+        Returns:
+            Start time of the best window in seconds, or None if nothing matches
+        """
+        wanted = _content_words(passage)
+        if not wanted:
+            return None
+
+        best_time, best_score = None, 0
+        for window_time, words in self._window_words(window_seconds):
+            score = len(wanted & words)
+            if score > best_score:
+                best_time, best_score = window_time, score
+        return round(best_time, 3) if best_time is not None else None
+
+    def _window_words(self, window_seconds: float) -> List[Any]:
+        """
+        (start time, content words) for overlapping windows, built once per window size.
+        """
+        windows = self._windows.get(window_seconds)
+        if windows is None:
+            windows = []
+            window_start = 0
+            while window_start < len(self):
+                window_end = bisect_left(self.starts, self.starts[window_start] + window_seconds, lo=window_start + 1)
+                text_end = self.offsets[window_end] if window_end < len(self) else len(self.text)
+                windows.append((self.starts[window_start], _content_words(self.text[self.offsets[window_start]:text_end])))
+                # Half-window steps, so a passage straddling a boundary is still found
+                window_start += max((window_end - window_start) // 2, 1)
+            self._windows[window_seconds] = windows
+        return windows
+
+    def map_sections(self, structured: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Timestamps for the sections of structured notes (from _parse_notes).
+
+        Returns:
+            {"introduction": seconds, "conclusion": seconds,
+             "key_points": [{"text", "start"}], "examples": [{"text", "start"}]}
+            with None where no position could be found
+        """
+        mapped: Dict[str, Any] = {}
+        for section in ("introduction", "conclusion"):
+            if structured.get(section):
+                mapped[section] = self.find_time(structured[section])
+        for section in ("key_points", "examples"):
+            mapped[section] = [
+                {"text": point, "start": self.find_time(point)} for point in structured.get(section) or []
+            ]
+        return mapped
+
+    def digest(self) -> str:
+        """
+        SHA-256 of the text and timings, e.g. for cache keys of renders that use them.
+        """
+        digest = hashlib.sha256(self.text.encode("utf-8"))
+        for column in (self.starts, self.durations, self.offsets):
+            digest.update(column.tobytes())
+        return digest.hexdigest()
+
+    def nbytes(self) -> int:
+        """
+        Approximate memory held by this object.
+        """
+        return (
+            sys.getsizeof(self.text)
+            + sum(column.buffer_info()[1] * column.itemsize for column in (self.starts, self.durations, self.offsets))
+        )
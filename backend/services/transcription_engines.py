@@ -0,0 +1,156 @@
+"""
+Pluggable speech-to-text engines used by TranscriptionService.
+"""
+import asyncio
+import importlib.util
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+from .gemini_client import GeminiFileManager, hash_file, get_model
+from .rate_limiter import GEMINI_GENERATE, GEMINI_UPLOAD, get_limiter
+from .tracing import bind
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIPTION_PROMPT = "Please transcribe the spoken content of this audio file accurate verbatim. Do not add any commentary."
+
+# Whisper pulls in torch, so it is only imported inside the worker processes.
+WHISPER_AVAILABLE = importlib.util.find_spec("whisper") is not None
+
+
+class TranscriptionEngine:
+    """
+    Base class for transcription engines.
+    """
+    name = "base"
+
+    @property
+    def available(self) -> bool:
+        return False
+
+    async def transcribe(self, file_path: str) -> str:
+        """
+        Transcribe a file and return the text. Raises on failure.
+        """
+        raise NotImplementedError
+
+
+class GeminiEngine(TranscriptionEngine):
+    """
+    Remote transcription with Gemini 1.5 Flash (multimodal).
+    """
+    name = "gemini"
+    model_name = "gemini-1.5-flash"
+
+    def __init__(self, api_key: Optional[str], file_manager: Optional[GeminiFileManager] = None):
+        self.api_key = api_key
+        self.file_manager = file_manager or GeminiFileManager(limiter=get_limiter(GEMINI_UPLOAD))
+        self.limiter = get_limiter(GEMINI_GENERATE)
+        # Uploads and generate calls block while they queue on the rate
+        # limiters, so they get their own threads instead of the default
+        # executor that cache, job and note store calls share
+        self._executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("GEMINI_TRANSCRIBE_WORKERS", "8")),
+            thread_name_prefix="gemini-transcribe",
+        )
+        if not self.api_key:
+            logger.warning("GOOGLE_API_KEY not found. Transcription might fail.")
+
+    @property
+    def available(self) -> bool:
+        return bool(self.api_key)
+
+    async def transcribe(self, file_path: str) -> str:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, bind(self._transcribe_file, file_path))
+
+    def _transcribe_file(self, file_path: str) -> str:
+        """
+        Upload one file to Gemini (or reuse an earlier upload) and transcribe it. Blocking.
+        """
+        content_hash = hash_file(file_path)
+        audio_file = self.file_manager.acquire(file_path, content_hash)
+        succeeded = False
+        try:
+            # Generate content using Gemini 1.5 Flash (efficient for audio)
+            model = get_model(self.model_name)
+            with self.limiter.limit_sync():
+                response = model.generate_content([TRANSCRIPTION_PROMPT, audio_file])
+            text = response.text
+            succeeded = True
+            return text
+        finally:
+            # Keep the upload for a retry if transcription failed; otherwise it's no longer needed
+            self.file_manager.release(content_hash, delete=succeeded)
+
+
+# Per-process Whisper model, loaded once by the pool initializer and reused
+# for every file that worker transcribes.
+_worker_model = None
+
+
+def _load_whisper_model(model_size: str, threads_per_worker: int) -> None:
+    global _worker_model
+    import torch
+    import whisper
+
+    # Each worker gets its own share of the cores instead of all of them
+    torch.set_num_threads(threads_per_worker)
+    _worker_model = whisper.load_model(model_size, device="cpu")
+
+
+def _whisper_transcribe(file_path: str) -> str:
+    result = _worker_model.transcribe(file_path, fp16=False)
+    return result["text"].strip()
+
+
+class WhisperEngine(TranscriptionEngine):
+    """
+    Local CPU transcription with OpenAI Whisper.
+
+    Models are loaded once per worker process and stay warm in a process pool
+    (one worker per core by default), so there is no per-request load cost and
+    several files or segments can be transcribed in parallel.
+    """
+    name = "whisper"
+
+    def __init__(self, model_size: Optional[str] = None, workers: Optional[int] = None):
+        self.model_size = model_size or os.getenv("WHISPER_MODEL_SIZE", "base")
+        self.workers = workers or int(os.getenv("WHISPER_WORKERS", "0")) or (os.cpu_count() or 1)
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def available(self) -> bool:
+        return WHISPER_AVAILABLE
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            threads_per_worker = max(1, (os.cpu_count() or 1) // self.workers)
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_load_whisper_model,
+                initargs=(self.model_size, threads_per_worker),
+            )
+            logger.info("Whisper pool started: %d workers, model '%s'", self.workers, self.model_size)
+        return self._pool
+
+    async def warm_up(self) -> None:
+        """
+        Start every worker now so the first request doesn't pay the model load.
+        """
+        pool = self._get_pool()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(pool, os.getpid) for _ in range(self.workers)))
+
+    async def transcribe(self, file_path: str) -> str:
+        if not self.available:
+            raise ValueError("Whisper is not installed. Install openai-whisper to use the local engine.")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_pool(), _whisper_transcribe, file_path)
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
@@ -1,60 +1,304 @@
 import os
-import google.generativeai as genai
-from typing import Optional
+import asyncio
+import logging
+import random
+import re
+import shutil
+import tempfile
+from typing import List, Optional, Tuple
+
+from .audio_service import SPEECH_EXTENSION, AudioService
+from .cache_service import CacheService
+from .metrics import FALLBACKS, RETRIES, timed_stage
+from .transcription_engines import GeminiEngine, TranscriptionEngine, WhisperEngine
+
+logger = logging.getLogger(__name__)
+
+ENGINE_CHOICES = ("auto", "gemini", "whisper")
+
+
+class TranscriptionError(Exception):
+    """
+    Raised when a recording could not be transcribed.
+    """
+
+
+class TranscriptionUnavailableError(TranscriptionError):
+    """
+    Raised when the selected engine is not configured (e.g. no GOOGLE_API_KEY).
+    """
 
-# Graceful handling for Whisper/Torch DLL errors (keeping imports for fallback if ever needed, but priority is Google)
-WHISPER_AVAILABLE = False
-try:
-    import whisper
-    WHISPER_AVAILABLE = True
-except (OSError, ImportError, Exception):
-    WHISPER_AVAILABLE = False
 
 class TranscriptionService:
     def __init__(self):
         self.model_size = os.getenv("WHISPER_MODEL_SIZE", "base")
-        self.model = None
         self.api_key = os.getenv("GOOGLE_API_KEY")
-        
-        if self.api_key:
-            genai.configure(api_key=self.api_key)
-            print("Google Gemini API initialized for transcription.")
+        self.audio = AudioService()
+
+        # Transcripts of uploaded recordings, keyed by the engine that produced
+        # them and the SHA-256 of the file
+        self.transcript_cache = CacheService("audio_transcripts")
+
+        self.engines = {
+            "gemini": GeminiEngine(self.api_key),
+            "whisper": WhisperEngine(self.model_size),
+        }
+        # "auto" uses Gemini when configured and falls back to local Whisper
+        # when Gemini is missing, rate-limited or unavailable.
+        self.default_engine = os.getenv("TRANSCRIPTION_ENGINE", "auto")
+
+        # Segmented mode: long recordings are cut into pieces that are
+        # transcribed in parallel and stitched back together in order.
+        self.segment_seconds = float(os.getenv("TRANSCRIBE_SEGMENT_SECONDS", "600"))
+        self.segment_overlap_seconds = float(os.getenv("TRANSCRIBE_SEGMENT_OVERLAP_SECONDS", "5"))
+        self.segment_concurrency = int(os.getenv("TRANSCRIBE_CONCURRENCY", "4"))
+        self.segment_retries = int(os.getenv("TRANSCRIBE_SEGMENT_RETRIES", "2"))
+        self.segmented_min_seconds = float(os.getenv("TRANSCRIBE_SEGMENTED_MIN_SECONDS", "900"))
+        self.align_to_silence = os.getenv("TRANSCRIBE_ALIGN_TO_SILENCE", "1") == "1"
+
+        # Uploads and downloads are transcoded to mono 16 kHz Opus before
+        # transcription; video containers and high-bitrate audio shrink by
+        # an order of magnitude.
+        self.normalize_audio = os.getenv("AUDIO_NORMALIZE", "1") == "1"
+        self.trim_silence = os.getenv("AUDIO_TRIM_SILENCE", "0") == "1"
+
+    async def transcribe_audio(
+        self,
+        file_path: str,
+        segmented: Optional[bool] = None,
+        engine: Optional[str] = None,
+        content_hash: Optional[str] = None,
+        normalize: Optional[bool] = None,
+    ) -> str:
+        """
+        Transcribe audio file with the selected engine.
+
+        Args:
+            file_path: Path to the audio/video file
+            segmented: Force segmented (True) or whole-file (False) transcription.
+                By default, recordings longer than TRANSCRIBE_SEGMENTED_MIN_SECONDS
+                are segmented when ffmpeg is available.
+            engine: "gemini", "whisper" or "auto" (default: TRANSCRIPTION_ENGINE)
+            content_hash: SHA-256 of the file; a recording seen before is not re-transcribed
+            normalize: Transcode before transcribing (default: AUDIO_NORMALIZE). Pass
+                False for audio that is already in the compact speech format.
+
+        Returns:
+            The transcript (empty if the recording contained no speech)
+
+        Raises:
+            ValueError: If the engine name is unknown
+            TranscriptionUnavailableError: If the selected engine is not configured
+            TranscriptionError: If transcription failed
+        """
+        engine_name = engine or self.default_engine
+        if engine_name not in ENGINE_CHOICES:
+            raise ValueError(f"Unknown transcription engine '{engine_name}'. Choose from: {', '.join(ENGINE_CHOICES)}")
+
+        gemini = self.engines["gemini"]
+        whisper = self.engines["whisper"]
+        if engine_name == "auto":
+            if gemini.available:
+                selected, fallback = gemini, (whisper if whisper.available else None)
+            elif whisper.available:
+                selected, fallback = whisper, None
+            else:
+                selected, fallback = gemini, None
         else:
-            print("WARNING: GOOGLE_API_KEY not found. Transcription might fail.")
+            selected, fallback = self.engines[engine_name], None
+
+        if selected is gemini and not gemini.available:
+            raise TranscriptionUnavailableError("Transcription is unavailable: GOOGLE_API_KEY is not set.")
+
+        if content_hash:
+            cached_transcript = await self.transcript_cache.get_async(self._cache_key(selected, content_hash))
+            if cached_transcript is not None:
+                logger.info("Recording seen before; reusing cached %s transcript.", selected.name)
+                return cached_transcript
+
+        normalized_dir = None
+        try:
+            if normalize is None:
+                normalize = self.normalize_audio
+            if normalize and self.audio.available:
+                normalized_dir = tempfile.mkdtemp(prefix="normalized_")
+                file_path = await self._normalize(file_path, normalized_dir)
+
+            if segmented is None:
+                segmented = await self._should_segment(file_path)
 
-        # Local whisper loading (optional fallback, likely invalid on this machine)
-        global WHISPER_AVAILABLE
-        if WHISPER_AVAILABLE:
+            used = selected
             try:
-                # self.model = whisper.load_model(self.model_size) # Skip loading local model to save memory/startup time if we have API
-                pass
-            except Exception:
-                pass
+                transcript = await self._transcribe_with(selected, file_path, segmented)
+            except Exception as e:
+                if fallback is None or not self._is_unavailable_error(e):
+                    raise
+                FALLBACKS.inc(fallback=fallback.name, reason=f"{selected.name}_unavailable")
+                logger.warning("%s unavailable (%s). Falling back to %s.", selected.name, e, fallback.name)
+                used = fallback
+                transcript = await self._transcribe_with(fallback, file_path, segmented)
 
-    async def transcribe_audio(self, file_path: str) -> Optional[str]:
+            if content_hash and transcript:
+                await self.transcript_cache.set_async(self._cache_key(used, content_hash), transcript)
+            return transcript
+
+        except Exception as e:
+            logger.error("Transcription failed: %s", e)
+            raise TranscriptionError(f"Error during transcription: {e}") from e
+
+        finally:
+            if normalized_dir:
+                shutil.rmtree(normalized_dir, ignore_errors=True)
+
+    @staticmethod
+    def _cache_key(engine: TranscriptionEngine, content_hash: str) -> str:
         """
-        Transcribe audio file using Google Gemini Flash (multimodal).
+        Transcripts are only reused for the engine that produced them.
         """
-        if not self.api_key:
-             return "SYSTEM MESSAGE: Real transcription unavailable. Missing GOOGLE_API_KEY."
+        return f"{engine.name}:{content_hash}"
 
+    async def _normalize(self, file_path: str, output_dir: str) -> str:
+        """
+        Transcode to the compact speech format, returning the original path if that fails.
+        """
+        output_path = os.path.join(output_dir, f"normalized{SPEECH_EXTENSION}")
         try:
-            print("Uploading audio to Gemini...")
-            # Upload the file to Gemini
-            audio_file = genai.upload_file(path=file_path)
-            print(f"Uploaded file: {audio_file.uri}")
-            
-            # Generate content using Gemini 1.5 Flash (efficient for audio)
-            model = genai.GenerativeModel('gemini-1.5-flash')
-            
-            prompt = "Please transcribe the spoken content of this audio file accurate verbatim. Do not add any commentary."
-            response = model.generate_content([prompt, audio_file])
-            
-            print("Gemini transcription successful.")
-            return response.text
-            
-        except Exception as e:
-            print(f"Gemini transcription failed: {str(e)}")
-            return f"Error during transcription: {str(e)}"
+            with timed_stage("audio_normalize"):
+                stats = await self.audio.normalize(file_path, output_path, trim_silence=self.trim_silence)
+        except ValueError as e:
+            FALLBACKS.inc(fallback="original_audio", reason="normalize_failed")
+            logger.warning("Audio normalization failed (%s); using the original file.", e)
+            return file_path
+
+        logger.info(
+            "Normalized audio: %.1f MB -> %.1f MB (saved %.1f MB) in %.1fs",
+            stats["input_bytes"] / 1e6, stats["output_bytes"] / 1e6, stats["bytes_saved"] / 1e6, stats["seconds"]
+        )
+        return output_path
+
+    async def _transcribe_with(self, engine: TranscriptionEngine, file_path: str, segmented: bool) -> str:
+        with timed_stage(f"transcription_{engine.name}"):
+            if segmented:
+                return await self._transcribe_segmented(engine, file_path)
+
+            transcript = await engine.transcribe(file_path)
+            logger.info("Transcription successful (%s).", engine.name)
+            return transcript
+
+    @staticmethod
+    def _is_unavailable_error(error: Exception) -> bool:
+        """
+        True for quota, rate-limit and outage errors that another engine can work around.
+        """
+        error_msg = str(error).lower()
+        markers = ("429", "quota", "resource exhausted", "rate limit", "503", "unavailable", "deadline")
+        return any(marker in error_msg for marker in markers)
+
+    async def _should_segment(self, file_path: str) -> bool:
+        if not self.audio.available:
+            return False
+        try:
+            duration = await self.audio.probe_duration(file_path)
+        except ValueError as e:
+            logger.warning("Could not probe audio duration (%s); transcribing as one file.", e)
+            return False
+        return duration > self.segmented_min_seconds
+
+    async def _transcribe_segmented(self, engine: TranscriptionEngine, file_path: str) -> str:
+        """
+        Cut the file into segments, transcribe them concurrently and stitch the results.
+        """
+        if not self.audio.available:
+            raise ValueError("Segmented transcription requires ffmpeg and ffprobe on PATH.")
+
+        segments = await self.audio.plan_segments(
+            file_path,
+            self.segment_seconds,
+            overlap_seconds=self.segment_overlap_seconds,
+            align_to_silence=self.align_to_silence,
+        )
+        logger.info("Transcribing %d segments with concurrency %d...", len(segments), self.segment_concurrency)
 
+        work_dir = tempfile.mkdtemp(prefix="segments_")
+        semaphore = asyncio.Semaphore(self.segment_concurrency)
+
+        async def transcribe_segment(segment: dict) -> str:
+            async with semaphore:
+                segment_path = os.path.join(work_dir, f"segment_{segment['index']:04d}{SPEECH_EXTENSION}")
+                await self.audio.extract_segment(file_path, segment["start"], segment["end"], segment_path)
+
+                # Retry only this segment; the others keep their results
+                for attempt in range(self.segment_retries + 1):
+                    try:
+                        return await engine.transcribe(segment_path)
+                    except Exception as e:
+                        if attempt == self.segment_retries:
+                            raise ValueError(f"Segment {segment['index'] + 1} failed: {e}")
+                        RETRIES.inc(operation="transcription_segment")
+                        delay = 2 ** attempt + random.uniform(0, 1)
+                        logger.warning("Segment %d failed (%s). Retrying in %.1fs...", segment["index"] + 1, e, delay)
+                        await asyncio.sleep(delay)
+
+        try:
+            texts = await asyncio.gather(*(transcribe_segment(segment) for segment in segments))
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        logger.info("Segmented transcription successful (%s).", engine.name)
+        return self._stitch_segments(texts)
+
+    def _stitch_segments(self, texts: List[str]) -> str:
+        """
+        Join segment transcripts in order, dropping text repeated in the overlaps.
+
+        The overlap is the end of one transcript and the start of the next, so
+        only a common run of (normalized) words that reaches the end of the
+        tail and starts at the beginning of the head counts as one, give or
+        take a few words transcribed differently at the cut. A phrase that is
+        merely repeated elsewhere is left alone, and segments without such a
+        run are joined unchanged.
+        """
+        window = max(30, int(self.segment_overlap_seconds * 6))
+        # Speech runs at roughly three words a second
+        tolerance = max(2, int(self.segment_overlap_seconds * 3) // 3)
+        words: List[str] = []
+        for text in texts:
+            next_words = text.split()
+            if words and next_words:
+                tail = words[-window:]
+                head = next_words[:window]
+                overlap = self._find_overlap(
+                    [self._normalize_word(w) for w in tail], [self._normalize_word(w) for w in head], tolerance
+                )
+                if overlap is not None:
+                    tail_start, head_start = overlap
+                    words = words[:len(words) - len(tail) + tail_start]
+                    next_words = next_words[head_start:]
+            words.extend(next_words)
+        return " ".join(words)
+
+    @staticmethod
+    def _find_overlap(tail: List[str], head: List[str], tolerance: int) -> Optional[Tuple[int, int]]:
+        """
+        Longest run of at least three words shared by the end of ``tail`` and
+        the start of ``head``, each within ``tolerance`` words.
+
+        Returns:
+            Where the run starts in tail and in head, or None
+        """
+        best_size, best = 0, None
+        for head_start in range(min(tolerance, len(head) - 1) + 1):
+            for tail_start in range(len(tail)):
+                size = 0
+                while (
+                    tail_start + size < len(tail) and head_start + size < len(head)
+                    and tail[tail_start + size] == head[head_start + size]
+                ):
+                    size += 1
+                if size >= 3 and size > best_size and len(tail) - (tail_start + size) <= tolerance:
+                    best_size, best = size, (tail_start, head_start)
+        return best
 
+    @staticmethod
+    def _normalize_word(word: str) -> str:
+        return re.sub(r"[^\w']", "", word.lower())
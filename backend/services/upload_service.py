@@ -0,0 +1,67 @@
+"""
+Service for streaming uploaded files to disk.
+"""
+import asyncio
+import hashlib
+import os
+import tempfile
+from typing import Any, Dict, Optional
+
+
+class UploadTooLargeError(ValueError):
+    """
+    Raised when an upload exceeds the configured size limit.
+    """
+
+
+class UploadService:
+    """
+    Writes uploads to disk in chunks without blocking the event loop,
+    enforcing a size limit and computing a SHA-256 of the content on the way.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None, chunk_size: int = 1024 * 1024):
+        self.max_bytes = max_bytes or int(os.getenv("MAX_UPLOAD_MB", "500")) * 1024 * 1024
+        self.chunk_size = chunk_size
+
+    async def save(self, upload: Any, suffix: str = "", directory: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Stream an uploaded file to a new file on disk.
+
+        Args:
+            upload: Object with an async ``read(size)`` method (e.g. FastAPI's UploadFile)
+            suffix: File extension for the saved file
+            directory: Where to save it (defaults to the system temp directory)
+
+        Returns:
+            Dictionary with "path", "sha256" and "size"
+
+        Raises:
+            UploadTooLargeError: If the upload is larger than max_bytes
+        """
+        declared_size = getattr(upload, "size", None)
+        if declared_size is not None and declared_size > self.max_bytes:
+            raise UploadTooLargeError(self.too_large_message())
+
+        fd, path = tempfile.mkstemp(suffix=suffix, dir=directory)
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                while True:
+                    chunk = await upload.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise UploadTooLargeError(self.too_large_message())
+                    hasher.update(chunk)
+                    await asyncio.to_thread(f.write, chunk)
+        except BaseException:
+            os.unlink(path)
+            raise
+
+        return {"path": path, "sha256": hasher.hexdigest(), "size": size}
+
+    def too_large_message(self) -> str:
+        return f"File too large. Maximum upload size is {self.max_bytes // (1024 * 1024)} MB."
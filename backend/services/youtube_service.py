@@ -1,15 +1,32 @@
 """
 Service for extracting transcripts from YouTube videos.
 """
-from youtube_transcript_api import YouTubeTranscriptApi
 from urllib.parse import urlparse, parse_qs
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import logging
+import random
 import re
-from typing import Optional
+from contextlib import contextmanager, nullcontext
+from typing import Iterator, List, Optional
 import os
-import time
-import random
-import time
-import random
+import shutil
+import tempfile
+import threading
+
+from .audio_service import SPEECH_EXTENSION, AudioService
+from .cache_service import CacheService
+from .metrics import FALLBACKS, RETRIES, timed_stage
+from .rate_limiter import YOUTUBE_CAPTIONS, get_limiter
+from .single_flight import ProgressCallback, SingleFlight
+from .transcript_segments import TranscriptSegments
+from .tracing import bind
+
+logger = logging.getLogger(__name__)
+
+# Smallest audio-only format that is still fine for speech: YouTube's ~50-70 kbps
+# Opus streams, then anything up to 96 kbps, then whatever audio exists.
+DEFAULT_AUDIO_FORMAT = "bestaudio[abr<=72]/bestaudio[abr<=96]/worstaudio[acodec!=none]/bestaudio/best"
 
 
 class YouTubeService:
@@ -17,10 +34,69 @@ class YouTubeService:
     Handles YouTube video transcript extraction.
     """
     
-    def __init__(self):
-        self.transcript_api = YouTubeTranscriptApi
+    def __init__(self, max_concurrency: Optional[int] = None, download_dir: Optional[str] = None):
+        self._transcript_api = None
+        self.audio = AudioService()
+
+        # youtube_transcript_api is fully synchronous, so every caption request
+        # runs on this bounded pool instead of the event loop. The pool size is
+        # also the cap on concurrent requests we make against YouTube.
+        self.max_concurrency = max_concurrency or int(os.getenv("YOUTUBE_MAX_CONCURRENCY", "8"))
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency,
+            thread_name_prefix="youtube-captions"
+        )
+        # Shared token bucket/backoff for caption requests across all workers
+        self.limiter = get_limiter(YOUTUBE_CAPTIONS)
+        # Concurrent requests for the same video share one caption fetch, so
+        # only the first of them queues on the limiter
+        self._caption_flights = SingleFlight()
+
+        # Timed transcripts are keyed by video ID plus the resolved language/translation;
+        # the metadata cache remembers which track resolved for each video so a
+        # repeat request can skip the manual/generated/first-available search.
+        self.transcript_cache = CacheService("transcript_segments")
+        self.metadata_cache = CacheService("transcript_metadata")
+
+        # yt-dlp downloads are blocking and bandwidth-heavy; they get their own
+        # smaller pool so they can't starve caption requests.
+        self.download_dir = download_dir or os.path.join(os.getenv("UPLOADS_DIR", "uploads"), "temp_dl")
+        self.audio_format = os.getenv("YTDLP_AUDIO_FORMAT", DEFAULT_AUDIO_FORMAT)
+        self.stream_transcode = os.getenv("YTDLP_STREAM_TRANSCODE", "0") == "1"
+        self._download_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("YTDLP_MAX_CONCURRENCY", "2")),
+            thread_name_prefix="youtube-downloads"
+        )
+
+    @property
+    def transcript_api(self):
+        """
+        YouTubeTranscriptApi, imported on first use.
+        """
+        if self._transcript_api is None:
+            from youtube_transcript_api import YouTubeTranscriptApi
+            self._transcript_api = YouTubeTranscriptApi
+        return self._transcript_api
+
+    @transcript_api.setter
+    def transcript_api(self, api):
+        self._transcript_api = api
+
+    async def _run_blocking(self, func, *args, report: Optional[ProgressCallback] = None, **kwargs):
+        """
+        Run a blocking call on the caption executor without stalling the event loop.
+        
+        Calls queue on the caption rate limiter first, which also backs off
+        when YouTube answers with 429. ``report``, if given, is told
+        ("admitted", 0) once the limiter lets the call through.
+        """
+        loop = asyncio.get_running_loop()
+        async with self.limiter.limit():
+            if report is not None:
+                report("admitted", 0)
+            return await loop.run_in_executor(self._executor, bind(func, *args, **kwargs))
     
-    def _extract_video_id(self, url: str) -> str:
+    def extract_video_id(self, url: str) -> str:
         """
         Extract video ID from various YouTube URL formats.
         
@@ -54,38 +130,83 @@ class YouTubeService:
         
         raise ValueError("Invalid YouTube URL. Could not extract video ID.")
     
-    async def get_transcript(self, url: str) -> str:
+    async def get_transcript(self, url: str, admitted: Optional[asyncio.Event] = None) -> str:
         """
         Extract transcript from YouTube video URL.
         
         Args:
             url: YouTube video URL
+            admitted: Set once the caption request for the video gets past the
+                rate limiter (never set when the transcript is served from the cache)
             
         Returns:
             Transcript text as a string
             
+        Raises:
+            ValueError: If video ID cannot be extracted or transcript is unavailable
+        """
+        return (await self.get_transcript_segments(url, admitted)).text
+
+    async def get_transcript_segments(self, url: str, admitted: Optional[asyncio.Event] = None) -> TranscriptSegments:
+        """
+        Extract the timed transcript from YouTube video URL.
+        
+        Args:
+            url: YouTube video URL
+            admitted: See get_transcript
+            
+        Returns:
+            TranscriptSegments (its ``text`` is the same string get_transcript returns)
+            
         Raises:
             ValueError: If video ID cannot be extracted or transcript is unavailable
         """
+        try:
+            key = self.extract_video_id(url)
+        except ValueError:
+            # Let the fetch itself report the invalid URL
+            key = url
+        with timed_stage("caption_fetch"):
+            return await self._caption_flights.run(
+                key,
+                lambda report: self._get_transcript_segments(url, report),
+                (lambda stage, percent: admitted.set()) if admitted is not None else None,
+            )
+
+    async def _get_transcript_segments(self, url: str, report: ProgressCallback) -> TranscriptSegments:
         try:
             # Extract video ID
-            video_id = self._extract_video_id(url)
+            video_id = self.extract_video_id(url)
+            
+            cached_segments = await self._get_cached_transcript(video_id, report)
+            if cached_segments is not None:
+                return cached_segments
             
             # Try to get transcript with smart language handling and retry logic for rate limits
             transcript_list = None
+            resolved = None
             max_retries = 3
             base_delay = 2  # Base delay in seconds
             
             for attempt in range(max_retries):
                 try:
-                    # Add delay before retry (exponential backoff)
+                    # Jittered exponential backoff on top of the limiter's cooldown,
+                    # so callers that hit the 429 together don't retry in lockstep
                     if attempt > 0:
+                        RETRIES.inc(operation="caption_fetch")
                         delay = base_delay * (2 ** (attempt - 1)) + random.uniform(0, 1)
-                        print(f"Rate limit detected. Waiting {delay:.1f} seconds before retry {attempt + 1}/{max_retries}...")
-                        time.sleep(delay)
+                        logger.warning(
+                            "Rate limit detected. Waiting %.1f seconds before retry %d/%d...",
+                            delay, attempt + 1, max_retries,
+                        )
+                        await asyncio.sleep(delay)
                     
                     # First, try to get English transcript directly
-                    transcript_list = self.transcript_api.get_transcript(video_id, languages=['en'])
+                    with timed_stage("caption_retry") if attempt > 0 else nullcontext():
+                        transcript_list = await self._run_blocking(
+                            self.transcript_api.get_transcript, video_id, languages=['en'], report=report
+                        )
+                    resolved = {"language_code": "en", "translated_to": None}
                     break  # Success, exit retry loop
                     
                 except Exception as en_error:
@@ -107,53 +228,9 @@ class YouTubeService:
                     if attempt == 0:
                         try:
                             # If English not available, get any transcript and translate to English
-                            # Get list of available transcripts
-                            transcript_list_obj = self.transcript_api.list_transcripts(video_id)
-                            
-                            # Get any available transcript
-                            transcript = None
-                            
-                            # Try different methods to get a transcript
-                            # Method 1: Try to get any manual transcript
-                            try:
-                                for t in transcript_list_obj:
-                                    if t.is_manually_created:
-                                        transcript = t
-                                        break
-                            except:
-                                pass
-                            
-                            # Method 2: If no manual, get any auto-generated transcript
-                            if transcript is None:
-                                try:
-                                    for t in transcript_list_obj:
-                                        if t.is_generated:
-                                            transcript = t
-                                            break
-                                except:
-                                    pass
-                            
-                            # Method 3: Last resort - get the first available transcript
-                            if transcript is None:
-                                try:
-                                    transcript = next(iter(transcript_list_obj))
-                                except:
-                                    pass
-                            
-                            if transcript is None:
-                                raise ValueError("No transcripts found for this video.")
-                            
-                            # Translate to English if not already English
-                            if transcript.language_code != 'en':
-                                try:
-                                    transcript = transcript.translate('en')
-                                except Exception as translate_err:
-                                    # If translation fails, try to use original language
-                                    print(f"Translation to English failed: {translate_err}. Using original language: {transcript.language_code}")
-                                    # Continue with original language - better than nothing
-                            
-                            # Fetch the transcript data
-                            transcript_list = transcript.fetch()
+                            transcript_list, resolved = await self._run_blocking(
+                                self._fetch_any_transcript, video_id, report=report
+                            )
                             break  # Success, exit retry loop
                             
                         except Exception as translate_error:
@@ -185,10 +262,13 @@ class YouTubeService:
                             f"Please try again later or upload an audio file."
                         )
             
-            # Combine all transcript segments
-            transcript_text = " ".join([item['text'] for item in transcript_list])
+            # Keep the segment timings alongside the combined text
+            segments = TranscriptSegments.from_items(transcript_list)
+            
+            await self.metadata_cache.set_async(video_id, resolved)
+            await self.transcript_cache.set_async(self._transcript_cache_key(video_id, resolved), segments.to_dict())
             
-            return transcript_text
+            return segments
         
         except Exception as e:
             error_msg = str(e)
@@ -203,44 +283,309 @@ class YouTubeService:
                 )
             raise ValueError(f"Error extracting transcript: {error_msg}")
 
-    def download_audio(self, url: str, output_path: str) -> Optional[str]:
+    def _transcript_cache_key(self, video_id: str, resolved: dict) -> str:
+        """
+        Build the transcript cache key from the video ID and resolved track.
+        """
+        return f"{video_id}:{resolved['language_code']}:{resolved.get('translated_to') or ''}"
+
+    def cached_segments(self, video_id: str) -> Optional[TranscriptSegments]:
+        """
+        Timed transcript for a video if it is already cached; never fetches.
+        """
+        resolved = self.metadata_cache.get(video_id)
+        if resolved is None:
+            return None
+        cached = self.transcript_cache.get(self._transcript_cache_key(video_id, resolved))
+        return TranscriptSegments.from_dict(cached) if cached is not None else None
+
+    async def _get_cached_transcript(
+        self, video_id: str, report: Optional[ProgressCallback] = None
+    ) -> Optional[TranscriptSegments]:
+        """
+        Return a cached transcript for the video, if its track has been resolved before.
+
+        When only the metadata is cached, the known track is fetched directly
+        instead of repeating the transcript search.
+        """
+        resolved = await self.metadata_cache.get_async(video_id)
+        if resolved is None:
+            return None
+
+        key = self._transcript_cache_key(video_id, resolved)
+        cached = await self.transcript_cache.get_async(key)
+        if cached is not None:
+            return TranscriptSegments.from_dict(cached)
+
+        try:
+            transcript_list = await self._run_blocking(
+                self._fetch_resolved_transcript, video_id, resolved, report=report
+            )
+        except Exception as e:
+            FALLBACKS.inc(fallback="caption_search", reason="cached_track_unavailable")
+            logger.warning("Cached caption track for %s unavailable (%s). Falling back to full search.", video_id, e)
+            await self.metadata_cache.delete_async(video_id)
+            return None
+
+        segments = TranscriptSegments.from_items(transcript_list)
+        await self.transcript_cache.set_async(key, segments.to_dict())
+        return segments
+
+    def _fetch_resolved_transcript(self, video_id: str, resolved: dict) -> list:
+        """
+        Fetch a previously resolved caption track. Blocking; call through _run_blocking.
+        """
+        if resolved["language_code"] == "en" and not resolved.get("translated_to"):
+            return self.transcript_api.get_transcript(video_id, languages=['en'])
+
+        transcript = self.transcript_api.list_transcripts(video_id).find_transcript(
+            [resolved["language_code"]]
+        )
+        if resolved.get("translated_to"):
+            transcript = transcript.translate(resolved["translated_to"])
+        return transcript.fetch()
+
+    def _fetch_any_transcript(self, video_id: str) -> tuple:
+        """
+        Find the best available transcript for a video and fetch it, translating
+        to English when possible. Blocking; call through _run_blocking.
+        
+        Returns:
+            Tuple of (transcript segments, resolved track metadata)
+        """
+        # Get list of available transcripts
+        transcript_list_obj = self.transcript_api.list_transcripts(video_id)
+        
+        # Get any available transcript
+        transcript = None
+        
+        # Try different methods to get a transcript
+        # Method 1: Try to get any manual transcript
+        try:
+            for t in transcript_list_obj:
+                if t.is_manually_created:
+                    transcript = t
+                    break
+        except:
+            pass
+        
+        # Method 2: If no manual, get any auto-generated transcript
+        if transcript is None:
+            try:
+                for t in transcript_list_obj:
+                    if t.is_generated:
+                        transcript = t
+                        break
+            except:
+                pass
+        
+        # Method 3: Last resort - get the first available transcript
+        if transcript is None:
+            try:
+                transcript = next(iter(transcript_list_obj))
+            except:
+                pass
+        
+        if transcript is None:
+            raise ValueError("No transcripts found for this video.")
+        
+        resolved = {
+            "language_code": transcript.language_code,
+            "translated_to": None,
+            "is_generated": transcript.is_generated,
+            "available": [
+                {"language_code": t.language_code, "is_generated": t.is_generated}
+                for t in transcript_list_obj
+            ],
+        }
+        
+        # Translate to English if not already English
+        if transcript.language_code != 'en':
+            try:
+                transcript = transcript.translate('en')
+                resolved["translated_to"] = 'en'
+            except Exception as translate_err:
+                # If translation fails, try to use original language
+                logger.warning(
+                    "Translation to English failed: %s. Using original language: %s",
+                    translate_err, transcript.language_code
+                )
+                # Continue with original language - better than nothing
+        
+        # Fetch the transcript data
+        return transcript.fetch(), resolved
+
+    async def expand_playlist(self, url: str) -> List[str]:
+        """
+        List the video URLs in a playlist without downloading anything.
+        
+        Args:
+            url: YouTube playlist URL
+            
+        Returns:
+            Video URLs in playlist order
+            
+        Raises:
+            ValueError: If the playlist cannot be read
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._download_executor, self._expand_playlist, url)
+
+    def _expand_playlist(self, url: str) -> List[str]:
+        import yt_dlp
+
+        ydl_opts = {
+            'extract_flat': 'in_playlist',
+            'quiet': True,
+            'no_warnings': True,
+        }
+        try:
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                info = ydl.extract_info(url, download=False)
+        except Exception as e:
+            raise ValueError(f"Could not read playlist: {e}")
+
+        entries = info.get('entries')
+        if entries is None:
+            # Not a playlist; treat it as a single video
+            return [url]
+
+        urls = []
+        for entry in entries:
+            if not entry:
+                continue
+            video_id = entry.get('id')
+            if video_id:
+                urls.append(f"https://www.youtube.com/watch?v={video_id}")
+            elif entry.get('url'):
+                urls.append(entry['url'])
+        return urls
+
+    @contextmanager
+    def workspace(self) -> Iterator[str]:
+        """
+        Create an isolated temporary directory for one download and remove it afterwards.
+        """
+        os.makedirs(self.download_dir, exist_ok=True)
+        workspace_dir = tempfile.mkdtemp(prefix="job_", dir=self.download_dir)
+        try:
+            yield workspace_dir
+        finally:
+            shutil.rmtree(workspace_dir, ignore_errors=True)
+
+    async def download_audio(self, url: str, workspace_dir: str) -> Optional[str]:
         """
         Download audio from YouTube video using yt-dlp.
-        Returns the path to the downloaded file.
+        
+        Runs on the bounded download executor. The smallest speech-adequate
+        audio-only format is preferred.
+        
+        Args:
+            url: YouTube video URL
+            workspace_dir: Directory owned by this request (see workspace())
+            
+        Returns:
+            Path to the downloaded file, or None if the download failed
+
+        Cancelling the call also stops the download itself.
         """
+        loop = asyncio.get_running_loop()
+        cancelled = threading.Event()
+        future = loop.run_in_executor(
+            self._download_executor, bind(self._download_audio, url, workspace_dir, cancelled)
+        )
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # yt-dlp can't be interrupted from outside its thread: flag the
+            # download so its progress hook aborts at the next chunk (or it is
+            # skipped if still queued), and wait for that so the download slot
+            # is free and the workspace is no longer written to
+            cancelled.set()
+            await asyncio.wait([future])
+            raise
+
+    def _download_audio(self, url: str, workspace_dir: str, cancelled: threading.Event) -> Optional[str]:
+        if cancelled.is_set():
+            return None
         try:
             import yt_dlp
+
+            def abort_if_cancelled(progress: dict) -> None:
+                if cancelled.is_set():
+                    raise yt_dlp.utils.DownloadCancelled("Download cancelled.")
             
             ydl_opts = {
-                'format': 'bestaudio/best',
-                'outtmpl': output_path + '.%(ext)s', # Let it append extension
+                'format': self.audio_format,
+                'outtmpl': os.path.join(workspace_dir, 'audio.%(ext)s'),
                 'quiet': True,
-                'no_warnings': True
+                'no_warnings': True,
+                'noplaylist': True,
+                'progress_hooks': [abort_if_cancelled],
             }
             
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
-            
-            # Find the downloaded file
-            # yt-dlp appends the extension to the output_path we gave it.
-            # We look for any file in the directory that starts with our temp filename.
-            directory = os.path.dirname(output_path)
-            basename = os.path.basename(output_path)
+            with timed_stage("ytdlp_download"), yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                info = ydl.extract_info(url, download=True)
+                
+                # yt-dlp reports where it wrote the file; no need to scan the directory
+                downloads = info.get('requested_downloads') or []
+                file_path = downloads[0].get('filepath') if downloads else ydl.prepare_filename(info)
             
-            # Debug log
-            print(f"Searching for file starting with '{basename}' in '{directory}'")
-
-            files_in_dir = os.listdir(directory)
-            for file in files_in_dir:
-                if file.startswith(basename):
-                    full_path = os.path.join(directory, file)
-                    print(f"Found audio file: {full_path}")
-                    return full_path
+            if file_path and os.path.exists(file_path):
+                logger.info("Downloaded audio (%s, %s kbps): %s", info.get('format_id'), info.get('abr'), file_path)
+                return file_path
             
-            print(f"No audio file found. Files in dir: {files_in_dir}")
+            logger.warning("yt-dlp reported %s but no file was written.", file_path)
             return None
             
         except Exception as e:
-            print(f"Error downloading audio: {e}")
+            logger.warning("Error downloading audio: %s", e)
+            return None
+
+    async def stream_audio(self, url: str, workspace_dir: str) -> Optional[str]:
+        """
+        Transcode a video's audio straight from YouTube into the compact speech
+        format, without writing the original download to disk first.
+        
+        yt-dlp only resolves the media URL; ffmpeg reads it over HTTP and writes
+        the normalized file.
+        
+        Returns:
+            Path to the normalized audio file, or None if streaming failed
+        """
+        if not self.audio.available:
+            return None
+
+        loop = asyncio.get_running_loop()
+        try:
+            with timed_stage("ytdlp_stream"):
+                info = await loop.run_in_executor(self._download_executor, bind(self._resolve_audio_stream, url))
+                output_path = os.path.join(workspace_dir, f"audio{SPEECH_EXTENSION}")
+                headers = "".join(f"{name}: {value}\r\n" for name, value in (info.get('http_headers') or {}).items())
+                stats = await self.audio.normalize(
+                    info['url'], output_path, input_args=("-headers", headers) if headers else ()
+                )
+        except Exception as e:
+            FALLBACKS.inc(fallback="ytdlp_download", reason="stream_failed")
+            logger.warning("Error streaming audio: %s", e)
             return None
 
+        logger.info("Streamed and transcoded audio to %.1f MB in %.1fs", stats['output_bytes'] / 1e6, stats['seconds'])
+        return output_path
+
+    def _resolve_audio_stream(self, url: str) -> dict:
+        import yt_dlp
+
+        ydl_opts = {
+            'format': self.audio_format,
+            'quiet': True,
+            'no_warnings': True,
+            'noplaylist': True,
+        }
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(url, download=False)
+        
+        # For a single selected format the direct URL is on the info dict itself
+        if 'url' not in info and info.get('requested_formats'):
+            info = info['requested_formats'][0]
+        return info
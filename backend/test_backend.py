@@ -7,6 +7,10 @@ import os
 # Add current directory to path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+# Keep the stores main creates on import in a temporary directory (pytest
+# loads conftest itself; this covers running the script directly)
+import conftest  # noqa: E402,F401
+
 def test_imports():
     """Test that all modules can be imported."""
     print("Testing imports...")
@@ -15,6 +19,10 @@ def test_imports():
         from services.transcription_service import TranscriptionService
         from services.summarization_service import SummarizationService
         from services.export_service import ExportService
+        from services.job_service import JobService
+        from services.upload_service import UploadService
+        from services.note_store import NoteStore
+        from services.metrics import REGISTRY
         from main import app
         print("✅ All imports successful!")
         return True
@@ -30,11 +38,15 @@ def test_services():
         from services.transcription_service import TranscriptionService
         from services.summarization_service import SummarizationService
         from services.export_service import ExportService
+        from services.job_service import JobService
+        from services.note_store import NoteStore
         
         youtube = YouTubeService()
         transcription = TranscriptionService()
         summarization = SummarizationService()
         export = ExportService()
+        jobs = JobService()
+        notes = NoteStore()
         
         print("✅ All services initialized successfully!")
         return True
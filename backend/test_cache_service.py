@@ -0,0 +1,126 @@
+"""
+Tests for the two-tier CacheService: memory LRU, disk persistence, TTL expiry
+and the disk byte budget.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import conftest  # noqa: E402,F401
+from services.cache_service import CacheService  # noqa: E402
+
+
+def make_db() -> str:
+    return os.path.join(tempfile.mkdtemp(), "cache.db")
+
+
+def make_cache(db_path=None, namespace="test", **kwargs):
+    kwargs.setdefault("max_items", 8)
+    kwargs.setdefault("max_disk_bytes", 1024 * 1024)
+    return CacheService(namespace, db_path=db_path or make_db(), **kwargs)
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = make_cache(max_items=2)
+
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "a" is now the most recently used
+    cache.set("c", 3)
+
+    assert list(cache._memory) == ["a", "c"]
+    assert cache.stats()["memory_items"] == 2
+
+
+def test_memory_miss_is_served_and_promoted_from_disk():
+    cache = make_cache(max_items=1)
+
+    cache.set("a", {"text": "first"})
+    cache.set("b", {"text": "second"})
+    assert "a" not in cache._memory
+
+    assert cache.get("a") == {"text": "first"}
+    assert "a" in cache._memory
+    stats = cache.stats()
+    assert (stats["disk_hits"], stats["memory_hits"], stats["misses"]) == (1, 0, 0)
+
+
+def test_entries_persist_across_instances():
+    db_path = make_db()
+    make_cache(db_path).set("video:en:", {"text": "hello"})
+
+    reopened = make_cache(db_path)
+
+    assert reopened.get("video:en:") == {"text": "hello"}
+    assert reopened.stats()["disk_hits"] == 1
+
+
+def test_namespaces_share_a_file_but_not_keys():
+    db_path = make_db()
+    transcripts = make_cache(db_path, namespace="transcripts")
+    notes = make_cache(db_path, namespace="notes")
+
+    transcripts.set("key", "transcript")
+    notes.clear()
+
+    assert notes.get("key") is None
+    assert transcripts.get("key") == "transcript"
+
+
+def test_expired_entries_are_misses_in_both_tiers():
+    db_path = make_db()
+    cache = make_cache(db_path, ttl_seconds=0.05)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+
+    time.sleep(0.1)
+
+    assert cache.get("a") is None
+    assert make_cache(db_path, ttl_seconds=0.05).get("a") is None
+    assert cache.stats()["disk_items"] == 0
+
+
+def test_zero_ttl_is_not_replaced_by_the_default():
+    cache = make_cache(ttl_seconds=0)
+
+    cache.set("a", 1)
+
+    assert cache.ttl_seconds == 0
+    assert cache.get("a") is None
+
+
+def test_disk_budget_evicts_least_recently_used_rows():
+    value = "x" * 100
+    # Room for three values, with the memory tier too small to hide the disk tier
+    cache = make_cache(max_items=1, max_disk_bytes=3 * (len(value) + 2))
+
+    cache.set("a", value)
+    cache.set("b", value)
+    cache.set("c", value)
+    time.sleep(0.01)
+    assert cache.get("a") == value  # refreshes accessed_at, so "b" is now the oldest
+    cache.set("d", value)
+
+    stats = cache.stats()
+    assert stats["disk_items"] == 3
+    assert stats["evictions"] == 1
+    assert cache.get("b") is None
+    assert [cache.get(key) for key in ("a", "c", "d")] == [value] * 3
+
+
+def test_async_methods_match_the_blocking_ones():
+    db_path = make_db()
+    cache = make_cache(db_path)
+
+    async def main():
+        await cache.set_async("a", [1, 2])
+        memory_hit = await cache.get_async("a")
+        disk_hit = await make_cache(db_path).get_async("a")
+        await cache.delete_async("a")
+        return memory_hit, disk_hit, await cache.get_async("a")
+
+    assert asyncio.run(main()) == ([1, 2], [1, 2], None)
@@ -0,0 +1,99 @@
+"""
+Tests for CompressionMiddleware, driven with plain ASGI apps.
+"""
+import asyncio
+import gzip
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.compression import BROTLI_AVAILABLE, CompressionMiddleware  # noqa: E402
+
+BODY = b'{"notes": "' + b"Fourier series " * 200 + b'"}'
+
+
+def make_app(bodies, content_type=b"application/json", headers=()):
+    """ASGI app sending one response start and the given body chunks."""
+
+    async def app(scope, receive, send):
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", content_type), *headers],
+        })
+        for index, body in enumerate(bodies):
+            await send({"type": "http.response.body", "body": body, "more_body": index < len(bodies) - 1})
+
+    return app
+
+
+def call(app, accept_encoding=None, **kwargs):
+    """Run a request through the middleware; returns (headers, body chunks)."""
+    headers = [(b"accept-encoding", accept_encoding.encode())] if accept_encoding is not None else []
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": headers}
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(CompressionMiddleware(app, **kwargs)(scope, receive, send))
+    start, *bodies = messages
+    return dict(start["headers"]), [message["body"] for message in bodies]
+
+
+def test_gzip_response_decodes_to_the_original_body():
+    headers, bodies = call(make_app([BODY]), "gzip, deflate")
+
+    assert headers[b"content-encoding"] == b"gzip"
+    assert headers[b"vary"] == b"Accept-Encoding"
+    assert int(headers[b"content-length"]) == len(bodies[0]) < len(BODY)
+    assert gzip.decompress(bodies[0]) == BODY
+
+
+def test_brotli_is_preferred_when_installed():
+    headers, bodies = call(make_app([BODY]), "gzip, br")
+
+    if BROTLI_AVAILABLE:
+        import brotli
+
+        assert headers[b"content-encoding"] == b"br"
+        assert brotli.decompress(bodies[0]) == BODY
+    else:
+        assert headers[b"content-encoding"] == b"gzip"
+
+
+def test_refused_and_missing_encodings_pass_through():
+    for accept_encoding in (None, "identity", "gzip;q=0, br;q=0"):
+        headers, bodies = call(make_app([BODY]), accept_encoding)
+
+        assert b"content-encoding" not in headers, accept_encoding
+        assert bodies == [BODY]
+
+
+def test_small_bodies_are_not_compressed():
+    headers, bodies = call(make_app([b'{"ok": true}']), "gzip", minimum_size=1024)
+
+    assert b"content-encoding" not in headers
+    assert bodies == [b'{"ok": true}']
+
+
+def test_streamed_and_encoded_responses_pass_through():
+    chunks = [b'{"event": "progress"}\n' * 100, b'{"event": "done"}\n' * 100]
+    streamed = call(make_app(chunks), "gzip")
+    event_stream = call(make_app([BODY], content_type=b"text/event-stream"), "gzip")
+    encoded = call(make_app([BODY], headers=[(b"content-encoding", b"identity")]), "gzip")
+
+    assert streamed[1] == chunks
+    assert event_stream[1] == [BODY]
+    assert encoded[0][b"content-encoding"] == b"identity"
+    assert encoded[1] == [BODY]
+
+
+def test_existing_vary_header_is_extended():
+    headers, _ = call(make_app([BODY], headers=[(b"vary", b"Origin")]), "gzip")
+
+    assert headers[b"vary"] == b"Origin, Accept-Encoding"
@@ -0,0 +1,132 @@
+"""
+Tests for content-addressed export caching: repeat exports, shared renders,
+pruning and the ETag on the export endpoints.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import conftest  # noqa: E402,F401
+from services.export_service import ExportService  # noqa: E402
+
+NOTES = {"formatted": "## Introduction\nFourier series.\n\n## Key Points\n- Linear"}
+TRANSCRIPT = "Today we look at the Fourier series."
+
+
+def make_service(**kwargs):
+    service = ExportService(**kwargs)
+    service.export_dir = Path(tempfile.mkdtemp())
+    return service
+
+
+def test_repeat_export_is_served_from_the_first_render():
+    service = make_service()
+
+    async def main():
+        first = await service.export_to_txt(TRANSCRIPT, NOTES)
+        second = await service.export_to_txt(TRANSCRIPT, NOTES)
+        other = await service.export_to_txt(TRANSCRIPT + " More.", NOTES)
+        return first, second, other
+
+    first, second, other = asyncio.run(main())
+
+    assert first == second != other
+    assert os.path.basename(first) == f"notes_{service.export_key(TRANSCRIPT, NOTES, 'txt', {'segments': None})}.txt"
+    assert (service.stats()["renders"], service.stats()["hits"]) == (2, 1)
+
+
+def test_simultaneous_exports_share_one_render():
+    service = make_service()
+
+    async def main():
+        return await asyncio.gather(*(service.export_to_txt(TRANSCRIPT, NOTES) for _ in range(5)))
+
+    paths = asyncio.run(main())
+
+    assert len(set(paths)) == 1
+    assert service.stats()["renders"] == 1
+    assert service.stats()["rendering"] == 0
+
+
+def test_render_depends_only_on_its_content():
+    service = make_service()
+
+    async def render():
+        path = await service.export_to_txt(TRANSCRIPT, NOTES)
+        with open(path, encoding="utf-8") as f:
+            content = f.read()
+        os.unlink(path)
+        return content
+
+    first = asyncio.run(render())
+    second = asyncio.run(render())
+
+    # A cached file is served as if it had just been rendered, so nothing time-dependent may be in it
+    assert first == second
+    assert "Generated on" not in first
+
+
+def test_pruning_keeps_the_most_recent_exports_off_the_event_loop():
+    service = make_service(max_files=2)
+    prune = service._prune
+    pruned_on = []
+
+    def recording_prune():
+        pruned_on.append(threading.current_thread().name)
+        prune()
+
+    service._prune = recording_prune
+
+    async def main():
+        paths = []
+        for index in range(3):
+            paths.append(await service.export_to_txt(f"{TRANSCRIPT} {index}", NOTES))
+            # mtimes can tie within the filesystem's resolution
+            await asyncio.sleep(0.01)
+        return paths
+
+    paths = asyncio.run(main())
+
+    assert [os.path.exists(path) for path in paths] == [False, True, True]
+    assert len(pruned_on) == 3
+    assert all(name.startswith("export") for name in pruned_on)
+
+
+def test_post_export_carries_a_stable_content_etag():
+    from fastapi.testclient import TestClient
+    from main import app, export_service
+
+    client = TestClient(app)
+    body = {"transcript": TRANSCRIPT, "notes": NOTES}
+
+    first = client.post("/api/export/txt", json=body)
+    second = client.post("/api/export/txt", json=body, headers={"If-None-Match": first.headers["etag"]})
+    changed = client.post("/api/export/txt", json={**body, "transcript": TRANSCRIPT + " More."})
+
+    key = export_service.export_key(TRANSCRIPT, NOTES, "txt", {"segments": None})
+    assert first.headers["etag"] == f'"{key}"'
+    # POST ignores preconditions and always returns the export
+    assert (second.status_code, second.headers["etag"], second.content) == (200, first.headers["etag"], first.content)
+    assert changed.headers["etag"] != first.headers["etag"]
+
+
+def test_stored_note_export_answers_304_only_for_a_known_note():
+    from fastapi.testclient import TestClient
+    from main import app, note_store
+
+    client = TestClient(app)
+    note_id = note_store.save(TRANSCRIPT, NOTES, source="upload")
+
+    first = client.get(f"/api/notes/{note_id}/export/txt")
+    cached = client.get(f"/api/notes/{note_id}/export/txt", headers={"If-None-Match": first.headers["etag"]})
+    unknown = client.get("/api/notes/missing/export/txt", headers={"If-None-Match": "*"})
+    unknown_pdf = client.get("/api/notes/missing/export/pdf", headers={"If-None-Match": "*"})
+
+    assert first.status_code == 200
+    assert (cached.status_code, cached.headers["etag"]) == (304, first.headers["etag"])
+    assert (unknown.status_code, unknown_pdf.status_code) == (404, 404)
@@ -0,0 +1,153 @@
+"""
+Tests for GeminiFileManager against a local fake of the Gemini File API.
+"""
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.gemini_client import GeminiFileManager, hash_file
+
+
+class FakeState:
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeFile:
+    def __init__(self, name, state="ACTIVE"):
+        self.name = name
+        self.uri = f"https://fake.example/{name}"
+        self.state = FakeState(state)
+
+
+class FakeFileAPI:
+    """In-memory stand-in for genai.upload_file/get_file/delete_file."""
+
+    def __init__(self, processing_polls=0):
+        self.files = {}
+        self.uploads = 0
+        self.deleted = []
+        self.processing_polls = processing_polls
+        self._lock = threading.Lock()
+
+    def upload_file(self, path):
+        with self._lock:
+            self.uploads += 1
+            name = f"files/{self.uploads}"
+        state = "PROCESSING" if self.processing_polls else "ACTIVE"
+        self.files[name] = {"polls_left": self.processing_polls}
+        return FakeFile(name, state)
+
+    def get_file(self, name):
+        entry = self.files[name]
+        entry["polls_left"] -= 1
+        return FakeFile(name, "PROCESSING" if entry["polls_left"] > 0 else "ACTIVE")
+
+    def delete_file(self, name):
+        self.deleted.append(name)
+        del self.files[name]
+
+
+def _make_file(content: bytes) -> str:
+    fd, path = tempfile.mkstemp(suffix=".ogg")
+    with os.fdopen(fd, "wb") as f:
+        f.write(content)
+    return path
+
+
+def test_reuses_upload_for_same_content():
+    api = FakeFileAPI()
+    manager = GeminiFileManager(api=api)
+    path = _make_file(b"lecture audio")
+    content_hash = hash_file(path)
+
+    first = manager.acquire(path, content_hash)
+    manager.release(content_hash, delete=False)
+    second = manager.acquire(path, content_hash)
+
+    assert first.name == second.name
+    assert api.uploads == 1
+    assert manager.stats()["reuses"] == 1
+    os.unlink(path)
+
+
+def test_release_deletes_remote_file_when_unused():
+    api = FakeFileAPI()
+    manager = GeminiFileManager(api=api)
+    path = _make_file(b"lecture audio")
+    content_hash = hash_file(path)
+
+    manager.acquire(path, content_hash)
+    manager.acquire(path, content_hash)
+    manager.release(content_hash)
+    assert api.deleted == []
+
+    manager.release(content_hash)
+    assert api.deleted == ["files/1"]
+    assert manager.stats()["live_files"] == 0
+    os.unlink(path)
+
+
+def test_expired_uploads_are_uploaded_again():
+    api = FakeFileAPI()
+    manager = GeminiFileManager(api=api, ttl_seconds=0.000001)
+    path = _make_file(b"lecture audio")
+
+    manager.acquire(path)
+    manager.release(hash_file(path), delete=False)
+    manager.acquire(path)
+
+    assert api.uploads == 2
+    os.unlink(path)
+
+
+def test_quota_evicts_oldest_unused_upload():
+    api = FakeFileAPI()
+    manager = GeminiFileManager(api=api, quota_bytes=25)
+    old_path = _make_file(b"a" * 15)
+    new_path = _make_file(b"b" * 15)
+
+    manager.acquire(old_path)
+    manager.release(hash_file(old_path), delete=False)
+    manager.acquire(new_path)
+
+    assert api.deleted == ["files/1"]
+    assert manager.stats()["live_bytes"] == 15
+    os.unlink(old_path)
+    os.unlink(new_path)
+
+
+def test_waits_for_processing_and_single_upload_under_concurrency():
+    api = FakeFileAPI(processing_polls=2)
+    manager = GeminiFileManager(api=api, poll_interval=0.001)
+    path = _make_file(b"lecture audio")
+
+    threads = [threading.Thread(target=manager.acquire, args=(path,)) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert api.uploads == 1
+    assert manager.stats()["reuses"] == 4
+    os.unlink(path)
+
+
+def test_upload_locks_are_dropped_once_unused():
+    api = FakeFileAPI()
+    manager = GeminiFileManager(api=api)
+    paths = [_make_file(f"lecture {index}".encode()) for index in range(3)]
+
+    threads = [threading.Thread(target=manager.acquire, args=(path,)) for path in paths * 2]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert api.uploads == 3
+    assert manager._hash_locks == {}
+    for path in paths:
+        os.unlink(path)
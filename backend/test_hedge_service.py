@@ -0,0 +1,159 @@
+"""
+Tests for hedging the caption fetch with audio transcription.
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import conftest  # noqa: E402,F401
+from services.hedge_service import HedgeError, HedgeService  # noqa: E402
+from services.transcription_service import TranscriptionService, TranscriptionUnavailableError  # noqa: E402
+
+
+def leg(result=None, error=None, delay=0.0, started=None, cancelled=None):
+    async def run():
+        if started is not None:
+            started.append(True)
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            if cancelled is not None:
+                cancelled.append(True)
+            raise
+        if error is not None:
+            raise error
+        return result
+    return run
+
+
+def make_hedge(deadline_seconds=0.05):
+    return HedgeService(deadline_seconds=deadline_seconds, primary_name="captions", backup_name="audio")
+
+
+def test_fast_primary_never_starts_backup():
+    hedge = make_hedge()
+    backup_started = []
+
+    result = asyncio.run(hedge.run(leg("captions text"), leg("audio text", started=backup_started)))
+
+    assert result == ("captions text", "captions")
+    assert backup_started == []
+
+
+def test_slow_primary_races_backup_and_loser_is_cancelled():
+    hedge = make_hedge()
+    primary_cancelled = []
+
+    result = asyncio.run(hedge.run(
+        leg("captions text", delay=1.0, cancelled=primary_cancelled),
+        leg("audio text", delay=0.01),
+    ))
+
+    assert result == ("audio text", "audio")
+    assert primary_cancelled == [True]
+    assert hedge.stats()["hedges_started"] == 1
+
+
+def test_failing_backup_does_not_win_over_slow_primary():
+    # Transcription raises rather than returning an error message, so a
+    # failed audio leg can never be taken for a transcript
+    hedge = make_hedge()
+    transcription = TranscriptionService()
+    transcription.engines["gemini"].api_key = None
+
+    async def audio():
+        return await transcription.transcribe_audio("lecture.mp3", engine="gemini")
+
+    result = asyncio.run(hedge.run(leg("captions text", delay=0.2), audio))
+
+    assert result == ("captions text", "captions")
+    assert hedge.stats()["paths"]["audio"]["failures"] == 1
+
+
+def test_failed_primary_starts_backup_immediately():
+    hedge = make_hedge(deadline_seconds=10)
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        result = await hedge.run(leg(error=ValueError("No captions")), leg("audio text"))
+        return result, loop.time() - started
+
+    result, elapsed = asyncio.run(main())
+
+    assert result == ("audio text", "audio")
+    assert elapsed < 1.0
+
+
+def test_both_legs_failing_raises_with_each_error():
+    hedge = make_hedge()
+
+    try:
+        asyncio.run(hedge.run(
+            leg(error=ValueError("No captions")),
+            leg(error=TranscriptionUnavailableError("GOOGLE_API_KEY is not set")),
+        ))
+        assert False, "expected HedgeError"
+    except HedgeError as e:
+        assert set(e.errors) == {"captions", "audio"}
+        assert isinstance(e.errors["audio"], TranscriptionUnavailableError)
+
+
+def test_deadline_counts_from_admission():
+    hedge = make_hedge(deadline_seconds=0.1)
+    backup_started = []
+
+    async def main():
+        admitted = asyncio.Event()
+
+        async def captions():
+            # Queued behind the rate limiter for longer than the deadline
+            await asyncio.sleep(0.2)
+            admitted.set()
+            await asyncio.sleep(0.05)
+            return "captions text"
+
+        return await hedge.run(captions, leg("audio text", started=backup_started), primary_admitted=admitted)
+
+    assert asyncio.run(main()) == ("captions text", "captions")
+    assert backup_started == []
+
+
+def test_zero_deadline_only_falls_back_on_failure():
+    hedge = make_hedge(deadline_seconds=0)
+    backup_started = []
+
+    result = asyncio.run(hedge.run(leg("captions text", delay=0.1), leg("audio text", started=backup_started)))
+
+    assert result == ("captions text", "captions")
+    assert backup_started == []
+
+
+def test_leg_cancelled_from_outside_counts_as_its_failure():
+    hedge = make_hedge()
+
+    async def cancelled_primary():
+        # Like awaiting a shared caption fetch that is torn down elsewhere
+        shared = asyncio.ensure_future(asyncio.sleep(1.0))
+        asyncio.get_running_loop().call_soon(shared.cancel)
+        return await shared
+
+    result = asyncio.run(hedge.run(cancelled_primary, leg("audio text")))
+
+    assert result == ("audio text", "audio")
+    assert hedge.stats()["paths"]["captions"]["cancelled"] == 1
+
+
+def test_both_legs_cancelled_from_outside_raises_hedge_error():
+    hedge = make_hedge()
+
+    async def cancelled():
+        raise asyncio.CancelledError()
+
+    try:
+        asyncio.run(hedge.run(cancelled, cancelled))
+        assert False, "expected HedgeError"
+    except HedgeError as e:
+        assert set(e.errors) == {"captions", "audio"}
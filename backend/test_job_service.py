@@ -0,0 +1,242 @@
+"""
+Tests for the persistent job queue: leases, retries and payload cleanup.
+"""
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import conftest  # noqa: E402,F401
+from services.job_service import JobService  # noqa: E402
+
+
+def make_db() -> str:
+    return os.path.join(tempfile.mkdtemp(), "jobs.db")
+
+
+def make_service(db_path, handler, cleaned, **kwargs):
+    kwargs.setdefault("concurrency", 1)
+    kwargs.setdefault("poll_interval", 0.05)
+    service = JobService(db_path=db_path, **kwargs)
+    service.register("upload", handler, cleanup=lambda payload: cleaned.append(payload["path"]))
+    return service
+
+
+async def hang(payload, report):
+    report("transcribing", 30)
+    await asyncio.Event().wait()
+
+
+async def complete(payload, report):
+    return {"notes": payload["path"]}
+
+
+async def wait_for_status(service, job_id, status, timeout=2.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while loop.time() < deadline:
+        job = await asyncio.to_thread(service.get, job_id)
+        if job["status"] == status:
+            return job
+        await asyncio.sleep(0.02)
+    raise AssertionError(f"job stayed {job['status']}, expected {status}")
+
+
+def test_completed_job_records_result_and_cleans_up():
+    cleaned = []
+    service = make_service(make_db(), complete, cleaned)
+
+    async def main():
+        await service.start()
+        job_id = service.submit("upload", {"path": "lecture.mp3"})
+        job = await wait_for_status(service, job_id, "completed")
+        await service.stop()
+        return job
+
+    job = asyncio.run(main())
+
+    assert job["result"] == {"notes": "lecture.mp3"}
+    assert (job["progress"], job["attempts"]) == (100, 1)
+    assert cleaned == ["lecture.mp3"]
+
+
+def test_failed_job_records_error_and_cleans_up():
+    cleaned = []
+
+    async def fail(payload, report):
+        raise ValueError("No speech detected")
+
+    service = make_service(make_db(), fail, cleaned)
+
+    async def main():
+        await service.start()
+        job_id = service.submit("upload", {"path": "lecture.mp3"})
+        job = await wait_for_status(service, job_id, "failed")
+        await service.stop()
+        return job
+
+    job = asyncio.run(main())
+
+    assert job["error"] == "No speech detected"
+    assert cleaned == ["lecture.mp3"]
+
+
+def test_job_interrupted_by_shutdown_is_reclaimed_after_its_lease():
+    db_path = make_db()
+    cleaned = []
+    first = make_service(db_path, hang, cleaned, lease_seconds=0.3)
+    second = make_service(db_path, complete, cleaned, lease_seconds=0.3)
+
+    async def main():
+        await first.start()
+        job_id = first.submit("upload", {"path": "lecture.mp3"})
+        await wait_for_status(first, job_id, "running")
+        await asyncio.sleep(0.05)
+        await first.stop()
+
+        # Shutdown leaves the job running with its payload in place
+        interrupted = first.get(job_id)
+        assert interrupted["status"] == "running"
+        assert interrupted["stage"] == "transcribing"
+        assert cleaned == []
+
+        await second.start()
+        job = await wait_for_status(second, job_id, "completed")
+        await second.stop()
+        return job
+
+    job = asyncio.run(main())
+
+    assert job["attempts"] == 2
+    assert cleaned == ["lecture.mp3"]
+
+
+def test_lease_is_renewed_while_the_handler_runs():
+    db_path = make_db()
+    cleaned = []
+    running = make_service(db_path, hang, cleaned, lease_seconds=0.3)
+    other = make_service(db_path, complete, cleaned, lease_seconds=0.3)
+
+    async def main():
+        await running.start()
+        job_id = running.submit("upload", {"path": "lecture.mp3"})
+        await wait_for_status(running, job_id, "running")
+        # Another process polling the queue must not steal a live job
+        await other.start()
+        await asyncio.sleep(1.0)
+        job = other.get(job_id)
+        await other.stop()
+        await running.stop()
+        return job
+
+    job = asyncio.run(main())
+
+    assert (job["status"], job["attempts"]) == ("running", 1)
+    assert cleaned == []
+
+
+def test_job_out_of_attempts_fails_and_cleans_up():
+    db_path = make_db()
+    cleaned = []
+    first = make_service(db_path, hang, cleaned, lease_seconds=0.2, max_attempts=1)
+    second = make_service(db_path, complete, cleaned, lease_seconds=0.2, max_attempts=1)
+
+    async def main():
+        await first.start()
+        job_id = first.submit("upload", {"path": "lecture.mp3"})
+        await wait_for_status(first, job_id, "running")
+        await first.stop()
+
+        await second.start()
+        job = await wait_for_status(second, job_id, "failed")
+        await second.stop()
+        return job
+
+    job = asyncio.run(main())
+
+    assert job["error"] == "Job was interrupted too many times."
+    assert job["attempts"] == 1
+    assert cleaned == ["lecture.mp3"]
+
+
+def test_unknown_kind_is_rejected():
+    service = JobService(db_path=make_db())
+
+    try:
+        service.submit("missing", {})
+        assert False, "expected ValueError"
+    except ValueError:
+        pass
+
+
+def test_upload_job_whose_file_is_gone_fails_clearly():
+    from main import _remove_upload, _upload_job
+
+    service = JobService(db_path=make_db(), concurrency=1, poll_interval=0.05)
+    service.register("upload", _upload_job, cleanup=_remove_upload)
+
+    async def main():
+        await service.start()
+        job_id = service.submit("upload", {"path": os.path.join(tempfile.mkdtemp(), "gone.mp3")})
+        job = await wait_for_status(service, job_id, "failed")
+        await service.stop()
+        return job
+
+    job = asyncio.run(main())
+
+    assert "no longer available (gone.mp3)" in job["error"]
+
+
+def test_run_whose_job_was_reclaimed_cannot_update_it():
+    db_path = make_db()
+    cleaned = []
+    service = make_service(db_path, complete, cleaned, lease_seconds=0.05)
+    job_id = service.submit("upload", {"path": "lecture.mp3"})
+
+    _, _, _, stale = service._claim()
+    time.sleep(0.1)  # the stale worker stalls past its lease
+    _, _, _, current = service._claim()
+
+    assert (stale, current) == (1, 2)
+    # Neither renewing the lease nor finishing touches the reclaimed job
+    assert not service._update(job_id, stale, lease_expires=time.time() + 60)
+    service._finish(job_id, "upload", {"path": "lecture.mp3"}, stale, status="failed", error="stale")
+    assert service.get(job_id)["status"] == "running"
+    assert cleaned == []
+
+    service._finish(
+        job_id, "upload", {"path": "lecture.mp3"}, current, status="completed", result='{"notes": "ok"}'
+    )
+    job = service.get(job_id)
+    assert (job["status"], job["result"]) == ("completed", {"notes": "ok"})
+    assert cleaned == ["lecture.mp3"]
+
+
+def test_lease_renewal_survives_a_database_error():
+    service = make_service(make_db(), complete, [], lease_seconds=0.06)
+    job_id = service.submit("upload", {"path": "lecture.mp3"})
+    _, _, _, attempt = service._claim()
+    update = service._update
+    calls = []
+
+    def flaky_update(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        return update(*args, **kwargs)
+
+    service._update = flaky_update
+
+    async def main():
+        renewal = asyncio.create_task(service._renew_lease(job_id, attempt))
+        await asyncio.sleep(0.1)
+        assert not renewal.done()
+        renewal.cancel()
+
+    asyncio.run(main())
+
+    assert len(calls) >= 2
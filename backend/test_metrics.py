@@ -0,0 +1,120 @@
+"""
+Tests for the Prometheus metrics registry and its text exposition format.
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import conftest  # noqa: E402,F401
+from services import metrics  # noqa: E402
+from services.metrics import MetricsRegistry  # noqa: E402
+
+
+def test_counter_and_gauge_render_sorted_samples():
+    registry = MetricsRegistry()
+    lookups = registry.counter("test_lookups_total", "Lookups by result.", ["cache", "result"])
+    queued = registry.gauge("test_queued", "Queued work.")
+
+    lookups.inc(cache="notes", result="miss")
+    lookups.inc(2, cache="notes", result="hit")
+    lookups.inc(0.5, cache="exports", result="hit")
+    queued.set(4)
+    queued.dec()
+
+    assert registry.render() == (
+        "# HELP test_lookups_total Lookups by result.\n"
+        "# TYPE test_lookups_total counter\n"
+        'test_lookups_total{cache="exports",result="hit"} 0.5\n'
+        'test_lookups_total{cache="notes",result="hit"} 2\n'
+        'test_lookups_total{cache="notes",result="miss"} 1\n'
+        "# HELP test_queued Queued work.\n"
+        "# TYPE test_queued gauge\n"
+        "test_queued 3\n"
+    )
+
+
+def test_histogram_buckets_are_cumulative_with_sum_and_count():
+    registry = MetricsRegistry()
+    latency = registry.histogram("test_seconds", "Latency.", ["stage"], buckets=[1.0, 0.1])
+
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value, stage="parse")
+
+    assert registry.render().splitlines()[2:] == [
+        'test_seconds_bucket{stage="parse",le="0.1"} 2',
+        'test_seconds_bucket{stage="parse",le="1"} 3',
+        'test_seconds_bucket{stage="parse",le="+Inf"} 4',
+        'test_seconds_sum{stage="parse"} 3.65',
+        'test_seconds_count{stage="parse"} 4',
+    ]
+
+
+def test_label_values_and_help_are_escaped():
+    registry = MetricsRegistry()
+    errors = registry.counter("test_errors_total", 'Errors "by" reason\nper call.', ["reason"])
+
+    errors.inc(reason='quota "exceeded"\\retry\nlater')
+
+    assert registry.render().splitlines() == [
+        '# HELP test_errors_total Errors "by" reason\\nper call.',
+        "# TYPE test_errors_total counter",
+        'test_errors_total{reason="quota \\"exceeded\\"\\\\retry\\nlater"} 1',
+    ]
+
+
+def test_misuse_is_rejected():
+    registry = MetricsRegistry()
+    counter = registry.counter("test_total", "Total.", ["kind"])
+
+    for call in (
+        lambda: counter.inc(-1, kind="a"),
+        lambda: counter.inc(other="a"),
+        lambda: registry.gauge("test_total", "Duplicate."),
+    ):
+        try:
+            call()
+            assert False, "expected ValueError"
+        except ValueError:
+            pass
+
+
+def test_timed_stage_records_outcome_and_in_progress():
+    stage = "test_stage"
+
+    with metrics.timed_stage(stage):
+        assert metrics.STAGE_IN_PROGRESS.value(stage=stage) == 1
+    try:
+        with metrics.timed_stage(stage):
+            raise ValueError("failed")
+    except ValueError:
+        pass
+
+    async def cancelled():
+        with metrics.timed_stage(stage):
+            await asyncio.sleep(10)
+
+    async def main():
+        task = asyncio.create_task(cancelled())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(main())
+
+    counts = {outcome: metrics.STAGE_SECONDS._values[(stage, outcome)][2] for outcome in ("ok", "error", "cancelled")}
+    assert counts == {"ok": 1, "error": 1, "cancelled": 1}
+    assert metrics.STAGE_IN_PROGRESS.value(stage=stage) == 0
+
+
+def test_metrics_endpoint_serves_the_text_format():
+    from fastapi.testclient import TestClient
+    from main import app
+
+    response = TestClient(app).get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == metrics.CONTENT_TYPE
+    assert "# TYPE autonotes_stage_duration_seconds histogram" in response.text
+    assert 'autonotes_in_flight{kind="pipelines"} 0' in response.text
@@ -0,0 +1,128 @@
+"""
+Tests for NoteStore: the batched writer, listing, FTS5 query building and
+ranking, and the library search endpoint.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import conftest  # noqa: E402,F401
+from services.note_store import NoteStore  # noqa: E402
+
+
+def make_store(**kwargs):
+    kwargs.setdefault("flush_seconds", 60)
+    return NoteStore(db_path=os.path.join(tempfile.mkdtemp(), "notes.db"), **kwargs)
+
+
+def make_notes(text):
+    return {"formatted": text, "structured": {}}
+
+
+def wait_until_stored(store, count, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while store.stats()["stored"] < count:
+        assert time.monotonic() < deadline, store.stats()
+        time.sleep(0.01)
+
+
+def test_saves_are_buffered_until_a_batch_fills():
+    store = make_store(batch_size=3)
+
+    first = store.save("transcript one", make_notes("one"), source="upload")
+    store.save("transcript two", make_notes("two"), source="upload")
+    # The same result saved again keeps its ID and its place in the buffer
+    assert store.save("transcript one", make_notes("one"), source="upload") == first
+    assert store.stats() == {"stored": 0, "pending": 2}
+    assert store.get(first)["transcript"] == "transcript one"
+
+    store.save("transcript three", make_notes("three"), source="upload")
+    wait_until_stored(store, 3)
+
+    assert store.stats()["pending"] == 0
+    assert store.get(first)["notes"] == make_notes("one")
+    store.close()
+
+
+def test_close_commits_what_is_buffered():
+    store = make_store()
+    note_id = store.save("transcript", make_notes("notes"))
+
+    store.close()
+
+    reopened = NoteStore(db_path=store.db_path)
+    assert reopened.get(note_id)["transcript"] == "transcript"
+    reopened.close()
+
+
+def test_listing_and_search_include_buffered_notes():
+    store = make_store()
+    older = store.save("first lecture", make_notes("Gradient descent"))
+    time.sleep(0.01)
+    newer = store.save("second lecture", make_notes("Backpropagation"))
+
+    listed = store.list_recent()
+    found = store.search("gradient")
+
+    assert [item["note_id"] for item in listed] == [newer, older]
+    assert listed[1]["notes_preview"] == "Gradient descent"
+    assert [result["note_id"] for result in found] == [older]
+    store.close()
+
+
+def test_match_expression_quotes_every_term_and_prefixes_the_last():
+    match = NoteStore._match_expression
+
+    assert match("gradient desc") == '"gradient" "desc"*'
+    # FTS5 operators and punctuation are treated as plain words
+    assert match('gradient OR "descent" NEAR(x') == '"gradient" "OR" "descent" "NEAR" "x"*'
+    assert match("  ?! ") is None
+
+
+def test_search_matches_prefixes_and_ranks_notes_above_transcripts():
+    store = make_store()
+    in_notes = store.save("An unrelated transcript.", make_notes("Eigenvalues of a matrix"))
+    in_transcript = store.save("We compute eigenvalues today.", make_notes("Linear algebra"))
+    # bm25 needs the term to be rare across the library to give it any weight
+    for index in range(8):
+        store.save(f"Nothing relevant here {index}.", make_notes("Calculus"))
+
+    results = store.search("eigen")
+
+    assert [result["note_id"] for result in results] == [in_notes, in_transcript]
+    assert results[0]["score"] > results[1]["score"]
+    assert "<mark>Eigenvalues</mark>" in results[0]["notes_snippet"]
+    assert store.search("?!") == []
+    assert store.search('eigen" OR "x') == []
+    store.close()
+
+
+def test_search_endpoint():
+    from fastapi.testclient import TestClient
+    from main import app, note_store
+
+    client = TestClient(app)
+    note_id = note_store.save("A lecture on Fourier series.", make_notes("Fourier series"), source="upload")
+
+    response = client.get("/api/library/search", params={"q": "fourier ser", "limit": 5})
+    invalid = client.get("/api/library/search", params={"q": "fourier", "limit": 0})
+
+    body = response.json()
+    assert (body["query"], body["limit"], body["offset"]) == ("fourier ser", 5, 0)
+    assert note_id in [result["note_id"] for result in body["results"]]
+    assert invalid.status_code == 400
+
+
+def test_fallback_notes_are_not_stored():
+    from main import _store_note, note_store
+
+    notes = {"formatted": "Error generating notes with AI: quota", "structured": {}, "fallback": True}
+
+    note_id = asyncio.run(_store_note("A failed lecture.", notes, "upload", None))
+
+    assert note_id is None
+    assert note_store.get(NoteStore.note_id("A failed lecture.", notes)) is None
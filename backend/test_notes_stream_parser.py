@@ -0,0 +1,157 @@
+"""
+Tests for NotesStreamParser against the original whole-text notes parser.
+"""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.summarization_service import NotesStreamParser
+
+
+def baseline_parse_notes(notes_text):
+    """SummarizationService._parse_notes as it was before streaming."""
+    lines = notes_text.split('\n')
+
+    structured = {
+        "introduction": "",
+        "key_points": [],
+        "examples": [],
+        "conclusion": "",
+        "summary": ""
+    }
+
+    current_section = None
+    current_content = []
+
+    for line in lines:
+        line = line.strip()
+
+        if line.startswith('##'):
+            if current_section and current_content:
+                content = '\n'.join(current_content).strip()
+                if current_section == "introduction":
+                    structured["introduction"] = content
+                elif current_section == "conclusion":
+                    structured["conclusion"] = content
+
+            header_lower = line.lower()
+            if "introduction" in header_lower or "overview" in header_lower:
+                current_section = "introduction"
+            elif "key point" in header_lower or "main" in header_lower:
+                current_section = "key_points"
+            elif "example" in header_lower:
+                current_section = "examples"
+            elif "conclusion" in header_lower or "summary" in header_lower:
+                current_section = "conclusion"
+            else:
+                current_section = None
+
+            current_content = []
+
+        elif line and current_section:
+            if line.startswith('-') or line.startswith('*'):
+                point = line.lstrip('-* ').strip()
+                if current_section == "key_points":
+                    structured["key_points"].append(point)
+                elif current_section == "examples":
+                    structured["examples"].append(point)
+            else:
+                current_content.append(line)
+
+    if current_section and current_content:
+        content = '\n'.join(current_content).strip()
+        if current_section == "introduction":
+            structured["introduction"] = content
+        elif current_section == "conclusion":
+            structured["conclusion"] = content
+
+    if structured["introduction"] or structured["conclusion"]:
+        structured["summary"] = f"{structured['introduction']}\n\n{structured['conclusion']}".strip()
+
+    return structured
+
+
+NOTES = """# Lecture Notes
+
+## 1. Introduction
+This lecture covers the Fourier transform.
+It builds on last week's material on series.
+
+## 2. Key Points
+- A signal can be written as a sum of sinusoids
+* The transform is linear
+- **Convolution** becomes multiplication
+
+## 3. Examples
+- Audio equalisers
+- JPEG compression
+
+## 4. Conclusion
+The Fourier transform is everywhere in signal processing.
+"""
+
+SAMPLES = [
+    NOTES,
+    NOTES.replace("\n", "\r\n"),
+    NOTES.rstrip("\n"),
+    # Sections the parser doesn't know, text before any heading, an empty section
+    "Preamble text\n## Overview\n\n## Questions\n- What is a kernel?\n## Main ideas\n- One\n## Summary\nDone.",
+    # A repeated heading keeps the last non-empty content
+    "## Introduction\nFirst\n## Introduction\n## Introduction\nSecond\n",
+    "",
+    "## Key Points",
+]
+
+
+def feed_in_chunks(text, sizes):
+    parser = NotesStreamParser()
+    events = []
+    position = 0
+    for size in sizes:
+        events.extend(parser.feed(text[position:position + size]))
+        position += size
+    events.extend(parser.feed(text[position:]))
+    events.extend(parser.close())
+    return parser.structured, events
+
+
+def test_whole_text_matches_baseline():
+    for sample in SAMPLES:
+        parser = NotesStreamParser()
+        parser.feed(sample)
+        parser.close()
+        assert parser.structured == baseline_parse_notes(sample), sample
+
+
+def test_any_chunking_matches_baseline():
+    rng = random.Random(5)
+    for sample in SAMPLES:
+        expected = baseline_parse_notes(sample)
+        assert feed_in_chunks(sample, [1] * len(sample))[0] == expected
+        for _ in range(50):
+            sizes = [rng.randint(1, 20) for _ in range(len(sample) // 5 + 1)]
+            assert feed_in_chunks(sample, sizes)[0] == expected
+
+
+def test_sections_are_reported_as_they_complete():
+    parser = NotesStreamParser()
+
+    assert parser.feed("## Introduction\nThis lecture covers") == []
+    assert parser.feed(" the Fourier transform.\n## Key") == []
+    assert parser.feed(" Points\n") == [
+        {"event": "section", "section": "introduction", "content": "This lecture covers the Fourier transform."}
+    ]
+    assert parser.feed("- Linear\n- Invertible") == []
+    assert parser.close() == [{"event": "section", "section": "key_points", "content": ["Linear", "Invertible"]}]
+
+
+def test_each_known_section_is_reported_once_in_order():
+    _, events = feed_in_chunks(NOTES, [7] * (len(NOTES) // 7))
+
+    assert [event["section"] for event in events] == ["introduction", "key_points", "examples", "conclusion"]
+    # Leading emphasis is stripped along with the bullet, as the baseline parser did
+    assert events[1]["content"] == [
+        "A signal can be written as a sum of sinusoids", "The transform is linear", "Convolution** becomes multiplication"
+    ]
@@ -0,0 +1,189 @@
+"""
+Tests for the token bucket and AIMD concurrency window in RateLimiter.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import conftest  # noqa: E402,F401
+from services.rate_limiter import RateLimiter, RateLimitTimeout  # noqa: E402
+
+
+def make_limiter(rate=100.0, burst=100, max_concurrency=4, **kwargs):
+    db_path = os.path.join(tempfile.mkdtemp(), "rate_limits.db")
+    return RateLimiter("test", rate, burst, max_concurrency, db_path=db_path, **kwargs)
+
+
+def test_burst_is_free_then_tokens_are_spaced_at_the_rate():
+    limiter = make_limiter(rate=10.0, burst=3)
+
+    waits = [limiter._reserve_token() for _ in range(5)]
+
+    assert waits[:3] == [0.0, 0.0, 0.0]
+    # Each call past the burst queues one more token interval behind the last
+    assert abs(waits[3] - 0.1) < 0.02
+    assert abs(waits[4] - 0.2) < 0.02
+    assert limiter.stats()["queued"] == 2
+
+
+def test_wait_longer_than_max_wait_raises():
+    limiter = make_limiter(rate=1.0, burst=1, max_wait_seconds=0.5)
+
+    assert limiter._reserve_token() == 0.0
+    try:
+        limiter._reserve_token()
+        assert False, "expected RateLimitTimeout"
+    except RateLimitTimeout:
+        pass
+
+    assert limiter.stats()["timeouts"] == 1
+
+
+def test_rate_limit_error_halves_window_once_per_cooldown():
+    limiter = make_limiter(max_concurrency=8, cooldown_seconds=60)
+
+    try:
+        with limiter.limit_sync():
+            raise RuntimeError("429 Too Many Requests")
+    except RuntimeError:
+        pass
+    # Calls that were already in flight fail too, but only back off once
+    limiter._record(RuntimeError("429 Too Many Requests"))
+
+    stats = limiter.stats()
+    assert stats["concurrency_limit"] == 4
+    assert stats["throttled"] == 1
+    assert stats["cooldown_remaining"] > 50
+
+
+def test_other_errors_leave_window_alone():
+    limiter = make_limiter(max_concurrency=8)
+
+    try:
+        with limiter.limit_sync():
+            raise ValueError("video unavailable")
+    except ValueError:
+        pass
+
+    assert limiter.stats()["concurrency_limit"] == 8
+
+
+def test_successes_grow_window_back_additively():
+    limiter = make_limiter(max_concurrency=8, cooldown_seconds=0)
+    limiter._record(RuntimeError("429"))
+    assert limiter._window == 4
+
+    # About one slot per window's worth of successes
+    for _ in range(4):
+        with limiter.limit_sync():
+            pass
+    assert 4.9 < limiter._window < 5.0
+
+    for _ in range(100):
+        limiter._record(None)
+    assert limiter._window == 8
+
+
+def test_callers_queue_for_slots_and_are_woken_on_release():
+    # A long sync interval means queued callers only move when woken
+    limiter = make_limiter(max_concurrency=2, sync_interval=60)
+    in_flight = 0
+    peak = 0
+
+    async def call():
+        nonlocal in_flight, peak
+        async with limiter.limit():
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.05)
+            in_flight -= 1
+
+    async def main():
+        started = time.monotonic()
+        await asyncio.gather(*(call() for _ in range(6)))
+        return time.monotonic() - started
+
+    elapsed = asyncio.run(main())
+
+    assert peak == 2
+    assert elapsed < 1.0
+    assert limiter.stats()["calls"] == 6
+
+
+def test_cancelled_waiter_passes_its_wakeup_on():
+    limiter = make_limiter(max_concurrency=1, sync_interval=60)
+
+    async def call(results, name):
+        async with limiter.limit():
+            results.append(name)
+
+    async def main():
+        results = []
+        await limiter._acquire_slot()
+        first = asyncio.create_task(call(results, "first"))
+        second = asyncio.create_task(call(results, "second"))
+        await asyncio.sleep(0.05)
+        assert limiter.stats()["waiting"] == 2
+
+        # The slot is handed to the first waiter, which is cancelled before it can take it
+        limiter._release_slot()
+        first.cancel()
+        await asyncio.wait_for(second, 1.0)
+        return first, results
+
+    first, results = asyncio.run(main())
+
+    assert first.cancelled()
+    assert results == ["second"]
+    assert limiter.stats()["in_flight"] == 0
+
+
+def test_recording_does_not_hold_a_slot_on_a_bounded_executor():
+    # One default-executor thread, shared by the blocking caller and the async recording
+    limiter = make_limiter(max_concurrency=2, cooldown_seconds=0, sync_interval=60)
+    limiter._record(RuntimeError("429"))
+    assert limiter.stats()["concurrency_limit"] == 1
+
+    def blocking_call():
+        with limiter.limit_sync():
+            time.sleep(0.02)
+
+    async def async_call():
+        async with limiter.limit():
+            await asyncio.sleep(0.05)
+
+    async def main():
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=1))
+        calls = [asyncio.ensure_future(async_call())]
+        await asyncio.sleep(0.01)
+        calls.append(asyncio.ensure_future(asyncio.to_thread(blocking_call)))
+        done, pending = await asyncio.wait(calls, timeout=5.0)
+        for call in pending:
+            call.cancel()
+        return len(done)
+
+    assert asyncio.run(main()) == 2
+    assert limiter.stats()["in_flight"] == 0
+
+
+def test_slot_wait_longer_than_max_wait_raises():
+    limiter = make_limiter(max_concurrency=1, max_wait_seconds=0.05, sync_interval=60)
+
+    async def hold_slot():
+        await limiter._acquire_slot()
+
+    asyncio.run(hold_slot())
+    try:
+        with limiter.limit_sync():
+            pass
+        assert False, "expected RateLimitTimeout"
+    except RateLimitTimeout:
+        pass
+
+    stats = limiter.stats()
+    assert (stats["timeouts"], stats["waiting"], stats["in_flight"]) == (1, 0, 1)
@@ -0,0 +1,161 @@
+"""
+Tests for coalescing concurrent identical requests with SingleFlight.
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.single_flight import SingleFlight
+
+
+class FakePipeline:
+    """Pipeline factory that runs until released and counts its starts."""
+
+    def __init__(self, result="notes", error=None):
+        self.result = result
+        self.error = error
+        self.starts = 0
+        self.cancelled = False
+        self.release = None
+
+    async def __call__(self, report):
+        self.starts += 1
+        report("transcribing", 40)
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def test_concurrent_callers_share_one_run():
+    flights = SingleFlight()
+    pipeline = FakePipeline()
+    progress = []
+
+    async def main():
+        pipeline.release = asyncio.Event()
+        callers = [
+            asyncio.create_task(flights.run("video", pipeline, lambda *p, i=i: progress.append((i, p))))
+            for i in range(5)
+        ]
+        await asyncio.sleep(0.01)
+        assert flights.stats()["waiters"] == 5
+        pipeline.release.set()
+        return await asyncio.gather(*callers)
+
+    results = asyncio.run(main())
+
+    assert results == ["notes"] * 5
+    assert pipeline.starts == 1
+    # Callers that joined late still get the stage the pipeline is at
+    assert sorted(i for i, _ in progress) == [0, 1, 2, 3, 4]
+    stats = flights.stats()
+    assert (stats["started"], stats["coalesced"], stats["in_flight"]) == (1, 4, 0)
+
+
+def test_error_reaches_every_waiter():
+    flights = SingleFlight()
+    pipeline = FakePipeline(error=ValueError("Transcript not available"))
+
+    async def main():
+        pipeline.release = asyncio.Event()
+        callers = [asyncio.create_task(flights.run("video", pipeline)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        pipeline.release.set()
+        return await asyncio.gather(*callers, return_exceptions=True)
+
+    results = asyncio.run(main())
+
+    assert pipeline.starts == 1
+    assert all(isinstance(result, ValueError) for result in results)
+    assert all(str(result) == "Transcript not available" for result in results)
+
+
+def test_failed_run_is_not_reused():
+    flights = SingleFlight()
+    pipeline = FakePipeline(error=ValueError("upstream failed"))
+
+    async def main():
+        pipeline.release = asyncio.Event()
+        pipeline.release.set()
+        try:
+            await flights.run("video", pipeline)
+        except ValueError:
+            pass
+        pipeline.error = None
+        return await flights.run("video", pipeline)
+
+    assert asyncio.run(main()) == "notes"
+    assert pipeline.starts == 2
+
+
+def test_cancelled_waiter_leaves_the_others_running():
+    flights = SingleFlight()
+    pipeline = FakePipeline()
+
+    async def main():
+        pipeline.release = asyncio.Event()
+        leaving = asyncio.create_task(flights.run("video", pipeline))
+        staying = asyncio.create_task(flights.run("video", pipeline))
+        await asyncio.sleep(0.01)
+        leaving.cancel()
+        await asyncio.sleep(0.01)
+        pipeline.release.set()
+        return leaving, await staying
+
+    leaving, result = asyncio.run(main())
+
+    assert leaving.cancelled()
+    assert result == "notes"
+    assert not pipeline.cancelled
+
+
+def test_last_waiter_leaving_cancels_the_run():
+    flights = SingleFlight()
+    pipeline = FakePipeline()
+
+    async def main():
+        pipeline.release = asyncio.Event()
+        callers = [asyncio.create_task(flights.run("video", pipeline)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0.01)
+
+    asyncio.run(main())
+
+    assert pipeline.cancelled
+    assert flights.stats()["in_flight"] == 0
+
+
+def test_caller_arriving_while_a_cancelled_run_unwinds_starts_a_new_one():
+    flights = SingleFlight()
+    pipeline = FakePipeline()
+
+    async def slow_to_cancel(report):
+        # Like a pipeline waiting on an executor thread before it can stop
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            await asyncio.sleep(0.05)
+            raise
+
+    async def main():
+        pipeline.release = asyncio.Event()
+        pipeline.release.set()
+        leaving = asyncio.create_task(flights.run("video", slow_to_cancel))
+        await asyncio.sleep(0.01)
+        leaving.cancel()
+        await asyncio.gather(leaving, return_exceptions=True)
+        return await flights.run("video", pipeline)
+
+    assert asyncio.run(main()) == "notes"
+    assert pipeline.starts == 1
+    assert flights.stats()["in_flight"] == 0
@@ -0,0 +1,77 @@
+"""
+Tests for how SummarizationService splits long transcripts for map-reduce.
+"""
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import conftest  # noqa: E402,F401
+from services.summarization_service import SummarizationService  # noqa: E402
+
+
+def make_service(chunk_chars, overlap_chars):
+    service = SummarizationService()
+    service.chunk_chars = chunk_chars
+    service.chunk_overlap_chars = overlap_chars
+    return service
+
+
+def sentences(count):
+    return [f"Sentence number {index} talks about topic {index % 7}." for index in range(count)]
+
+
+def split_sentences(chunk):
+    return re.split(r"(?<=\.)\s+", chunk)
+
+
+def shared_sentences(previous, chunk):
+    """Number of trailing sentences of ``previous`` that ``chunk`` starts with."""
+    for count in range(min(len(previous), len(chunk)), 0, -1):
+        if previous[-count:] == chunk[:count]:
+            return count
+    return 0
+
+
+def test_chunks_respect_the_size_share_the_overlap_and_cover_everything():
+    parts = sentences(200)
+    service = make_service(chunk_chars=1000, overlap_chars=200)
+
+    chunks = [split_sentences(chunk) for chunk in service._split_transcript(" ".join(parts))]
+
+    assert len(chunks) > 1
+    assert all(len(" ".join(chunk)) <= 1000 for chunk in chunks)
+    covered = list(chunks[0])
+    for previous, chunk in zip(chunks, chunks[1:]):
+        shared = shared_sentences(previous, chunk)
+        # Whole sentences are carried over, up to the overlap budget
+        assert shared > 0
+        assert len(" ".join(chunk[:shared])) <= 200
+        covered.extend(chunk[shared:])
+    assert covered == parts
+
+
+def test_unpunctuated_captions_are_split_at_words():
+    text = " ".join(f"word{index}" for index in range(3000))
+    service = make_service(chunk_chars=1000, overlap_chars=200)
+
+    chunks = service._split_transcript(text)
+
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 1000 for chunk in chunks)
+    assert chunks[0].startswith("word0 ") and chunks[-1].endswith(" word2999")
+    # Overlap still works without sentence boundaries
+    assert chunks[1].split()[0] in chunks[0].split()
+
+
+def test_overlap_must_be_smaller_than_the_chunk():
+    for overlap in ("30000", "40000", "-1"):
+        os.environ["SUMMARY_CHUNK_OVERLAP_CHARS"] = overlap
+        try:
+            SummarizationService()
+            assert False, f"expected ValueError for overlap {overlap}"
+        except ValueError as e:
+            assert "SUMMARY_CHUNK_OVERLAP_CHARS" in str(e)
+        finally:
+            del os.environ["SUMMARY_CHUNK_OVERLAP_CHARS"]
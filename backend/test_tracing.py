@@ -0,0 +1,210 @@
+"""
+Tests for request tracing, the tracing middleware, request profiling and
+trace IDs in structured logs.
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import conftest  # noqa: E402,F401
+from services import tracing  # noqa: E402
+from services.logging_config import JsonFormatter, TraceIdFilter  # noqa: E402
+from services.tracing import RequestProfiler, TraceStore, TracingMiddleware  # noqa: E402
+
+
+def make_profiler(**kwargs):
+    kwargs.setdefault("sample_rate", 0.0)
+    kwargs.setdefault("allow_header", True)
+    return RequestProfiler(profile_dir=tempfile.mkdtemp(), **kwargs)
+
+
+def call(middleware, path="/api/notes", headers=()):
+    """Run a GET through the middleware; returns the response start message."""
+    scope = {"type": "http", "method": "GET", "path": path, "headers": list(headers)}
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(middleware(scope, receive, send))
+    return messages[0]
+
+
+def make_app(work=None):
+    async def app(scope, receive, send):
+        if work is not None:
+            await work()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    return app
+
+
+def test_spans_nest_and_follow_bound_executor_work():
+    store = TraceStore()
+
+    def blocking():
+        with tracing.span("render", pages=3):
+            return threading.current_thread().name
+
+    async def main():
+        with tracing.start_trace("job", trace_id="job-1", kind="upload"):
+            with tracing.span("pipeline"):
+                loop = asyncio.get_running_loop()
+                with ThreadPoolExecutor(1, thread_name_prefix="worker") as executor:
+                    return await loop.run_in_executor(executor, tracing.bind(blocking))
+
+    original = tracing.TRACES
+    tracing.TRACES = store
+    try:
+        thread = asyncio.run(main())
+    finally:
+        tracing.TRACES = original
+
+    trace = store.get("job-1").to_dict()
+    pipeline, render = trace["spans"]
+    assert (trace["name"], trace["kind"]) == ("job", "upload")
+    assert (pipeline["name"], pipeline["parent"]) == ("pipeline", None)
+    assert (render["name"], render["parent"], render["pages"]) == ("render", pipeline["id"], 3)
+    assert render["thread"] == thread
+    assert trace["duration_ms"] >= pipeline["duration_ms"] >= render["duration_ms"] >= 0
+
+
+def test_span_records_errors_and_is_a_no_op_outside_a_trace():
+    with tracing.span("outside"):
+        pass
+    with tracing.start_trace("job") as trace:
+        try:
+            with tracing.span("transcribe"):
+                raise ValueError("no speech")
+        except ValueError:
+            pass
+
+    assert trace.to_dict()["spans"][0]["error"] == "ValueError"
+
+
+def test_a_full_trace_counts_the_spans_it_drops():
+    with tracing.start_trace("job") as trace:
+        for _ in range(tracing.MAX_SPANS_PER_TRACE + 5):
+            with tracing.span("segment"):
+                pass
+
+    recorded = trace.to_dict()
+    assert len(recorded["spans"]) == tracing.MAX_SPANS_PER_TRACE
+    assert recorded["dropped_spans"] == 5
+
+
+def test_trace_store_keeps_the_most_recent_traces():
+    store = TraceStore(max_traces=2)
+    for index, duration in enumerate((30.0, 10.0, 20.0)):
+        trace = tracing.Trace("http", trace_id=f"t{index}")
+        trace.duration_ms = duration
+        store.add(trace)
+
+    assert store.get("t0") is None
+    assert [summary["trace_id"] for summary in store.summaries()] == ["t2", "t1"]
+    assert [summary["trace_id"] for summary in store.summaries(slowest=True)] == ["t2", "t1"]
+    assert [summary["trace_id"] for summary in store.summaries(limit=1, slowest=True)] == ["t2"]
+
+
+def test_middleware_records_a_trace_and_returns_its_id():
+    store = TraceStore()
+
+    async def work():
+        with tracing.span("summarization"):
+            await asyncio.sleep(0.001)
+
+    middleware = TracingMiddleware(make_app(work), store=store, profiler=make_profiler())
+    start = call(middleware, headers=[(b"x-request-id", b"client-42"), (b"x-debug-trace", b"1")])
+    plain = call(middleware, headers=[(b"x-request-id", b"not valid!")])
+
+    headers = dict(start["headers"])
+    trace = store.get(headers[b"x-trace-id"].decode()).to_dict()
+    assert (trace["status"], trace["path"], trace["request_id"]) == (200, "/api/notes", "client-42")
+    assert headers[b"server-timing"].decode().startswith("summarization;dur=")
+    assert b"server-timing" not in dict(plain["headers"])
+    assert "request_id" not in store.get(dict(plain["headers"])[b"x-trace-id"].decode()).to_dict()
+
+
+def test_metrics_and_debug_paths_are_not_traced():
+    store = TraceStore()
+    middleware = TracingMiddleware(make_app(), store=store, profiler=make_profiler())
+
+    for path in ("/metrics", "/api/debug/traces"):
+        assert b"x-trace-id" not in dict(call(middleware, path)["headers"])
+    assert store.summaries() == []
+
+
+def test_profiler_only_profiles_requests_it_is_asked_to():
+    profiler = make_profiler(allow_header=False)
+    assert profiler.start(requested=True) is None
+
+    profiler.configure(allow_header=True)
+    profile = profiler.start(requested=True)
+    assert profile is not None
+    # One request at a time
+    assert profiler.start(requested=True) is None
+    profiler.stop(profile)
+
+    assert profiler.start(requested=False) is None
+    stats = profiler.stats()
+    assert (stats["profiled"], stats["skipped_busy"]) == (1, 1)
+    try:
+        profiler.configure(sample_rate=1.5)
+        assert False, "expected ValueError"
+    except ValueError:
+        pass
+
+
+def test_profiler_keeps_the_slowest_profiles():
+    profiler = make_profiler(keep=2)
+
+    for trace_id, duration in (("a", 50.0), ("b", 10.0), ("c", 30.0), ("d", 5.0)):
+        profile = profiler.start(requested=True)
+        sum(range(1000))
+        profiler.stop(profile)
+        profiler.save(profile, SimpleNamespace(trace_id=trace_id, duration_ms=duration))
+
+    assert [saved["trace_id"] for saved in profiler.stats()["profiles"]] == ["a", "c"]
+    assert sorted(path.name for path in profiler.profile_dir.glob("*.prof")) == [
+        "00000030_c.prof", "00000050_a.prof"
+    ]
+    assert "function calls" in profiler.summary("a")
+    assert profiler.summary("b") is None
+    # Profiles already on disk are picked up by a new profiler
+    reopened = RequestProfiler(profile_dir=str(profiler.profile_dir), keep=2)
+    assert [saved["trace_id"] for saved in reopened.stats()["profiles"]] == ["a", "c"]
+
+
+def test_middleware_saves_a_requested_profile_on_the_trace():
+    store = TraceStore()
+    profiler = make_profiler()
+    middleware = TracingMiddleware(make_app(), store=store, profiler=profiler)
+
+    start = call(middleware, headers=[(b"x-profile", b"1")])
+
+    trace_id = dict(start["headers"])[b"x-trace-id"].decode()
+    assert store.get(trace_id).profile == profiler.find(trace_id).name
+
+
+def test_json_logs_carry_the_trace_id_and_extra_fields():
+    record = logging.LogRecord("services.test", logging.INFO, __file__, 1, "Transcribed %d segments", (12,), None)
+    record.engine = "whisper"
+
+    with tracing.start_trace("job", trace_id="job-7"):
+        TraceIdFilter().filter(record)
+    entry = json.loads(JsonFormatter().format(record))
+
+    assert entry["message"] == "Transcribed 12 segments"
+    assert (entry["trace_id"], entry["engine"], entry["level"]) == ("job-7", "whisper", "INFO")
@@ -0,0 +1,89 @@
+"""
+Tests for the column-wise TranscriptSegments: round trips, slicing, passage
+lookup and mapping note sections to times.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.transcript_segments import TranscriptSegments  # noqa: E402
+
+ITEMS = [
+    {"start": 0.0, "duration": 4.0, "text": "Welcome to the lecture on signals."},
+    {"start": 4.0, "duration": 5.0, "text": "Fourier series decompose periodic signals."},
+    {"start": 40.0, "duration": 6.0, "text": "Convolution becomes multiplication in frequency."},
+    {"start": 80.0, "duration": 4.5, "text": "Audio equalisers apply filtering."},
+    {"start": 120.0, "duration": 3.0, "text": "That concludes today's session."},
+]
+
+
+def make_segments():
+    return TranscriptSegments.from_items(ITEMS)
+
+
+def test_items_round_trip_through_columns_and_dict():
+    segments = make_segments()
+    restored = TranscriptSegments.from_dict(segments.to_dict())
+
+    assert list(segments) == ITEMS
+    assert list(restored) == ITEMS
+    assert restored.digest() == segments.digest()
+    assert segments.text == " ".join(item["text"] for item in ITEMS)
+    assert segments[-1] == ITEMS[-1]
+    assert segments.duration == 123.0
+
+
+def test_lookups_by_time_and_character_offset():
+    segments = make_segments()
+
+    assert segments.index_at(0) == 0
+    assert segments.index_at(45.5) == 2
+    assert segments.index_at(1000) == 4
+    offset = segments.text.index("Convolution")
+    assert segments.time_at_offset(offset) == 40.0
+    assert segments.time_at_offset(offset - 1) == 4.0
+
+
+def test_slice_keeps_overlapping_segments_and_their_text():
+    segments = make_segments()
+
+    middle = segments.slice(5.0, 80.0)
+    # A segment that has already ended at the start is left out
+    later = segments.slice(9.0, 200.0)
+
+    assert [item["start"] for item in middle] == [4.0, 40.0]
+    assert middle.text == " ".join(item["text"] for item in ITEMS[1:3])
+    assert middle.segment_text(1) == ITEMS[2]["text"]
+    assert [item["start"] for item in later] == [40.0, 80.0, 120.0]
+    assert len(segments.slice(50.0, 60.0)) == 0
+    assert segments.slice(50.0, 60.0).text == ""
+
+
+def test_find_time_picks_the_window_sharing_most_words():
+    segments = make_segments()
+
+    assert segments.find_time("Convolution is multiplication of spectra", window_seconds=10) == 40.0
+    assert segments.find_time("Equalisers are filters", window_seconds=10) == 80.0
+    assert segments.find_time("Quantum chromodynamics") is None
+    assert segments.find_time("the and of") is None
+
+
+def test_map_sections_times_each_note_section():
+    segments = make_segments()
+    structured = {
+        "introduction": "An introduction to Fourier series and periodic signals.",
+        "key_points": ["Convolution becomes multiplication", "Unrelated quantum point"],
+        "examples": ["Audio equalisers"],
+        "conclusion": "",
+    }
+
+    mapped = segments.map_sections(structured)
+
+    assert mapped["introduction"] == 0.0
+    assert "conclusion" not in mapped
+    assert mapped["key_points"] == [
+        {"text": "Convolution becomes multiplication", "start": 40.0},
+        {"text": "Unrelated quantum point", "start": None},
+    ]
+    assert mapped["examples"] == [{"text": "Audio equalisers", "start": 80.0}]
@@ -0,0 +1,67 @@
+"""
+Tests for engine selection and the per-engine transcript cache in TranscriptionService.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import conftest  # noqa: E402,F401
+from services.cache_service import CacheService  # noqa: E402
+from services.transcription_service import (  # noqa: E402
+    TranscriptionService,
+    TranscriptionUnavailableError,
+)
+
+
+class FakeEngine:
+    def __init__(self, name, available=True):
+        self.name = name
+        self.available = available
+
+
+def make_service(gemini_available=True):
+    service = TranscriptionService()
+    service.engines = {"gemini": FakeEngine("gemini", gemini_available), "whisper": FakeEngine("whisper")}
+    service.transcript_cache = CacheService(
+        "audio_transcripts", db_path=os.path.join(tempfile.mkdtemp(), "cache.db")
+    )
+    service.calls = []
+
+    async def transcribe_with(engine, file_path, segmented):
+        service.calls.append(engine.name)
+        return f"transcript by {engine.name}"
+
+    service._transcribe_with = transcribe_with
+    return service
+
+
+def transcribe(service, engine):
+    return asyncio.run(
+        service.transcribe_audio("lecture.ogg", segmented=False, engine=engine, content_hash="abc", normalize=False)
+    )
+
+
+def test_cached_transcript_is_only_reused_for_the_same_engine():
+    service = make_service()
+
+    assert transcribe(service, "whisper") == "transcript by whisper"
+    assert transcribe(service, "whisper") == "transcript by whisper"
+    assert transcribe(service, "gemini") == "transcript by gemini"
+    assert transcribe(service, "gemini") == "transcript by gemini"
+
+    assert service.calls == ["whisper", "gemini"]
+
+
+def test_unconfigured_engine_is_reported_even_when_a_transcript_is_cached():
+    service = make_service(gemini_available=False)
+    service.transcript_cache.set("gemini:abc", "transcript by gemini")
+
+    try:
+        transcribe(service, "gemini")
+        assert False, "expected TranscriptionUnavailableError"
+    except TranscriptionUnavailableError:
+        pass
+    assert service.calls == []
@@ -0,0 +1,73 @@
+"""
+Tests for stitching segmented transcripts back together.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.transcription_service import TranscriptionService
+
+
+def words(prefix, count):
+    return [f"{prefix}{index}" for index in range(count)]
+
+
+def make_service(overlap_seconds=5.0):
+    service = TranscriptionService()
+    service.segment_overlap_seconds = overlap_seconds
+    return service
+
+
+def test_drops_text_repeated_in_the_overlap():
+    overlap = words("shared", 8)
+    first = " ".join(words("a", 20) + overlap)
+    second = " ".join(overlap + words("b", 20))
+
+    stitched = make_service()._stitch_segments([first, second])
+
+    assert stitched.split() == words("a", 20) + overlap + words("b", 20)
+
+
+def test_overlap_tolerates_words_transcribed_differently_at_the_cut():
+    overlap = words("shared", 8)
+    first = " ".join(words("a", 20) + overlap + ["uh"])
+    second = " ".join(["So,"] + overlap + words("b", 20))
+
+    stitched = make_service()._stitch_segments([first, second])
+
+    # The stray words either side of the cut go along with the duplicate
+    assert stitched.split() == words("a", 20) + overlap + words("b", 20)
+
+
+def test_phrase_repeated_outside_the_overlap_is_kept():
+    # The lecturer repeats "the key idea here is" in the middle of both
+    # segments, but the segments themselves don't overlap
+    phrase = "the key idea here is".split()
+    first = words("a", 10) + phrase + words("c", 16)
+    second = words("b", 8) + phrase + words("d", 11)
+
+    stitched = make_service()._stitch_segments([" ".join(first), " ".join(second)])
+
+    assert len(first) == 31 and len(second) == 24
+    assert stitched.split() == first + second
+
+
+def test_repeated_phrase_does_not_hide_the_real_overlap():
+    phrase = "the key idea here is".split()
+    overlap = words("shared", 4)
+    first = words("a", 6) + phrase + words("c", 6) + overlap
+    second = overlap + words("b", 6) + phrase + words("d", 3)
+
+    stitched = make_service()._stitch_segments([" ".join(first), " ".join(second)])
+
+    assert stitched.split() == first + second[len(overlap):]
+
+
+def test_matching_ignores_case_and_punctuation():
+    first = "we now turn to the Fourier transform."
+    second = "The Fourier transform, as we will see"
+
+    stitched = make_service()._stitch_segments([first, second])
+
+    assert stitched == "we now turn to The Fourier transform, as we will see"